@@ -1,7 +1,8 @@
 from django.contrib import admin
-from .models import DataTable, DataRow, DataCell, TableExport
+from .models import DataTable, DataRow, DataCell, DictionaryValue, TableExport
 
 admin.site.register(DataTable)
 admin.site.register(DataRow)
 admin.site.register(DataCell)
+admin.site.register(DictionaryValue)
 admin.site.register(TableExport)
\ No newline at end of file
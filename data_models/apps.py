@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class DataModelsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "data_models"
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,146 @@
+import os
+import shutil
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from data_models.models import DataCell, DataRow, DataTable
+from data_models.services.coercion import coerce_batch
+from data_models.services.search_service import SearchService
+from data_models.services.sqlite_pragmas import SQLITE_DEFAULT_PRAGMAS, apply_sqlite_pragmas, \
+    get_sqlite_pragmas, read_sqlite_pragmas
+from data_models.services.storage.base import to_python_list
+from data_models.services.storage.eav import VALUE_FIELDS, EAVStorageLoader
+from excel_files.models import ColumnDefinition, ExcelFile, ExcelSheet
+
+# Tipos de las columnas de la tabla de prueba, repetidos hasta --columns
+BENCHMARK_TYPES = ('integer', 'string', 'float', 'date', 'boolean', 'datetime')
+
+
+class BulkCreateEAVLoader(EAVStorageLoader):
+    """Escritura con bulk_create, una instancia de modelo por fila y por celda (referencia)"""
+
+    def _write_rows(self, row_indexes, values, fallbacks, hashes):
+        values = {index: to_python_list(series) for index, series in values.items()}
+        fallbacks = {index: to_python_list(series) for index, series in fallbacks.items()}
+
+        data_rows = DataRow.objects.bulk_create([
+            DataRow(table=self.data_table, row_index=row_index, row_hash=row_hash)
+            for row_index, row_hash in zip(row_indexes, hashes)
+        ])
+
+        data_cells = []
+        for i, row in enumerate(data_rows):
+            for col in self.columns:
+                cell = DataCell(row=row, column_definition=col)
+                value = values[col.column_index][i]
+                fallback = fallbacks[col.column_index][i]
+                if fallback is not None:
+                    cell.string_value = fallback
+                elif value is not None:
+                    setattr(cell, VALUE_FIELDS.get(col.data_type, 'string_value'), value)
+                data_cells.append(cell)
+        DataCell.objects.bulk_create(data_cells)
+
+
+class Command(BaseCommand):
+    help = ("Compara la carga EAV con executemany frente a bulk_create, con los PRAGMAs "
+            "por defecto de SQLite y con los de SQLITE_PRAGMAS")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=20000, help="Filas de la tabla de prueba")
+        parser.add_argument('--columns', type=int, default=6, help="Columnas de la tabla de prueba")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Filas por lote (y por transacción)")
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            self.stderr.write("La comparación de PRAGMAs solo se aplica a SQLite")
+            return
+
+        # La prueba cambia journal_mode, que queda grabado en el archivo: se usa
+        # una base de datos desechable para no tocar la de la aplicación
+        live_name = connection.settings_dict['NAME']
+        test_name = connection.settings_dict['TEST'].get('NAME')
+        scratch_dir = tempfile.mkdtemp(prefix='benchmark_eav_loader_')
+        connection.settings_dict['TEST']['NAME'] = os.path.join(scratch_dir, 'benchmark.sqlite3')
+        try:
+            connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+            try:
+                self._run(options)
+            finally:
+                apply_sqlite_pragmas(connection.connection, get_sqlite_pragmas())
+                connection.creation.destroy_test_db(live_name, verbosity=0)
+        finally:
+            connection.settings_dict['TEST']['NAME'] = test_name
+            shutil.rmtree(scratch_dir, ignore_errors=True)
+
+    def _run(self, options):
+        rows, batch_size = options['rows'], options['batch_size']
+        excel_file = ExcelFile.objects.create(name='benchmark_eav_loader', file='')
+        sheet = ExcelSheet.objects.create(excel_file=excel_file, name='benchmark', row_count=rows)
+        columns = [
+            ColumnDefinition.objects.create(
+                sheet=sheet, name=f"col_{i}", original_name=f"col_{i}", column_index=i,
+                data_type=BENCHMARK_TYPES[i % len(BENCHMARK_TYPES)]
+            )
+            for i in range(options['columns'])
+        ]
+        data_table = DataTable.objects.create(
+            sheet=sheet, table_name=f"benchmark_eav_loader_{excel_file.id}", storage_backend='eav'
+        )
+        batches = self._build_batches(columns, rows, batch_size)
+        cells = rows * len(columns)
+        self.stdout.write(f"{rows} filas x {len(columns)} columnas ({cells} celdas), lotes de {batch_size}")
+
+        results = {}
+        for pragmas_name, pragmas in (('por defecto', SQLITE_DEFAULT_PRAGMAS),
+                                      ('SQLITE_PRAGMAS', get_sqlite_pragmas())):
+            apply_sqlite_pragmas(connection.connection, pragmas)
+            current = read_sqlite_pragmas(connection.connection, pragmas)
+            self.stdout.write(f"PRAGMAs {pragmas_name}: {current}")
+
+            for loader_name, loader_class in (('bulk_create', BulkCreateEAVLoader),
+                                              ('executemany', EAVStorageLoader)):
+                data_table.get_storage().delete(data_table)
+                SearchService.delete_from(data_table)
+                seconds = self._load(loader_class(data_table, columns), batches, batch_size)
+                results[(pragmas_name, loader_name)] = seconds
+                self.stdout.write(
+                    f"  {loader_name:12} {seconds:8.2f} s  {rows / seconds:10.0f} filas/s  "
+                    f"{cells / seconds:10.0f} celdas/s"
+                )
+
+        baseline = results[('por defecto', 'bulk_create')]
+        best = results[('SQLITE_PRAGMAS', 'executemany')]
+        self.stdout.write(self.style.SUCCESS(f"executemany con SQLITE_PRAGMAS: {baseline / best:.1f}x más rápido "
+                                             f"que bulk_create con los PRAGMAs por defecto"))
+
+    @staticmethod
+    def _build_batches(columns, rows, batch_size):
+        """Lotes ya convertidos con coerce_batch, para medir solo la escritura"""
+        rng = np.random.default_rng(0)
+        generators = {
+            'integer': lambda n: rng.integers(0, 1000000, n),
+            'string': lambda n: pd.Series(rng.integers(0, 5000, n)).map(lambda v: f"valor {v}"),
+            'float': lambda n: rng.random(n) * 1000,
+            'date': lambda n: pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 3650, n), unit='D'),
+            'boolean': lambda n: rng.random(n) > 0.5,
+            'datetime': lambda n: pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 10 ** 8, n), unit='s'),
+        }
+        batches = []
+        for start in range(0, rows, batch_size):
+            size = min(batch_size, rows - start)
+            batch_df = pd.DataFrame({col.original_name: generators[col.data_type](size) for col in columns})
+            batches.append(coerce_batch(batch_df, columns))
+        return batches
+
+    @staticmethod
+    def _load(loader, batches, batch_size):
+        started = time.perf_counter()
+        for i, (values, fallbacks) in enumerate(batches):
+            with transaction.atomic():
+                loader.write_batch(i * batch_size, values, fallbacks)
+        loader.close()
+        return time.perf_counter() - started
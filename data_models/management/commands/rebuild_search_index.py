@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from data_models.models import DataTable
+from data_models.services.search_service import SearchService
+from excel_files.models import ColumnDefinition
+
+
+class Command(BaseCommand):
+    help = ("Construye el índice de búsqueda de texto de las tablas que aún no lo tienen "
+            "(cargadas antes de existir) o de las tablas indicadas")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--table', type=int, action='append', dest='tables',
+                            help="ID de una tabla a reconstruir (se puede repetir)")
+        parser.add_argument('--all', action='store_true', help="Reconstruir todas las tablas")
+
+    def handle(self, *args, **options):
+        if not SearchService.is_available():
+            self.stderr.write("La búsqueda de texto solo está disponible con SQLite")
+            return
+
+        tables = DataTable.objects.filter(status='ready', sheet__excel_file__deleted=False).order_by('id')
+        if options['tables']:
+            tables = tables.filter(id__in=options['tables'])
+        elif not options['all']:
+            tables = tables.filter(search_indexed=False)
+
+        for data_table in tables:
+            columns = list(ColumnDefinition.objects.filter(sheet=data_table.sheet).order_by('column_index'))
+            SearchService.rebuild(data_table, columns)
+            self.stdout.write(f"{data_table.table_name}: {data_table.row_count} filas indexadas")
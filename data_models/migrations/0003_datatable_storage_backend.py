@@ -0,0 +1,26 @@
+# Generated by Django 5.2 on 2026-10-18 11:11
+
+import data_models.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("data_models", "0002_tableexport"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="datatable",
+            name="storage_backend",
+            field=models.CharField(
+                choices=[
+                    ("eav", "Filas y celdas (EAV)"),
+                    ("parquet", "Parquet columnar"),
+                ],
+                default=data_models.models.get_default_storage_backend,
+                max_length=20,
+            ),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2 on 2026-10-18 11:13
+
+import data_models.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("data_models", "0003_datatable_storage_backend"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="datatable",
+            name="storage_backend",
+            field=models.CharField(
+                choices=[
+                    ("eav", "Filas y celdas (EAV)"),
+                    ("parquet", "Parquet columnar"),
+                    ("sql", "Tabla SQL tipada"),
+                ],
+                default=data_models.models.get_default_storage_backend,
+                max_length=20,
+            ),
+        ),
+    ]
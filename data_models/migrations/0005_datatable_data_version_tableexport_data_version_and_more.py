@@ -0,0 +1,35 @@
+# Generated by Django 5.2 on 2026-10-18 11:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("data_models", "0004_alter_datatable_storage_backend"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="datatable",
+            name="data_version",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="tableexport",
+            name="data_version",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="tableexport",
+            name="options_key",
+            field=models.CharField(blank=True, default="", max_length=64),
+        ),
+        migrations.AddIndex(
+            model_name="tableexport",
+            index=models.Index(
+                fields=["table", "format", "data_version", "options_key"],
+                name="data_models_table_i_619dbe_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2 on 2026-10-18 11:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        (
+            "data_models",
+            "0005_datatable_data_version_tableexport_data_version_and_more",
+        ),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="datarow",
+            name="row_hash",
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="datatable",
+            name="schema_hash",
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2 on 2026-10-18 12:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("data_models", "0006_datarow_row_hash_datatable_schema_hash"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="datatable",
+            name="loaded_rows",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="datatable",
+            name="status",
+            field=models.CharField(
+                choices=[("loading", "Cargando"), ("ready", "Lista")],
+                db_index=True,
+                default="ready",
+                max_length=10,
+            ),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2 on 2026-10-18 12:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("data_models", "0007_datatable_loaded_rows_datatable_status"),
+        ("excel_files", "0011_alter_processingjob_job_type"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="datatable",
+            name="value_indexes",
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AlterField(
+            model_name="datacell",
+            name="row",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="cells",
+                to="data_models.datarow",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="datacell",
+            index=models.Index(
+                fields=["row", "column_definition"], name="datacell_row_column_idx"
+            ),
+        ),
+    ]
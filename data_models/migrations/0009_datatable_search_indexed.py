@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 12:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("data_models", "0008_datatable_value_indexes_alter_datacell_row_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="datatable",
+            name="search_indexed",
+            field=models.BooleanField(default=False),
+        ),
+    ]
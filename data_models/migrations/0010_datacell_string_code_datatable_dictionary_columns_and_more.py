@@ -0,0 +1,52 @@
+# Generated by Django 5.2 on 2026-10-18 12:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("data_models", "0009_datatable_search_indexed"),
+        ("excel_files", "0011_alter_processingjob_job_type"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="datacell",
+            name="string_code",
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="datatable",
+            name="dictionary_columns",
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.CreateModel(
+            name="DictionaryValue",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("code", models.IntegerField()),
+                ("value", models.TextField()),
+                (
+                    "column_definition",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="dictionary_values",
+                        to="excel_files.columndefinition",
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("column_definition", "code")},
+            },
+        ),
+    ]
@@ -1,24 +1,66 @@
+from django.conf import settings
 from django.db import models
 from excel_files.models import ExcelSheet
 
 
+def get_default_storage_backend():
+    """Backend de almacenamiento para las tablas nuevas, configurable en settings"""
+    return getattr(settings, 'DATA_TABLE_STORAGE_BACKEND', 'eav')
+
+
 class DataTable(models.Model):
     """Modelo para almacenar tablas de datos generadas a partir de Excel"""
+    STORAGE_BACKENDS = (
+        ('eav', 'Filas y celdas (EAV)'),
+        ('parquet', 'Parquet columnar'),
+        ('sql', 'Tabla SQL tipada'),
+    )
+
+    STATUS_CHOICES = (
+        ('loading', 'Cargando'),
+        ('ready', 'Lista'),
+    )
+
     sheet = models.OneToOneField(ExcelSheet, on_delete=models.CASCADE, related_name='data_table')
     table_name = models.CharField(max_length=255, unique=True)
     created_at = models.DateTimeField(auto_now_add=True)
     row_count = models.IntegerField(default=0)
+    storage_backend = models.CharField(max_length=20, choices=STORAGE_BACKENDS, default=get_default_storage_backend)
+    # Se incrementa en cada carga de datos; las exportaciones guardan la versión que contienen
+    data_version = models.PositiveIntegerField(default=0)
+    # Hash de las columnas (posición y tipo) con que se cargaron los datos
+    schema_hash = models.CharField(max_length=64, blank=True, null=True)
+    # Una tabla en carga no se muestra; la carga se confirma por lotes y
+    # loaded_rows guarda hasta qué row_index está confirmada, para reanudarla
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='ready', db_index=True)
+    loaded_rows = models.IntegerField(default=0)
+    # column_index de las columnas con índice de valores, pedidos por la API de
+    # consulta; se crean en segundo plano y se reconstruyen tras cada carga completa
+    value_indexes = models.JSONField(default=list, blank=True)
+    # El índice de búsqueda de texto refleja los datos guardados; las tablas
+    # cargadas antes de tenerlo lo reconstruyen en su siguiente carga
+    search_indexed = models.BooleanField(default=False)
+    # column_index de las columnas de texto guardadas como códigos de su
+    # diccionario (DictionaryValue); se decide al empezar cada carga completa
+    dictionary_columns = models.JSONField(default=list, blank=True)
 
     objects = models.Manager()
 
     def __str__(self):
         return self.table_name
 
+    def get_storage(self):
+        """Devuelve el backend que almacena los datos de esta tabla"""
+        from data_models.services.storage import get_storage_backend
+        return get_storage_backend(self.storage_backend)
+
 
 class DataRow(models.Model):
     """Modelo para almacenar filas de datos genéricas"""
     table = models.ForeignKey(DataTable, on_delete=models.CASCADE, related_name='rows')
     row_index = models.IntegerField()
+    # Hash de los valores de la fila, para las recargas incrementales
+    row_hash = models.BigIntegerField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
     objects = models.Manager()
@@ -30,20 +72,42 @@ class DataRow(models.Model):
         return f"{self.table.table_name} - Row {self.row_index}"
 
 
+class DataCellQuerySet(models.QuerySet):
+    def with_string_text(self):
+        """
+        Añade string_text: el texto de cada celda, decodificado con el
+        diccionario de su columna en la misma consulta si tiene código
+        """
+        return self.annotate(string_text=models.Case(
+            models.When(string_code__isnull=True, then=models.F('string_value')),
+            default=models.Subquery(DictionaryValue.objects.filter(
+                column_definition=models.OuterRef('column_definition'), code=models.OuterRef('string_code')
+            ).values('value')[:1])
+        ))
+
+
 class DataCell(models.Model):
     """Modelo para almacenar celdas de datos de manera genérica"""
-    row = models.ForeignKey(DataRow, on_delete=models.CASCADE, related_name='cells')
+    # El índice (row, column_definition) de Meta sirve también las búsquedas por row
+    row = models.ForeignKey(DataRow, on_delete=models.CASCADE, related_name='cells', db_index=False)
     column_definition = models.ForeignKey('excel_files.ColumnDefinition', on_delete=models.CASCADE)
 
     # Campos para almacenar diferentes tipos de datos
     string_value = models.TextField(blank=True, null=True)
+    # En las columnas con diccionario el texto se guarda como código de DictionaryValue
+    string_code = models.IntegerField(blank=True, null=True)
     integer_value = models.IntegerField(blank=True, null=True)
     float_value = models.FloatField(blank=True, null=True)
     date_value = models.DateField(blank=True, null=True)
     datetime_value = models.DateTimeField(blank=True, null=True)
     boolean_value = models.BooleanField(blank=True, null=True)
 
-    objects = models.Manager()
+    objects = DataCellQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['row', 'column_definition'], name='datacell_row_column_idx')
+        ]
 
     def __str__(self):
         return f"{self.row} - {self.column_definition.name}"
@@ -52,7 +116,14 @@ class DataCell(models.Model):
         """Devuelve el valor según el tipo de datos de la columna"""
         data_type = self.column_definition.data_type
         if data_type == 'string':
-            return self.string_value
+            if self.string_code is None:
+                return self.string_value
+            # Con with_string_text() el texto viene decodificado en la misma consulta
+            if hasattr(self, 'string_text'):
+                return self.string_text
+            return DictionaryValue.objects.filter(
+                column_definition_id=self.column_definition_id, code=self.string_code
+            ).values_list('value', flat=True).first()
         elif data_type == 'integer':
             return self.integer_value
         elif data_type == 'float':
@@ -66,6 +137,27 @@ class DataCell(models.Model):
         return None
 
 
+class DictionaryValue(models.Model):
+    """
+    Valor distinto de una columna de texto con diccionario: sus celdas guardan
+    el código (DataCell.string_code) en lugar del texto repetido
+    """
+    column_definition = models.ForeignKey('excel_files.ColumnDefinition', on_delete=models.CASCADE,
+                                          related_name='dictionary_values')
+    # Códigos desde 0 por columna, en orden de aparición. Las recargas eliminan
+    # los que ya no usa ninguna celda, así que puede haber huecos
+    code = models.IntegerField()
+    value = models.TextField()
+
+    objects = models.Manager()
+
+    class Meta:
+        unique_together = ('column_definition', 'code')
+
+    def __str__(self):
+        return f"{self.column_definition.name} {self.code}: {self.value}"
+
+
 class TableExport(models.Model):
     """Modelo para almacenar información sobre exportaciones de tablas"""
     FORMAT_CHOICES = (
@@ -80,9 +172,18 @@ class TableExport(models.Model):
     format = models.CharField(max_length=10, choices=FORMAT_CHOICES)
     created_at = models.DateTimeField(auto_now_add=True)
     file_size = models.BigIntegerField(default=0)  # Tamaño en bytes
+    # Versión de los datos exportados y huella de las opciones de exportación,
+    # para reutilizar el archivo mientras la tabla no cambie
+    data_version = models.PositiveIntegerField(default=0)
+    options_key = models.CharField(max_length=64, blank=True, default='')
 
     objects = models.Manager()
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['table', 'format', 'data_version', 'options_key'])
+        ]
+
     def __str__(self):
         return f"{self.table.table_name} - {self.format} ({self.created_at.strftime('%Y-%m-%d %H:%M')})"
 
@@ -0,0 +1,180 @@
+import numpy as np
+import pandas as pd
+from django.utils import timezone
+from pandas.api import types as ptypes
+from pandas.tseries.api import guess_datetime_format
+
+# Textos que se interpretan como verdadero en columnas booleanas
+TRUE_VALUES = ('true', 'yes', 'si', 'sí', '1', 'verdadero')
+
+INT64_MIN = np.iinfo(np.int64).min
+INT64_MAX = np.iinfo(np.int64).max
+
+# Zona o desplazamiento UTC al final de un texto con hora ('10:00Z', '10:00:00+02:00')
+OFFSET_PATTERN = r'(?i)\d{1,2}:\d{2}(?::\d{2})?(?:\.\d+)?\s*(?:z|utc|gmt|[+-]\d{2}(?::?\d{2})?)$'
+
+
+def coerce_batch(batch_df, columns, format_cache=None):
+    """
+    Convierte un lote de filas al tipo de cada columna, columna a columna y sin
+    recorrer las celdas en Python
+
+    Args:
+        batch_df: DataFrame con el lote leído de la hoja
+        columns: Definiciones de columnas (original_name, column_index, data_type)
+        format_cache: Diccionario {column_index: formato de fecha} que se reutiliza
+            entre lotes para no adivinar el formato en cada uno
+
+    Returns:
+        tuple: (values, fallbacks), dos diccionarios {column_index: Series}. values
+        tiene los valores tipados (nulos donde no hay valor) y fallbacks el texto
+        original de las celdas que no se pudieron convertir (None en el resto)
+    """
+    if format_cache is None:
+        format_cache = {}
+
+    values = {}
+    fallbacks = {}
+    for col in columns:
+        if col.original_name in batch_df.columns:
+            series = batch_df[col.original_name].reset_index(drop=True)
+        else:
+            series = pd.Series([None] * len(batch_df), dtype=object)
+
+        present = series.notna()
+        typed, failed = _coerce_series(series, col, format_cache)
+
+        values[col.column_index] = typed
+        fallbacks[col.column_index] = _fallback_text(series, failed & present)
+    return values, fallbacks
+
+
+def _fallback_text(series, mask):
+    """Texto original de las celdas marcadas en la máscara; None en el resto"""
+    fallback = pd.Series([None] * len(series), dtype=object)
+    if mask.any():
+        fallback[mask] = series[mask].astype(str)
+    return fallback
+
+
+def _coerce_series(series, col, format_cache):
+    """
+    Devuelve la serie convertida y la máscara de celdas que no se pudieron convertir
+    """
+    data_type = col.data_type
+    present = series.notna()
+
+    if data_type == 'integer':
+        numbers = pd.to_numeric(series, errors='coerce')
+        out_of_range = (numbers < INT64_MIN) | (numbers > INT64_MAX)
+        failed = present & (numbers.isna() | out_of_range)
+        numbers = numbers.where(~failed)
+        if ptypes.is_float_dtype(numbers):
+            numbers = np.trunc(numbers)
+        return numbers.astype('Int64'), failed
+
+    if data_type == 'float':
+        numbers = pd.to_numeric(series, errors='coerce').astype('float64')
+        return numbers, present & numbers.isna()
+
+    if data_type in ('date', 'datetime'):
+        parsed, naive = _parse_datetimes(series, col.column_index, format_cache)
+        if data_type == 'datetime':
+            parsed = _make_aware(parsed, naive)
+            return parsed, present & parsed.isna()
+
+        dates = pd.Series([None] * len(series), dtype=object)
+        valid = parsed.notna()
+        if valid.any():
+            dates[valid] = _local_wall_times(parsed, naive)[valid].dt.date
+        return dates, present & ~valid
+
+    if data_type == 'boolean':
+        return _to_boolean(series).where(present), pd.Series(False, index=series.index)
+
+    if data_type == 'string':
+        text = series.astype(str).where(present, None)
+        return text, pd.Series(False, index=series.index)
+
+    # Tipo desconocido: se deja como nulo
+    return pd.Series([None] * len(series), dtype=object), pd.Series(False, index=series.index)
+
+
+def _parse_datetimes(series, column_index, format_cache):
+    """
+    Convierte la serie a datetime64 en UTC. Para texto se adivina el formato una
+    vez por columna y se reutiliza; los valores que no encajan se reintentan con
+    el análisis flexible de pandas.
+
+    Se analiza siempre con utc=True: sin él, una columna con desplazamientos UTC
+    distintos (horario de verano, orígenes diferentes) queda como objetos y no
+    admite las operaciones .dt. Los valores sin zona conservan su hora escrita.
+
+    Returns:
+        tuple: (parsed, naive), la serie en UTC y la máscara de los valores que no
+        indicaban zona horaria y deben interpretarse en la zona actual
+    """
+    if ptypes.is_datetime64_any_dtype(series):
+        if series.dt.tz is None:
+            return series.dt.tz_localize('UTC'), pd.Series(True, index=series.index)
+        return series.dt.tz_convert('UTC'), pd.Series(False, index=series.index)
+
+    if column_index not in format_cache:
+        sample = next((v for v in series if isinstance(v, str)), None)
+        format_cache[column_index] = guess_datetime_format(sample) if sample else None
+
+    date_format = format_cache[column_index]
+    parsed = pd.to_datetime(series, errors='coerce', format=date_format or 'mixed', utc=True)
+
+    retry = series.notna() & parsed.isna()
+    if date_format and retry.any():
+        parsed[retry] = pd.to_datetime(series[retry], errors='coerce', format='mixed', utc=True)
+    return parsed, ~_has_offset(series)
+
+
+def _has_offset(series):
+    """Máscara de los valores que indican su propia zona horaria o desplazamiento UTC"""
+    is_text = series.map(type).eq(str)
+    offset = series.where(is_text, '').astype(str).str.strip().str.contains(OFFSET_PATTERN)
+    others = ~is_text & series.notna()
+    if others.any():
+        offset[others] = [getattr(v, 'tzinfo', None) is not None for v in series[others]]
+    return offset
+
+
+def _make_aware(parsed, naive):
+    """Asigna la zona horaria actual a las fechas sin zona y convierte el resto a ella"""
+    tz = timezone.get_current_timezone()
+    if naive.all():
+        return parsed.dt.tz_localize(None).dt.tz_localize(tz, ambiguous='NaT', nonexistent='NaT')
+
+    aware = parsed.dt.tz_convert(tz)
+    if naive.any():
+        local = parsed[naive].dt.tz_localize(None).dt.tz_localize(tz, ambiguous='NaT', nonexistent='NaT')
+        aware = aware.mask(naive, local)
+    return aware
+
+
+def _local_wall_times(parsed, naive):
+    """Hora sin zona: la escrita en los valores sin zona y la de la zona actual en el resto"""
+    wall = parsed.dt.tz_localize(None)
+    if not naive.all():
+        converted = parsed.dt.tz_convert(timezone.get_current_timezone()).dt.tz_localize(None)
+        wall = wall.mask(~naive, converted)
+    return wall
+
+
+def _to_boolean(series):
+    """
+    Interpreta la serie como booleana: números positivos, booleanos verdaderos y
+    textos de TRUE_VALUES son verdaderos; cualquier otro valor es falso.
+    """
+    if ptypes.is_bool_dtype(series):
+        return series.astype('boolean')
+    if ptypes.is_numeric_dtype(series):
+        return (series > 0).astype('boolean')
+
+    is_text = series.map(type).eq(str)
+    from_text = series.where(is_text).str.lower().isin(TRUE_VALUES)
+    from_numbers = pd.to_numeric(series.where(~is_text), errors='coerce').gt(0)
+    return (from_text | from_numbers).astype('boolean')
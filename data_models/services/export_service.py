@@ -1,153 +1,376 @@
+import hashlib
+import io
+import json
 import logging
 import os
-import pandas as pd
+import re
+from contextlib import contextmanager
+from datetime import datetime
 import pyarrow as pa
+import pyarrow.csv as pa_csv
 import pyarrow.parquet as pq
 from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
 from django.utils import timezone
-from django.core.files.base import ContentFile
+from openpyxl import Workbook
+from django.core.files.storage import default_storage
 from data_models.models import DataTable, TableExport
+from data_models.services.storage.base import ARROW_TYPES, DICTIONARY_TYPE
 from excel_files.models import ColumnDefinition
 
+try:
+    import fcntl
+except ImportError:  # Windows: sin bloqueo entre procesos
+    fcntl = None
+
 logger = logging.getLogger(__name__)
 
+# Directorio de las exportaciones dentro de MEDIA_ROOT (upload_to de TableExport.file)
+EXPORT_DIR = 'exports'
+
+# Filas por hoja de Excel, incluida la cabecera
+EXCEL_MAX_ROWS = 1048576
+
 
 class ExportService:
     """Servicio para exportar datos a diferentes formatos"""
 
+    @staticmethod
+    def get_export_path(data_table, extension):
+        """
+        Genera una ruta libre para un archivo de exportación
+
+        Returns:
+            tuple: (nombre relativo a MEDIA_ROOT para TableExport.file, ruta absoluta)
+        """
+        timestamp = timezone.now().strftime('%Y%m%d_%H%M%S')
+        safe_name = data_table.table_name.replace(" ", "_").lower()
+        name = default_storage.get_available_name(f"{EXPORT_DIR}/{extension}/{safe_name}_{timestamp}.{extension}")
+        path = default_storage.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return name, path
+
+    @staticmethod
+    def iter_record_batches(data_table, columns, batch_size=None):
+        """
+        Recorre la tabla en lotes de Arrow con los tipos nativos de cada columna,
+        nombrados como las columnas de la exportación
+
+        Args:
+            data_table: Tabla de datos
+            columns: Definiciones de columnas en orden
+            batch_size: Filas por lote. Por defecto EXPORT_BATCH_SIZE
+
+        Yields:
+            RecordBatch: Lote con el esquema de get_export_schema
+        """
+        batch_size = batch_size or getattr(settings, 'EXPORT_BATCH_SIZE', 10000)
+        storage = data_table.get_storage()
+        schema = ExportService.get_export_schema(columns, storage.arrow_dictionary_columns(data_table))
+
+        for batch in storage.iter_arrow_batches(data_table, columns, batch_size):
+            yield pa.RecordBatch.from_arrays(batch.columns, schema=schema)
+
+    @staticmethod
+    def get_export_schema(columns, dictionary_columns=()):
+        """
+        Esquema Arrow de una exportación: nombre normalizado y tipo de cada
+        columna. Las columnas de dictionary_columns (column_index) son arrays de
+        diccionario, que Parquet guarda sin repetir cada texto.
+        """
+        return pa.schema([
+            pa.field(col.name, DICTIONARY_TYPE if col.column_index in dictionary_columns
+                     else ARROW_TYPES.get(col.data_type, pa.string()))
+            for col in columns
+        ])
+
+    @staticmethod
+    def get_columns(data_table):
+        """Definiciones de columnas de la tabla en orden"""
+        return list(ColumnDefinition.objects.filter(sheet=data_table.sheet).order_by('column_index'))
+
+    @staticmethod
+    def iter_csv(data_table_id):
+        """
+        Genera la tabla en formato CSV por bloques, para enviarla con un
+        StreamingHttpResponse sin construirla en memoria ni en disco
+
+        Yields:
+            bytes: Cabecera y luego un bloque de líneas por lote
+        """
+        data_table = DataTable.objects.get(id=data_table_id)
+        columns = ExportService.get_columns(data_table)
+
+        header = pa_csv.WriteOptions(include_header=True)
+        rows_only = pa_csv.WriteOptions(include_header=False)
+
+        # La cabecera se envía aunque la tabla no tenga filas
+        buffer = io.BytesIO()
+        pa_csv.write_csv(ExportService.get_export_schema(columns).empty_table(), buffer, header)
+        yield buffer.getvalue()
+
+        for batch in ExportService.iter_record_batches(data_table, columns):
+            buffer = io.BytesIO()
+            pa_csv.write_csv(batch, buffer, rows_only)
+            yield buffer.getvalue()
+
+    @staticmethod
+    def iter_ndjson(data_table_id):
+        """
+        Genera la tabla en formato JSON Lines (un objeto por fila) por bloques
+
+        Yields:
+            bytes: Un bloque de líneas por lote
+        """
+        data_table = DataTable.objects.get(id=data_table_id)
+        columns = ExportService.get_columns(data_table)
+        encoder = DjangoJSONEncoder(ensure_ascii=False)
+
+        for batch in ExportService.iter_record_batches(data_table, columns):
+            lines = [encoder.encode(row) for row in batch.to_pylist()]
+            yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+    @staticmethod
+    def get_options_key(columns, options=None):
+        """Huella de las columnas exportadas y de las opciones de la exportación"""
+        payload = {'columns': [[col.name, col.data_type] for col in columns], 'options': options or {}}
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def find_export(data_table, export_format, options_key):
+        """
+        Busca una exportación de la versión actual de la tabla con las mismas
+        opciones cuyo archivo siga existiendo
+        """
+        exports = TableExport.objects.filter(
+            table=data_table,
+            format=export_format,
+            data_version=data_table.data_version,
+            options_key=options_key
+        ).order_by('-created_at')
+        for export in exports:
+            if export.file and default_storage.exists(export.file.name):
+                return export
+        return None
+
+    @staticmethod
+    @contextmanager
+    def build_lock(data_table, export_format, options_key):
+        """
+        Bloqueo entre procesos para una exportación concreta, de modo que las
+        peticiones simultáneas esperan a una sola generación del archivo
+        """
+        lock_dir = default_storage.path(f"{EXPORT_DIR}/.locks")
+        os.makedirs(lock_dir, exist_ok=True)
+        lock_path = os.path.join(lock_dir, f"{data_table.id}-{export_format}-{options_key[:16]}.lock")
+
+        with open(lock_path, 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def get_or_build_export(data_table, export_format, options_key, build):
+        """
+        Devuelve la exportación existente de la versión actual de la tabla o la
+        genera con build, una sola vez aunque lleguen varias peticiones a la vez
+
+        Args:
+            data_table: Tabla de datos
+            export_format: Formato de TableExport.FORMAT_CHOICES
+            options_key: Huella de get_options_key
+            build: Función sin argumentos que genera y devuelve el TableExport
+
+        Returns:
+            TableExport: Exportación reutilizada o recién creada
+        """
+        export = ExportService.find_export(data_table, export_format, options_key)
+        if export is None:
+            with ExportService.build_lock(data_table, export_format, options_key):
+                # Otra petición pudo generar el archivo mientras se esperaba el bloqueo
+                data_table.refresh_from_db(fields=['data_version'])
+                export = ExportService.find_export(data_table, export_format, options_key)
+                if export is None:
+                    return build()
+
+        logger.info(f"Reutilizando exportación {export.id} de la tabla {data_table.table_name} "
+                    f"(versión {data_table.data_version})")
+        return export
+
+    @staticmethod
+    def export_to_excel(data_table_id):
+        """
+        Exporta una tabla de datos a un archivo .xlsx y lo guarda en el modelo
+        TableExport. Se usa el modo write_only de openpyxl, que escribe las filas
+        a medida que llegan; las filas que no caben en una hoja pasan a la siguiente.
+        Si la tabla no cambió desde la última exportación se reutiliza el archivo.
+
+        Args:
+            data_table_id: ID de la tabla de datos a exportar
+
+        Returns:
+            TableExport: Objeto de exportación
+        """
+        try:
+            data_table = DataTable.objects.get(id=data_table_id)
+            columns = ExportService.get_columns(data_table)
+            options_key = ExportService.get_options_key(columns)
+
+            return ExportService.get_or_build_export(
+                data_table, 'excel', options_key,
+                lambda: ExportService._write_excel(data_table, columns, options_key)
+            )
+
+        except Exception as e:
+            logger.error(f"Error al exportar tabla {data_table_id} a Excel: {str(e)}")
+            logger.exception(e)
+            raise
+
+    @staticmethod
+    def _write_excel(data_table, columns, options_key):
+        header = [col.name for col in columns]
+        file_name, file_path = ExportService.get_export_path(data_table, 'xlsx')
+
+        logger.info(f"Iniciando exportación a Excel para tabla {data_table.table_name}")
+
+        workbook = Workbook(write_only=True)
+        worksheet = workbook.create_sheet(title=re.sub(r'[\\/*?:\[\]]', '_', data_table.table_name)[:31] or 'Datos')
+        worksheet.append(header)
+        sheet_rows = 1
+
+        for batch in ExportService.iter_record_batches(data_table, columns):
+            values = [ExportService._excel_values(batch.column(i).to_pylist()) for i in range(batch.num_columns)]
+            for row in zip(*values):
+                if sheet_rows >= EXCEL_MAX_ROWS:
+                    worksheet = workbook.create_sheet()
+                    worksheet.append(header)
+                    sheet_rows = 1
+                worksheet.append(row)
+                sheet_rows += 1
+
+        tmp_path = f"{file_path}.tmp"
+        try:
+            workbook.save(tmp_path)
+            os.replace(tmp_path, file_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        export = TableExport(
+            table=data_table,
+            format='excel',
+            file_size=os.path.getsize(file_path),
+            data_version=data_table.data_version,
+            options_key=options_key
+        )
+        export.file.name = file_name
+        export.save()
+
+        logger.info(f"Archivo Excel generado exitosamente: {file_path}")
+        return export
+
+    @staticmethod
+    def _excel_values(values):
+        """Excel no admite fechas con zona horaria: se pasan a la hora local sin zona"""
+        return [
+            timezone.make_naive(value) if isinstance(value, datetime) and timezone.is_aware(value) else value
+            for value in values
+        ]
+
     @staticmethod
     def export_to_parquet(data_table_id, file_path=None):
         """
         Exporta una tabla de datos a un archivo Parquet y lo guarda en el modelo TableExport
 
+        Los lotes se escriben grupo de filas a grupo de filas directamente en la
+        ruta final, de modo que la memoria depende del tamaño del grupo de filas
+        y el archivo se escribe una sola vez. Si la tabla no cambió desde la
+        última exportación con las mismas opciones se reutiliza el archivo.
+
         Args:
             data_table_id: ID de la tabla de datos a exportar
-            file_path: Ruta donde guardar el archivo. Si es None, se genera una automáticamente
+            file_path: Ruta dentro de MEDIA_ROOT donde guardar el archivo. Si es
+                None, se genera una automáticamente o se reutiliza una exportación
+                existente
 
         Returns:
-            TableExport: Objeto de exportación creado
+            TableExport: Objeto de exportación
         """
         try:
             data_table = DataTable.objects.get(id=data_table_id)
-            sheet = data_table.sheet
 
-            # Crear directorio de exportación si no existe
-            export_dir = os.path.join(settings.MEDIA_ROOT, 'EXPORTS', 'PARQUET')
-            os.makedirs(export_dir, exist_ok=True)
+            # Obtener definiciones de columnas
+            columns = ExportService.get_columns(data_table)
+            row_group_size = getattr(settings, 'EXPORT_PARQUET_ROW_GROUP_SIZE', 50000)
+            options_key = ExportService.get_options_key(columns, {'row_group_size': row_group_size})
 
-            # Generar nombre de archivo si no se proporciona
-            if not file_path:
-                timestamp = timezone.now().strftime('%Y%m%d_%H%M%S')
-                safe_name = data_table.table_name.replace(" ", "_").lower()
-                file_name = f"{safe_name}_{timestamp}.parquet"
-                file_path = os.path.join(export_dir, file_name)
+            # Una ruta explícita siempre genera un archivo nuevo
+            if file_path:
+                return ExportService._write_parquet(data_table, columns, row_group_size, options_key, file_path)
 
-            # Obtener definiciones de columnas
-            columns = list(ColumnDefinition.objects.filter(sheet=sheet).order_by('column_index'))
-            column_names = [col.name for col in columns]
-            column_types = {col.name: col.data_type for col in columns}
-
-            # Crear DataFrame vacío con las columnas definidas
-            df = pd.DataFrame(columns=column_names)
-
-            # Procesar datos por lotes para evitar problemas de memoria
-            batch_size = 1000
-            total_batches = (data_table.row_count + batch_size - 1) // batch_size
-
-            logger.info(f"Iniciando exportación a Parquet para tabla {data_table.table_name}")
-            logger.info(f"Total de filas: {data_table.row_count}")
-            logger.info(f"Procesando en {total_batches} lotes de {batch_size} filas")
-
-            # Procesar filas por lotes
-            from django.db import connection
-
-            # Optimizar la consulta SQL directamente para mejor rendimiento
-            query = """
-                SELECT r.row_index, cd.name, 
-                    CASE cd.data_type
-                        WHEN 'string' THEN c.string_value
-                        WHEN 'integer' THEN CAST(c.integer_value AS TEXT)
-                        WHEN 'float' THEN CAST(c.float_value AS TEXT)
-                        WHEN 'date' THEN CAST(c.date_value AS TEXT)
-                        WHEN 'datetime' THEN CAST(c.datetime_value AS TEXT)
-                        WHEN 'boolean' THEN CAST(c.boolean_value AS TEXT)
-                    END as value
-                FROM data_models_datarow r
-                JOIN data_models_datacell c ON c.row_id = r.id
-                JOIN excel_files_columndefinition cd ON cd.id = c.column_definition_id
-                WHERE r.table_id = %s
-                ORDER BY r.row_index, cd.column_index
-            """
-
-            with connection.cursor() as cursor:
-                cursor.execute(query, [data_table_id])
-
-                # Crear un diccionario para almacenar los datos por filas
-                all_rows = {}
-
-                # Procesar resultados
-                for row_index, col_name, value in cursor.fetchall():
-                    if row_index not in all_rows:
-                        all_rows[row_index] = {}
-
-                    # Convertir valor según el tipo de datos
-                    if value is not None:
-                        data_type = column_types.get(col_name)
-                        if data_type == 'integer':
-                            try:
-                                value = int(value)
-                            except (ValueError, TypeError):
-                                pass
-                        elif data_type == 'float':
-                            try:
-                                value = float(value)
-                            except (ValueError, TypeError):
-                                pass
-                        elif data_type == 'boolean':
-                            value = value.lower() in ('true', 'yes', 'si', '1', 'verdadero')
-
-                    all_rows[row_index][col_name] = value
-
-            # Convertir a DataFrame
-            df = pd.DataFrame.from_dict(all_rows, orient='index')
-            df = df.reset_index(drop=True)
-
-            # Convertir tipos de datos apropiados
-            for col_name, data_type in column_types.items():
-                if col_name in df.columns:
-                    if data_type == 'integer':
-                        df[col_name] = pd.to_numeric(df[col_name], errors='coerce').astype('Int64')
-                    elif data_type == 'float':
-                        df[col_name] = pd.to_numeric(df[col_name], errors='coerce')
-                    elif data_type == 'date':
-                        df[col_name] = pd.to_datetime(df[col_name], errors='coerce').dt.date
-                    elif data_type == 'datetime':
-                        df[col_name] = pd.to_datetime(df[col_name], errors='coerce')
-                    elif data_type == 'boolean':
-                        df[col_name] = df[col_name].astype('boolean')
-
-            # Guardar como Parquet
-            table = pa.Table.from_pandas(df)
-            pq.write_table(table, file_path)
-
-            # Obtener tamaño del archivo
-            file_size = os.path.getsize(file_path)
-
-            # Crear registro en TableExport
-            with open(file_path, 'rb') as f:
-                export = TableExport(
-                    table=data_table,
-                    format='parquet',
-                    file_size=file_size
-                )
-                export.file.save(os.path.basename(file_path), ContentFile(f.read()))
-
-            logger.info(f"Archivo Parquet generado exitosamente: {file_path}")
-            logger.info(f"Exportación registrada con ID: {export.id}")
-
-            return export
+            return ExportService.get_or_build_export(
+                data_table, 'parquet', options_key,
+                lambda: ExportService._write_parquet(data_table, columns, row_group_size, options_key)
+            )
 
         except Exception as e:
             logger.error(f"Error al exportar tabla {data_table_id} a Parquet: {str(e)}")
             logger.exception(e)
             raise
+
+    @staticmethod
+    def _write_parquet(data_table, columns, row_group_size, options_key, file_path=None):
+        # Generar nombre de archivo si no se proporciona
+        if file_path:
+            file_name = os.path.relpath(file_path, settings.MEDIA_ROOT)
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        else:
+            file_name, file_path = ExportService.get_export_path(data_table, 'parquet')
+
+        schema = ExportService.get_export_schema(
+            columns, data_table.get_storage().arrow_dictionary_columns(data_table)
+        )
+
+        logger.info(f"Iniciando exportación a Parquet para tabla {data_table.table_name}")
+        logger.info(f"Total de filas: {data_table.row_count}")
+
+        # Escribir en un archivo temporal junto al destino y renombrarlo al terminar
+        tmp_path = f"{file_path}.tmp"
+        try:
+            with pq.ParquetWriter(tmp_path, schema) as writer:
+                pending = []
+                pending_rows = 0
+                for batch in ExportService.iter_record_batches(data_table, columns):
+                    pending.append(batch)
+                    pending_rows += batch.num_rows
+                    if pending_rows >= row_group_size:
+                        writer.write_table(pa.Table.from_batches(pending, schema), row_group_size=row_group_size)
+                        pending = []
+                        pending_rows = 0
+
+                if pending:
+                    writer.write_table(pa.Table.from_batches(pending, schema), row_group_size=row_group_size)
+            os.replace(tmp_path, file_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        # Crear registro en TableExport apuntando al archivo ya escrito
+        export = TableExport(
+            table=data_table,
+            format='parquet',
+            file_size=os.path.getsize(file_path),
+            data_version=data_table.data_version,
+            options_key=options_key
+        )
+        export.file.name = file_name
+        export.save()
+
+        logger.info(f"Archivo Parquet generado exitosamente: {file_path}")
+        logger.info(f"Exportación registrada con ID: {export.id}")
+
+        return export
@@ -0,0 +1,100 @@
+import logging
+import os
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+import pyarrow.parquet as pq
+from django.conf import settings
+from data_models.services.coercion import coerce_batch
+from data_models.services.profiling import ColumnProfiler
+
+logger = logging.getLogger(__name__)
+
+# Datos de una definición de columna que necesita un proceso de trabajo
+ColumnSpec = namedtuple('ColumnSpec', ['original_name', 'column_index', 'data_type'])
+
+
+def get_pool_size(workers=None):
+    """Número de procesos de trabajo: el indicado, INGEST_WORKERS o los núcleos disponibles"""
+    workers = workers or getattr(settings, 'INGEST_WORKERS', None) or os.cpu_count() or 1
+    return max(int(workers), 1)
+
+
+def coerce_part(path, columns):
+    """
+    Lee una parte Parquet de la caché de hojas, la convierte a los tipos de
+    las columnas y calcula su perfil. Se ejecuta en un proceso de trabajo: no
+    usa la base de datos.
+
+    Returns:
+        tuple: (filas, values, fallbacks, perfil) con values y fallbacks en el
+        formato de coerce_batch y el perfil parcial como ColumnProfiler
+    """
+    batch_df = pq.read_table(path).to_pandas()
+    values, fallbacks = coerce_batch(batch_df, columns)
+    profiler = ColumnProfiler(columns)
+    profiler.update(values, fallbacks)
+    return len(batch_df), values, fallbacks, profiler
+
+
+def _init_worker():
+    # Con el método spawn el proceso hijo arranca sin Django configurado
+    import django
+    django.setup()
+
+
+class IngestPool:
+    """
+    Pool de procesos para las etapas de CPU de la ingesta (parseo de libros,
+    conversión de partes de hojas). Los resultados vuelven en orden a un único
+    escritor en el proceso principal.
+    """
+
+    def __init__(self, workers=None):
+        self.workers = get_pool_size(workers)
+        self.executor = None
+
+    def __enter__(self):
+        if self.workers > 1:
+            self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.executor is not None:
+            # Si el escritor falló o se canceló, no seguir convirtiendo partes
+            self.executor.shutdown(wait=True, cancel_futures=exc_type is not None)
+            self.executor = None
+
+    def imap(self, function, tasks):
+        """
+        Ejecuta function para cada tarea y devuelve los resultados en el orden
+        de las tareas. Como mucho hay dos tareas por proceso en curso, de modo
+        que la memoria no depende del número de tareas.
+
+        Args:
+            function: Función de nivel de módulo (se envía a otros procesos)
+            tasks: Iterable de (clave, argumentos)
+
+        Yields:
+            tuple: (clave, resultado)
+        """
+        if self.executor is None:
+            for key, args in tasks:
+                yield key, function(*args)
+            return
+
+        pending = deque()
+        tasks = iter(tasks)
+        max_pending = self.workers * 2
+        while True:
+            while len(pending) < max_pending:
+                task = next(tasks, None)
+                if task is None:
+                    break
+                key, args = task
+                pending.append((key, self.executor.submit(function, *args)))
+
+            if not pending:
+                return
+
+            key, future = pending.popleft()
+            yield key, future.result()
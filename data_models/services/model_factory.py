@@ -1,8 +1,18 @@
+import hashlib
 import logging
-import pandas as pd
-from data_models.models import DataTable, DataRow, DataCell
+from itertools import groupby
+from operator import itemgetter
+from data_models.models import DataTable
+from data_models.services.coercion import coerce_batch
+from data_models.services.ingest_pool import ColumnSpec, IngestPool, coerce_part
+from data_models.services.pagination import TableCursor
+from data_models.services.profiling import ColumnProfiler
+from data_models.services.search_service import SearchService
 from excel_files.models import ExcelSheet, ColumnDefinition
+from excel_files.services.sheet_cache import SheetCache
+from django.conf import settings
 from django.db import transaction
+from django.db.models import F
 import traceback
 
 logger = logging.getLogger(__name__)
@@ -12,185 +22,528 @@ class DataModelFactory:
     """Factory para crear y poblar modelos de datos dinámicos"""
 
     @staticmethod
-    @transaction.atomic
-    def create_data_table_from_sheet(sheet_id, batch_size=1000):
+    def create_data_table_from_sheet(sheet_id, batch_size=1000, progress_callback=None, storage_backend=None):
         """
         Crea una tabla de datos a partir de una hoja de Excel
 
+        Cada lote se confirma en su propia transacción junto con el checkpoint
+        de la tabla (loaded_rows), de modo que la carga no retiene el bloqueo
+        de escritura de SQLite y, si se interrumpe, se reanuda con
+        resume_data_table. Mientras carga, la tabla está en estado 'loading'
+        y no se muestra.
+
         Args:
             sheet_id: ID de la hoja de Excel
             batch_size: Tamaño del lote para procesar filas
+            progress_callback: Función opcional (etapa, filas procesadas, filas totales)
+            storage_backend: Backend de almacenamiento ('eav', 'parquet'). Por defecto
+                se conserva el de la tabla existente o el configurado en settings
 
         Returns:
             DataTable: Instancia de la tabla de datos creada
         """
         try:
             sheet = ExcelSheet.objects.select_related('excel_file').get(id=sheet_id)
+            data_table, columns = DataModelFactory._prepare_data_table(sheet, storage_backend)
+        except Exception as e:
+            logger.error(f"Error al crear tabla de datos para hoja {sheet_id}: {str(e)}")
+            logger.error(traceback.format_exc())
+            raise
 
-            # Verificar que la hoja tenga definiciones de columnas
-            if not ColumnDefinition.objects.filter(sheet=sheet).exists():
-                raise ValueError(f"La hoja {sheet.name} no tiene definiciones de columnas")
+        return DataModelFactory._load_sheet(data_table, sheet, columns, batch_size, progress_callback)
 
-            # Crear o actualizar la tabla de datos
-            table_name = f"{sheet.excel_file.id}_{sheet.name}"
-            data_table, created = DataTable.objects.update_or_create(
-                sheet=sheet,
-                defaults={'table_name': table_name}
+    @staticmethod
+    def resume_data_table(sheet_id, batch_size=1000, progress_callback=None):
+        """
+        Reanuda la carga interrumpida de la tabla de una hoja (por un error, una
+        cancelación o un reinicio del worker) desde su checkpoint. Las filas ya
+        confirmadas no se vuelven a escribir; solo se leen para el perfil de
+        las columnas.
+
+        Si la tabla no está en carga o cambiaron sus columnas, hace una carga
+        completa con create_data_table_from_sheet.
+
+        Returns:
+            DataTable: Tabla de datos cargada
+        """
+        sheet = ExcelSheet.objects.select_related('excel_file').get(id=sheet_id)
+        data_table = DataTable.objects.filter(sheet=sheet).first()
+        columns = list(ColumnDefinition.objects.filter(sheet=sheet).order_by('column_index'))
+
+        if (data_table is None or data_table.status != 'loading' or not columns
+                or data_table.schema_hash != DataModelFactory._schema_hash(columns)):
+            return DataModelFactory.create_data_table_from_sheet(
+                sheet_id, batch_size, progress_callback=progress_callback
             )
 
-            # Obtener DataFrame
-            df = pd.read_excel(sheet.excel_file.file.path, sheet_name=sheet.name)
+        logger.info(f"Reanudando la carga de {data_table.table_name} desde la fila {data_table.loaded_rows}")
+        return DataModelFactory._load_sheet(data_table, sheet, columns, batch_size, progress_callback,
+                                            start_row=data_table.loaded_rows)
 
-            # Obtener columnas definidas
-            columns = list(ColumnDefinition.objects.filter(sheet=sheet).order_by('column_index'))
+    @staticmethod
+    def _load_sheet(data_table, sheet, columns, batch_size, progress_callback=None, start_row=0):
+        """
+        Carga las filas de una hoja en lotes confirmados uno a uno, a partir de
+        start_row (0 para una carga completa)
+        """
+        try:
+            # El loader reemplaza los datos existentes, o conserva los confirmados al reanudar
+            loader = data_table.get_storage().open_loader(data_table, columns, start_row=start_row)
+            start_row = loader.checkpoint
+            DataModelFactory._start_load(data_table, columns, start_row)
+            profiler = ColumnProfiler(columns)
+
+            # Procesar las filas en lotes leídos en streaming desde la caché de hojas
+            start_idx = 0
+            format_cache = {}
+            for batch_df in SheetCache.iter_sheet_chunks(sheet.excel_file, sheet.name, batch_size):
+                if len(batch_df) == 0:
+                    continue
+
+                # Filas ya confirmadas antes de la interrupción: solo se perfilan
+                skip = min(max(start_row - start_idx, 0), len(batch_df))
+                if skip:
+                    values, fallbacks = coerce_batch(batch_df.iloc[:skip], columns, format_cache)
+                    profiler.update(values, fallbacks)
+                if skip < len(batch_df):
+                    with transaction.atomic():
+                        DataModelFactory._process_batch(data_table, batch_df.iloc[skip:], columns, start_idx + skip,
+                                                        loader, format_cache, profiler)
+                        DataModelFactory._save_checkpoint(data_table, loader.checkpoint)
+                start_idx += len(batch_df)
+
+                if progress_callback:
+                    progress_callback('load', start_idx, sheet.row_count)
+
+            loader.close()
+            DataModelFactory._finish_data_table(data_table, sheet, start_idx, columns,
+                                                profiles=profiler.profiles())
 
-            # Procesar por lotes para evitar problemas de memoria
-            total_rows = len(df)
-            data_table.row_count = total_rows
-            data_table.save()
+            return data_table
+        except Exception as e:
+            # Los lotes confirmados se conservan para reanudar la carga
+            logger.error(f"Error al crear tabla de datos para hoja {sheet.id}: {str(e)}")
+            logger.error(traceback.format_exc())
+            raise
 
-            # Eliminar filas existentes si no es una creación nueva
-            if not created:
-                DataRow.objects.filter(table=data_table).delete()
+    @staticmethod
+    def refresh_data_table(sheet_id, batch_size=None, progress_callback=None, storage_backend=None):
+        """
+        Vuelve a cargar la tabla de datos de una hoja escribiendo solo las filas
+        que cambiaron: el hash de cada fila nueva se compara con el guardado en
+        la misma posición y cada lote se aplica en su propia transacción.
 
-            # Procesar las filas en lotes
-            for start_idx in range(0, total_rows, batch_size):
-                end_idx = min(start_idx + batch_size, total_rows)
-                batch_df = df.iloc[start_idx:end_idx]
+        Si la hoja aún no tiene tabla, si cambiaron sus columnas o su backend, o
+        si el backend no admite recargas incrementales, hace una carga completa
+        con create_data_table_from_sheet. Una carga interrumpida se reanuda con
+        resume_data_table; una recarga que falla después de aplicar algún lote
+        deja la tabla en carga desde la fila 0, oculta hasta que se repita.
 
-                with transaction.atomic():
-                    DataModelFactory._process_batch(data_table, batch_df, columns, start_idx)
+        Args:
+            sheet_id: ID de la hoja de Excel
+            batch_size: Filas por lote. Por defecto SHEET_READER_CHUNK_SIZE
+            progress_callback: Función opcional (etapa, filas procesadas, filas totales)
+            storage_backend: Backend de almacenamiento pedido para la tabla
+
+        Returns:
+            DataTable: Tabla de datos actualizada
+        """
+        sheet = ExcelSheet.objects.select_related('excel_file').get(id=sheet_id)
+        data_table = DataTable.objects.filter(sheet=sheet).first()
+        columns = list(ColumnDefinition.objects.filter(sheet=sheet).order_by('column_index'))
+
+        if (data_table is not None and data_table.status == 'loading'
+                and storage_backend in (None, data_table.storage_backend)):
+            # Carga anterior interrumpida: se continúa desde su checkpoint
+            return DataModelFactory.resume_data_table(sheet_id, progress_callback=progress_callback)
+
+        loader = None
+        if (data_table is not None and columns
+                and data_table.schema_hash == DataModelFactory._schema_hash(columns)
+                and storage_backend in (None, data_table.storage_backend)):
+            loader = data_table.get_storage().open_incremental_loader(data_table, columns)
+        if loader is None:
+            return DataModelFactory.create_data_table_from_sheet(
+                sheet_id, progress_callback=progress_callback, storage_backend=storage_backend
+            )
 
-            # Marcar la hoja como procesada
-            sheet.processed = True
-            sheet.save()
+        try:
+            batch_size = batch_size or getattr(settings, 'SHEET_READER_CHUNK_SIZE', 10000)
+            profiler = ColumnProfiler(columns)
+            start_idx = 0
+            format_cache = {}
+            for batch_df in SheetCache.iter_sheet_chunks(sheet.excel_file, sheet.name, batch_size):
+                if len(batch_df) == 0:
+                    continue
+
+                DataModelFactory._process_batch(data_table, batch_df, columns, start_idx, loader, format_cache,
+                                                profiler)
+                start_idx += len(batch_df)
+
+                if progress_callback:
+                    progress_callback('load', start_idx, sheet.row_count)
+
+            loader.close()
+        except Exception as e:
+            loader.abort()
+            logger.error(f"Error al recargar la tabla de datos de la hoja {sheet_id}: {str(e)}")
+            logger.error(traceback.format_exc())
+            raise
 
-            # Marcar el archivo como procesado si todas sus hojas están procesadas
-            if not ExcelSheet.objects.filter(excel_file=sheet.excel_file, processed=False).exists():
-                sheet.excel_file.processed = True
-                sheet.excel_file.save()
+        # Sin cambios se conserva la versión de los datos (y las exportaciones en caché)
+        DataModelFactory._finish_data_table(data_table, sheet, start_idx, columns, changed=loader.changed,
+                                            profiles=profiler.profiles())
+        return data_table
 
-            return data_table
+    @staticmethod
+    def create_data_tables_from_file(excel_file_id, sheet_ids=None, workers=None, progress_callback=None,
+                                     storage_backend=None):
+        """
+        Crea las tablas de datos de varias hojas de un libro en paralelo
+
+        Las partes de las hojas se leen de la caché y se convierten a sus tipos en
+        un pool de procesos (INGEST_WORKERS). Los lotes convertidos vuelven al
+        proceso principal, que es el único que escribe en la base de datos, de
+        modo que SQLite nunca recibe escrituras concurrentes.
+
+        Args:
+            excel_file_id: ID del archivo Excel
+            sheet_ids: Hojas a cargar. Por defecto todas las que tienen columnas detectadas
+            workers: Número de procesos de trabajo. Por defecto INGEST_WORKERS
+            progress_callback: Función opcional (etapa, filas procesadas, filas totales)
+            storage_backend: Backend de almacenamiento para todas las tablas
+
+        Returns:
+            list: Tablas de datos creadas
+        """
+        sheets = ExcelSheet.objects.select_related('excel_file', 'data_table').filter(
+            excel_file_id=excel_file_id, columns__isnull=False
+        ).distinct().order_by('id')
+        if sheet_ids is not None:
+            sheets = sheets.filter(id__in=sheet_ids)
+        sheets = list(sheets)
+
+        rows_total = sum(sheet.row_count for sheet in sheets)
+        columns_by_sheet = {
+            sheet.id: list(ColumnDefinition.objects.filter(sheet=sheet).order_by('column_index')) for sheet in sheets
+        }
+
+        def tasks():
+            for sheet in sheets:
+                specs = [
+                    ColumnSpec(col.original_name, col.column_index, col.data_type)
+                    for col in columns_by_sheet[sheet.id]
+                ]
+                for path in SheetCache.get_sheet_parts(sheet.excel_file, sheet.name):
+                    yield sheet.id, (path, specs)
+
+        rows_done = 0
+
+        def report(row_count):
+            nonlocal rows_done
+            rows_done += row_count
+            if progress_callback:
+                progress_callback('load', rows_done, rows_total)
+
+        sheets_by_id = {sheet.id: sheet for sheet in sheets}
+        data_tables = {}
+        try:
+            # Las cargas interrumpidas con el mismo backend continúan desde su checkpoint
+            for sheet in list(sheets):
+                data_table = getattr(sheet, 'data_table', None)
+                if (data_table is not None and data_table.status == 'loading' and data_table.loaded_rows
+                        and storage_backend in (None, data_table.storage_backend)):
+                    data_tables[sheet.id] = DataModelFactory.resume_data_table(sheet.id)
+                    report(sheet.row_count)
+                    sheets.remove(sheet)
+
+            with IngestPool(workers) as pool:
+                # Los resultados llegan en el orden de las tareas: agrupados por hoja
+                for sheet_id, results in groupby(pool.imap(coerce_part, tasks()), key=itemgetter(0)):
+                    data_tables[sheet_id] = DataModelFactory._load_coerced_batches(
+                        sheets_by_id[sheet_id], columns_by_sheet[sheet_id], results, storage_backend, report
+                    )
+
+            # Hojas sin partes en la caché: se crean sus tablas vacías
+            for sheet in sheets:
+                if sheet.id not in data_tables:
+                    data_tables[sheet.id] = DataModelFactory._load_coerced_batches(
+                        sheet, columns_by_sheet[sheet.id], [], storage_backend
+                    )
+
+            return [data_tables[sheet_id] for sheet_id in sheets_by_id]
         except Exception as e:
-            logger.error(f"Error al crear tabla de datos para hoja {sheet_id}: {str(e)}")
+            logger.error(f"Error al crear tablas de datos del archivo {excel_file_id}: {str(e)}")
             logger.error(traceback.format_exc())
             raise
 
     @staticmethod
-    def _process_batch(data_table, batch_df, columns, start_idx):
+    def _load_coerced_batches(sheet, columns, results, storage_backend=None, on_batch=None):
+        """
+        Escribe en la tabla de una hoja los lotes ya convertidos por el pool,
+        cada uno en su propia transacción con el checkpoint de la tabla
+
+        Args:
+            results: Iterable de (sheet_id, (filas, values, fallbacks, perfil)) de IngestPool.imap
+            on_batch: Función opcional que recibe las filas de cada lote escrito
+        """
+        data_table, columns = DataModelFactory._prepare_data_table(sheet, storage_backend, columns)
+        loader = data_table.get_storage().open_loader(data_table, columns)
+        DataModelFactory._start_load(data_table, columns, 0)
+        logger.info(f"Cargando hoja {sheet.name} en la tabla {data_table.table_name}")
+
+        # Los perfiles de cada parte se calculan en el pool y aquí solo se combinan
+        profiler = ColumnProfiler(columns)
+        start_idx = 0
+        for _, (row_count, values, fallbacks, part_profile) in results:
+            if row_count:
+                with transaction.atomic():
+                    loader.write_batch(start_idx, values, fallbacks)
+                    DataModelFactory._save_checkpoint(data_table, loader.checkpoint)
+                profiler.merge(part_profile)
+                start_idx += row_count
+                if on_batch:
+                    on_batch(row_count)
+
+        loader.close()
+        DataModelFactory._finish_data_table(data_table, sheet, start_idx, columns,
+                                            profiles=profiler.profiles())
+        return data_table
+
+    @staticmethod
+    @transaction.atomic
+    def clone_data_table(source_table, sheet):
+        """
+        Crea la tabla de datos de una hoja copiando la de otra hoja con el mismo
+        contenido (un archivo subido dos veces), sin parsear ni convertir valores
+
+        Args:
+            source_table: Tabla de datos de la hoja original
+            sheet: Hoja de destino, con las mismas definiciones de columnas
+
+        Returns:
+            DataTable: Tabla de datos creada
+        """
+        source_columns = list(ColumnDefinition.objects.filter(sheet=source_table.sheet).order_by('column_index'))
+        data_table, columns = DataModelFactory._prepare_data_table(sheet, source_table.storage_backend)
+        if [col.column_index for col in columns] != [col.column_index for col in source_columns]:
+            raise ValueError(f"Las columnas de la hoja {sheet.name} no coinciden con las de la tabla original")
+
+        data_table.get_storage().copy(source_table, data_table, source_columns, columns)
+        SearchService.delete_from(data_table)
+        if source_table.search_indexed:
+            SearchService.copy(source_table, data_table)
+        data_table.search_indexed = source_table.search_indexed
+        # Mismos datos: los perfiles de la tabla original siguen siendo válidos
+        profiles = {col.column_index: col.profile for col in source_columns}
+        DataModelFactory._finish_data_table(data_table, sheet, source_table.row_count, columns, profiles=profiles)
+        logger.info(f"Tabla {data_table.table_name} copiada de {source_table.table_name}")
+        return data_table
+
+    @staticmethod
+    def create_value_indexes(sheet_id, column_indexes):
         """
-        Procesa un lote de filas
+        Crea índices de valores sobre columnas de la tabla de una hoja y los
+        registra en DataTable.value_indexes, para reconstruirlos después de
+        cada carga completa. Si la tabla se está cargando solo se registran y
+        se crean al terminar la carga.
+
+        Args:
+            sheet_id: ID de la hoja de Excel
+            column_indexes: column_index de las columnas a indexar
+
+        Returns:
+            DataTable: Tabla de datos
+        """
+        data_table = DataTable.objects.get(sheet_id=sheet_id)
+        columns = list(ColumnDefinition.objects.filter(
+            sheet_id=sheet_id, column_index__in=column_indexes
+        ).order_by('column_index'))
+
+        if data_table.status == 'ready':
+            data_table.get_storage().create_value_indexes(data_table, columns)
+            logger.info(f"Índices de valores creados en {data_table.table_name}: "
+                        f"{[col.name for col in columns]}")
+
+        data_table.value_indexes = sorted(set(data_table.value_indexes) | {col.column_index for col in columns})
+        data_table.save(update_fields=['value_indexes'])
+        return data_table
+
+    @staticmethod
+    def _prepare_data_table(sheet, storage_backend=None, columns=None):
+        """
+        Crea o actualiza la DataTable de una hoja y cambia su backend si se pide otro
+
+        Returns:
+            tuple: (DataTable, definiciones de columnas en orden)
+        """
+        if columns is None:
+            columns = list(ColumnDefinition.objects.filter(sheet=sheet).order_by('column_index'))
+
+        # Verificar que la hoja tenga definiciones de columnas
+        if not columns:
+            raise ValueError(f"La hoja {sheet.name} no tiene definiciones de columnas")
+
+        # Crear o actualizar la tabla de datos, oculta hasta terminar la carga
+        table_name = f"{sheet.excel_file.id}_{sheet.name}"
+        data_table, created = DataTable.objects.update_or_create(
+            sheet=sheet,
+            defaults={'table_name': table_name, 'status': 'loading', 'loaded_rows': 0}
+        )
+
+        # Cambiar de backend elimina los datos guardados en el anterior
+        if storage_backend and storage_backend != data_table.storage_backend:
+            data_table.get_storage().delete(data_table)
+            data_table.storage_backend = storage_backend
+            data_table.save()
+
+        return data_table, columns
+
+    @staticmethod
+    def _schema_hash(columns):
+        """Hash de la posición y el tipo de las columnas con que se guardan los datos"""
+        schema = ','.join(f"{col.column_index}:{col.data_type}" for col in columns)
+        return hashlib.sha256(schema.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def _start_load(data_table, columns, start_row):
+        """Marca la tabla en carga desde start_row, con las columnas con que se carga"""
+        # Los loaders vuelven a indexar para la búsqueda las filas desde start_row
+        SearchService.delete_from(data_table, start_row)
+        if not start_row:
+            data_table.search_indexed = True
+
+        data_table.status = 'loading'
+        data_table.loaded_rows = start_row
+        data_table.schema_hash = DataModelFactory._schema_hash(columns)
+        data_table.save(update_fields=['status', 'loaded_rows', 'schema_hash', 'search_indexed'])
+
+    @staticmethod
+    def _save_checkpoint(data_table, loaded_rows):
+        """Guarda el checkpoint de la carga en la transacción del lote"""
+        if loaded_rows != data_table.loaded_rows:
+            data_table.loaded_rows = loaded_rows
+            DataTable.objects.filter(id=data_table.id).update(loaded_rows=loaded_rows)
+
+    @staticmethod
+    def _finish_data_table(data_table, sheet, row_count, columns, changed=True, profiles=None):
+        """Registra el resultado de una carga y los perfiles de sus columnas, y publica la tabla"""
+        if profiles is not None:
+            for col in columns:
+                col.profile = profiles.get(col.column_index)
+            ColumnDefinition.objects.bulk_update(columns, ['profile'])
+
+        # Índices de valores pedidos mientras se cargaba la tabla
+        data_table.refresh_from_db(fields=['value_indexes'])
+        data_table.row_count = row_count
+        data_table.status = 'ready'
+        data_table.loaded_rows = row_count
+        data_table.schema_hash = DataModelFactory._schema_hash(columns)
+        if changed:
+            # Una nueva versión de los datos invalida las exportaciones anteriores
+            data_table.data_version = F('data_version') + 1
+        data_table.save()
+        data_table.refresh_from_db(fields=['data_version'])
+
+        # Los índices de valores se crean con los datos ya cargados: mantenerlos
+        # fila a fila durante la carga es más lento que construirlos al final
+        indexed = [col for col in columns if col.column_index in data_table.value_indexes]
+        if indexed:
+            data_table.get_storage().create_value_indexes(data_table, indexed)
+
+        # Tablas anteriores al índice de búsqueda, o cargas que no lo mantuvieron completo
+        if not data_table.search_indexed:
+            SearchService.rebuild(data_table, columns)
+
+        # Marcar la hoja como procesada
+        sheet.processed = True
+        sheet.save()
+
+        # Marcar el archivo como procesado si todas sus hojas están procesadas
+        if not ExcelSheet.objects.filter(excel_file=sheet.excel_file, processed=False).exists():
+            sheet.excel_file.processed = True
+            sheet.excel_file.save()
+
+    @staticmethod
+    def _process_batch(data_table, batch_df, columns, start_idx, loader, format_cache=None, profiler=None):
+        """
+        Procesa un lote de filas: convierte cada columna a su tipo de forma
+        vectorizada, entrega el lote al loader del backend de almacenamiento y
+        lo añade al perfil de las columnas
 
         Args:
             data_table: Tabla de datos
             batch_df: DataFrame con el lote de datos
             columns: Lista de definiciones de columnas
             start_idx: Índice de inicio para este lote
+            loader: Loader abierto con StorageBackend.open_loader
+            format_cache: Formatos de fecha detectados en lotes anteriores
+            profiler: ColumnProfiler opcional de la carga
         """
-        # Crear filas
         try:
             logger.info(
                 f"Procesando lote para tabla {data_table.table_name}: {len(batch_df)} filas, {len(columns)} columnas")
 
-            data_rows = []
-            for i in range(len(batch_df)):
-                data_rows.append(DataRow(
-                    table=data_table,
-                    row_index=start_idx + i
-                ))
-
-            # Insertar filas en la base de datos
-            data_rows = DataRow.objects.bulk_create(data_rows)
-
-            # Crear celdas
-            data_cells = []
-            for i, row in enumerate(data_rows):
-                df_row = batch_df.iloc[i]
-
-                for col in columns:
-                    # Obtener valor original, usando el nombre original de la columna
-                    original_value = df_row.get(col.original_name)
-
-                    # Crear celda con el valor adecuado según el tipo de datos
-                    cell = DataCell(row=row, column_definition=col)
-
-                    # Asignar valor según tipo
-                    if pd.isna(original_value):
-                        pass  # Dejar como NULL
-                    elif col.data_type == 'string':
-                        cell.string_value = str(original_value)
-                    elif col.data_type == 'integer':
-                        try:
-                            cell.integer_value = int(original_value)
-                        except (ValueError, TypeError):
-                            cell.string_value = str(original_value)
-                    elif col.data_type == 'float':
-                        try:
-                            cell.float_value = float(original_value)
-                        except (ValueError, TypeError):
-                            cell.string_value = str(original_value)
-
-                    elif col.data_type == 'date':
-                        try:
-                            cell.date_value = pd.to_datetime(original_value).date()
-                        except:
-                            cell.string_value = str(original_value)
-
-                    elif col.data_type == 'datetime':
-                        try:
-                            naive_datetime = pd.to_datetime(original_value)
-                            from django.utils import timezone
-                            # Convertir a datetime con zona horaria
-                            cell.datetime_value = timezone.make_aware(naive_datetime)
-                        except:
-                            cell.string_value = str(original_value)
-
-                    elif col.data_type == 'boolean':
-                        # Manejar varios formatos de booleano
-                        bool_value = False
-                        if isinstance(original_value, bool):
-                            bool_value = original_value
-                        elif isinstance(original_value, (int, float)):
-                            bool_value = original_value > 0
-                        elif isinstance(original_value, str):
-                            bool_value = original_value.lower() in ('true', 'yes', 'si', '1', 'verdadero')
-                        cell.boolean_value = bool_value
-
-                    data_cells.append(cell)
-
-            # Insertar celdas en la base de datos
-            DataCell.objects.bulk_create(data_cells)
-            logger.info(f"Lote procesado: {len(data_rows)} filas, {len(data_cells)} celdas")
+            values, fallbacks = coerce_batch(batch_df, columns, format_cache)
+            loader.write_batch(start_idx, values, fallbacks)
+            if profiler is not None:
+                profiler.update(values, fallbacks)
         except Exception as e:
             logger.error(f"Error en _process_batch: {str(e)}")
             logger.error(traceback.format_exc())
             raise ValueError("Error durante el procesamiento del lote")
 
     @staticmethod
-    def get_table_data(data_table_id, page=1, page_size=100):
+    def get_table_data(data_table_id, page=1, page_size=100, cursor=None):
         """
         Obtiene los datos de una tabla en formato estructurado
 
+        Las páginas se buscan por row_index (paginación por cursor), de modo que
+        cualquier página cuesta lo mismo que la primera.
+
         Args:
             data_table_id: ID de la tabla de datos
-            page: Número de página
+            page: Número de página, si no se indica un cursor
             page_size: Tamaño de página
+            cursor: Cursor opaco de TableCursor (next_cursor, prev_cursor, etc.)
 
         Returns:
-            dict: Datos estructurados con columnas y filas
+            dict: Datos estructurados con columnas, filas y cursores de navegación.
+            Cada fila es una lista [row_index, valores en el orden de las columnas...]
+
+        Raises:
+            ValueError: Si el cursor no es válido
         """
         try:
             data_table = DataTable.objects.get(id=data_table_id)
             sheet = data_table.sheet
+            storage = data_table.get_storage()
 
             # Obtener definiciones de columnas
             columns = list(ColumnDefinition.objects.filter(sheet=sheet).order_by('column_index'))
 
-            # Calcular offset para paginación
-            offset = (page - 1) * page_size
-
-            # Obtener filas para la página actual
-            rows = DataRow.objects.filter(table=data_table).order_by('row_index')[offset:offset + page_size]
+            if cursor:
+                start_row, descending = TableCursor.decode(cursor, data_table)
+            else:
+                start_row, descending = (max(page, 1) - 1) * page_size, False
+
+            # Se lee una fila de más para saber si hay página siguiente (o anterior)
+            rows = storage.read_rows(data_table, columns, start_row, page_size + 1, descending=descending)
+            if descending and len(rows) <= page_size:
+                # Se llegó al principio de la tabla: mostrar la primera página completa
+                rows = storage.read_rows(data_table, columns, 0, page_size + 1)
+                descending = False
+
+            if descending:
+                has_prev, has_next = len(rows) > page_size, True
+                rows = rows[-page_size:]
+            else:
+                has_prev, has_next = start_row > 0, len(rows) > page_size
+                rows = rows[:page_size]
+
+            total_pages = max((data_table.row_count + page_size - 1) // page_size, 1)
+            first_row = rows[0][0] if rows else start_row
+            page = min(first_row // page_size + 1, total_pages)
 
             # Preparar estructura de resultados
             result = {
@@ -198,22 +551,24 @@ class DataModelFactory:
                 'total_rows': data_table.row_count,
                 'page': page,
                 'page_size': page_size,
+                'total_pages': total_pages,
                 'columns': [{'name': col.name, 'original_name': col.original_name, 'type': col.data_type} for col in
                             columns],
-                'rows': []
+                'rows': rows,
+                'next_cursor': TableCursor.encode(data_table, rows[-1][0] + 1) if has_next and rows else None,
+                'prev_cursor': TableCursor.encode(data_table, first_row, descending=True) if has_prev else None,
+                'first_cursor': TableCursor.encode(data_table, 0),
+                'last_cursor': TableCursor.encode(data_table, (total_pages - 1) * page_size),
+                'pages': [
+                    {'number': number, 'cursor': TableCursor.encode(data_table, (number - 1) * page_size)}
+                    for number in TableCursor.page_window(page, total_pages)
+                ],
             }
 
-            # Para cada fila, obtener todas sus celdas
-            for row in rows:
-                cells = DataCell.objects.filter(row=row).select_related('column_definition')
-                row_data = {}
-
-                for cell in cells:
-                    row_data[cell.column_definition.name] = cell.get_value()
-
-                result['rows'].append(row_data)
-
             return result
+        except ValueError:
+            # Cursor no válido: lo resuelve quien llama
+            raise
         except Exception as e:
             logger.error(f"Error al obtener datos de tabla {data_table_id}: {str(e)}")
             logger.error(traceback.format_exc())
@@ -0,0 +1,56 @@
+from django.core import signing
+
+
+class TableCursor:
+    """
+    Cursores opacos para paginar los datos de una tabla por row_index.
+
+    Un cursor indica la fila desde la que se lee y la dirección de lectura; va
+    firmado para que no se pueda manipular ni reutilizar en otra tabla.
+    """
+
+    SALT = 'data_models.table_cursor'
+
+    @staticmethod
+    def encode(data_table, start_row, descending=False):
+        """
+        Genera un cursor
+
+        Args:
+            data_table: Tabla de datos
+            start_row: row_index de la primera fila de la página o, con
+                descending, de la fila siguiente a la última
+            descending: Leer hacia atrás desde start_row
+
+        Returns:
+            str: Cursor firmado
+        """
+        return signing.dumps({'t': data_table.id, 'r': start_row, 'd': int(descending)}, salt=TableCursor.SALT,
+                             compress=True)
+
+    @staticmethod
+    def decode(token, data_table):
+        """
+        Lee un cursor generado con encode
+
+        Returns:
+            tuple: (start_row, descending)
+
+        Raises:
+            ValueError: Si el cursor no es válido o pertenece a otra tabla
+        """
+        try:
+            data = signing.loads(token, salt=TableCursor.SALT)
+        except signing.BadSignature:
+            raise ValueError("Cursor de paginación no válido")
+
+        if data.get('t') != data_table.id or not isinstance(data.get('r'), int):
+            raise ValueError("Cursor de paginación no válido")
+        return data['r'], bool(data.get('d'))
+
+    @staticmethod
+    def page_window(current, total_pages, radius=2):
+        """Números de página alrededor de la actual para el navegador"""
+        first = max(current - radius, 1)
+        last = min(current + radius, total_pages)
+        return list(range(first, last + 1))
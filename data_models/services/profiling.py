@@ -0,0 +1,384 @@
+import math
+from datetime import date, datetime
+import numpy as np
+import pandas as pd
+from django.conf import settings
+
+# Precisión de HyperLogLog: 2^14 registros, error típico del 0,8 %
+HLL_PRECISION = 14
+# Valores más frecuentes que se publican y contadores que se conservan
+TOP_VALUES = 10
+TOP_CAPACITY = 1000
+# Tamaño de la muestra aleatoria para los histogramas
+SAMPLE_SIZE = 2000
+HISTOGRAM_BINS = 20
+NUMERIC_TYPES = ('integer', 'float')
+# Operadores de filtro que se pueden resolver con los mapas de zonas
+ZONE_OPERATORS = ('eq', 'lt', 'lte', 'gt', 'gte', 'in')
+
+
+class HyperLogLog:
+    """
+    Estimador del número de valores distintos con memoria fija. Dos
+    estimadores se combinan tomando el máximo de cada registro, de modo que
+    cada lote (o cada proceso) puede calcular el suyo.
+    """
+
+    def __init__(self, precision=HLL_PRECISION):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    def add(self, series):
+        """Añade los valores de una serie sin nulos"""
+        if len(series) == 0:
+            return
+        hashes = pd.util.hash_pandas_object(series, index=False).to_numpy()
+        bits = 64 - self.precision
+        index = (hashes >> np.uint64(bits)).astype(np.intp)
+        rest = hashes & np.uint64((1 << bits) - 1)
+        # Posición del primer bit a 1 de los bits restantes (exacta: caben en un float64)
+        _, exponent = np.frexp(rest.astype(np.float64))
+        rank = (bits + 1 - exponent).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    def merge(self, other):
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def count(self):
+        size = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / size)
+        estimate = alpha * size * size / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * size and zeros:
+            # Pocos valores: conteo lineal sobre los registros vacíos
+            estimate = size * math.log(size / zeros)
+        return int(round(estimate))
+
+
+class ReservoirSample:
+    """
+    Muestra aleatoria uniforme de tamaño fijo: cada valor recibe una clave
+    aleatoria y se conservan los de clave más baja, así que dos muestras se
+    combinan igual que se añade un lote.
+    """
+
+    def __init__(self, size=SAMPLE_SIZE):
+        self.size = size
+        self.rng = np.random.default_rng()
+        self.values = np.empty(0, dtype=np.float64)
+        self.keys = np.empty(0, dtype=np.float64)
+
+    def add(self, values):
+        self._combine(values, self.rng.random(len(values)))
+
+    def merge(self, other):
+        self._combine(other.values, other.keys)
+
+    def _combine(self, values, keys):
+        if len(self.keys) == self.size:
+            # Muestra llena: solo entran los valores con clave más baja que la mayor
+            keep = keys < self.keys.max()
+            values, keys = values[keep], keys[keep]
+        if len(keys) == 0:
+            return
+        values = np.concatenate([self.values, values])
+        keys = np.concatenate([self.keys, keys])
+        if len(keys) > self.size:
+            keep = np.argpartition(keys, self.size)[:self.size]
+            values, keys = values[keep], keys[keep]
+        self.values, self.keys = values, keys
+
+
+class ColumnStats:
+    """Estadísticas de una columna, acumuladas lote a lote"""
+
+    def __init__(self, data_type):
+        self.data_type = data_type
+        self.rows = 0
+        self.nulls = 0
+        self.invalid = 0
+        self.min = None
+        self.max = None
+        self.distinct = HyperLogLog()
+        self.top = None
+        self.top_pruned = False
+        # Media y suma de cuadrados de las desviaciones (fórmula de Chan)
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.sample = ReservoirSample()
+        # Zona abierta del mapa de zonas y zonas cerradas [inicio, fin, mín, máx]
+        self.zone_min = None
+        self.zone_max = None
+        self.zone_invalid = False
+        self.zone_values = False
+        self.zones = []
+
+    def update(self, values, fallbacks):
+        invalid = fallbacks.notna()
+        present = values.notna()
+        self.rows += len(values)
+        self.invalid += int(invalid.sum())
+        self.nulls += int((~present & ~invalid).sum())
+        self.zone_invalid = self.zone_invalid or bool(invalid.any())
+        if not present.any():
+            return
+
+        data = values[present]
+        low, high = data.min(), data.max()
+        self.zone_min = low if self.zone_min is None else min(self.zone_min, low)
+        self.zone_max = high if self.zone_max is None else max(self.zone_max, high)
+        self.zone_values = True
+        self.min = low if self.min is None else min(self.min, low)
+        self.max = high if self.max is None else max(self.max, high)
+
+        self.distinct.add(data)
+        self._add_top(data.value_counts())
+        if self.data_type in NUMERIC_TYPES:
+            numbers = data.to_numpy(dtype=np.float64)
+            self._add_moments(len(numbers), numbers.mean(), float(((numbers - numbers.mean()) ** 2).sum()))
+            self.sample.add(numbers)
+
+    def merge(self, other, offset):
+        """Añade las estadísticas de las filas siguientes, calculadas aparte"""
+        self.rows += other.rows
+        self.nulls += other.nulls
+        self.invalid += other.invalid
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+            self.max = other.max if self.max is None else max(self.max, other.max)
+        self.distinct.merge(other.distinct)
+        if other.top is not None:
+            self.top_pruned = self.top_pruned or other.top_pruned
+            self._add_top(other.top)
+        if other.count:
+            self._add_moments(other.count, other.mean, other.m2)
+        self.sample.merge(other.sample)
+        self.zones += [[start + offset, end + offset, low, high] for start, end, low, high in other.zones]
+
+    def _add_top(self, counts):
+        self.top = counts if self.top is None else self.top.add(counts, fill_value=0)
+        if len(self.top) > 2 * TOP_CAPACITY:
+            # Muchos valores distintos: se conservan los más frecuentes
+            self.top = self.top.nlargest(TOP_CAPACITY)
+            self.top_pruned = True
+
+    def _add_moments(self, count, mean, m2):
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self.m2 += m2 + delta * delta * self.count * count / total
+        self.count = total
+
+    def close_zone(self, start, end):
+        # Una zona sin valores no cumple ningún filtro de comparación y se
+        # omite; con textos no convertidos sus límites son desconocidos (None)
+        if self.zone_invalid:
+            self.zones.append([start, end, None, None])
+        elif self.zone_values:
+            self.zones.append([start, end, to_json_value(self.zone_min), to_json_value(self.zone_max)])
+        self.zone_min = self.zone_max = None
+        self.zone_invalid = self.zone_values = False
+
+    def profile(self):
+        """Perfil de la columna en un diccionario serializable en JSON"""
+        top = self.top if self.top is not None else pd.Series(dtype=np.int64)
+        distinct = len(top)
+        if self.top_pruned:
+            # La estimación de HyperLogLog no puede superar el número de valores presentes
+            distinct = min(max(self.distinct.count(), distinct), self.rows - self.nulls - self.invalid)
+        profile = {
+            'data_type': self.data_type,
+            'rows': self.rows,
+            'nulls': self.nulls,
+            'invalid': self.invalid,
+            # Exacto mientras no se hayan descartado contadores de valores
+            'distinct': distinct,
+            'distinct_exact': not self.top_pruned,
+            'min': to_json_value(self.min),
+            'max': to_json_value(self.max),
+            'top': [{'value': to_json_value(value), 'count': int(count)}
+                    for value, count in top.nlargest(TOP_VALUES).items()],
+            'zones': self.zones,
+        }
+        if self.data_type in NUMERIC_TYPES:
+            profile['mean'] = to_json_value(self.mean) if self.count else None
+            profile['std'] = to_json_value(math.sqrt(self.m2 / (self.count - 1))) if self.count > 1 else None
+            profile['histogram'] = self._histogram()
+        return profile
+
+    def _histogram(self):
+        """Histograma de la muestra escalado al total de valores"""
+        if not self.count:
+            return None
+        low, high = float(self.min), float(self.max)
+        bins = HISTOGRAM_BINS
+        if self.data_type == 'integer':
+            bins = max(min(bins, int(high - low) + 1), 1)
+        counts, edges = np.histogram(self.sample.values, bins=bins, range=(low, high) if high > low else None)
+        scale = self.count / len(self.sample.values)
+        return {
+            'edges': [to_json_value(edge) for edge in edges],
+            'counts': [int(round(count * scale)) for count in counts],
+        }
+
+
+class ColumnProfiler:
+    """
+    Perfil de las columnas de una tabla calculado durante la carga, a partir
+    de los lotes ya convertidos: nulos, valores no convertibles, distintos
+    (HyperLogLog), mínimo, máximo, media, valores más frecuentes, histograma
+    (sobre una muestra) y un mapa de zonas con el mínimo y el máximo de cada
+    bloque de PROFILE_ZONE_ROWS filas.
+
+    Los perfiles parciales se combinan con merge, de modo que cada parte de
+    una hoja se puede perfilar en un proceso de trabajo.
+    """
+
+    def __init__(self, columns, zone_rows=None):
+        self.zone_rows = zone_rows or getattr(settings, 'PROFILE_ZONE_ROWS', 10000)
+        self.stats = {col.column_index: ColumnStats(col.data_type) for col in columns}
+        self.row_count = 0
+        self.zone_start = 0
+
+    def update(self, values, fallbacks):
+        """
+        Añade un lote con el formato de coerce_batch
+
+        Args:
+            values: Diccionario {column_index: Series} con los valores tipados
+            fallbacks: Diccionario {column_index: Series} con el texto no convertido
+        """
+        size = len(next(iter(values.values()))) if values else 0
+        offset = 0
+        while offset < size:
+            # Partir el lote en los límites de zona
+            take = min(size - offset, self.zone_rows - (self.row_count - self.zone_start))
+            for column_index, stats in self.stats.items():
+                stats.update(values[column_index].iloc[offset:offset + take],
+                             fallbacks[column_index].iloc[offset:offset + take])
+            offset += take
+            self.row_count += take
+            if self.row_count - self.zone_start >= self.zone_rows:
+                self._close_zone()
+
+    def merge(self, other):
+        """Añade el perfil de las filas que siguen a las ya perfiladas"""
+        self._close_zone()
+        other._close_zone()
+        for column_index, stats in self.stats.items():
+            stats.merge(other.stats[column_index], self.row_count)
+        self.row_count += other.row_count
+        self.zone_start = self.row_count
+
+    def _close_zone(self):
+        if self.row_count > self.zone_start:
+            for stats in self.stats.values():
+                stats.close_zone(self.zone_start, self.row_count)
+            self.zone_start = self.row_count
+
+    def profiles(self):
+        """
+        Returns:
+            dict: {column_index: perfil} para ColumnDefinition.profile
+        """
+        self._close_zone()
+        return {column_index: stats.profile() for column_index, stats in self.stats.items()}
+
+
+def to_json_value(value):
+    """Convierte un valor de pandas o numpy en uno serializable en JSON"""
+    if value is None or value is pd.NA:
+        return None
+    if isinstance(value, pd.Timestamp):
+        value = value.to_pydatetime()
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    return value
+
+
+def from_json_value(value, data_type):
+    """Valor de un perfil en el tipo de su columna, para compararlo con un filtro"""
+    if value is None:
+        return None
+    if data_type == 'date':
+        return date.fromisoformat(value)
+    if data_type == 'datetime':
+        return datetime.fromisoformat(value)
+    return value
+
+
+def zone_matches(low, high, operator, value):
+    """Indica si una zona con esos límites puede tener filas que cumplan el filtro"""
+    if low is None:
+        return True
+    try:
+        if operator == 'in':
+            return any(low <= item <= high for item in value)
+        return {
+            'eq': low <= value <= high,
+            'lt': low < value,
+            'lte': low <= value,
+            'gt': high > value,
+            'gte': high >= value,
+        }[operator]
+    except TypeError:
+        return True
+
+
+def zone_row_ranges(row_count, filters):
+    """
+    Rangos de row_index que pueden cumplir los filtros según los mapas de zonas
+    de los perfiles. Las zonas que no cumplen algún filtro no se leen.
+
+    Args:
+        row_count: Filas de la tabla; un perfil de otra carga no se usa
+        filters: Lista de (columna, operador, valor) de una TableQuery
+
+    Returns:
+        list: Rangos [inicio, fin) ordenados, o None si ningún filtro se puede
+        resolver con los perfiles
+    """
+    ranges = None
+    for col, operator, value in filters:
+        profile = col.get_profile()
+        if operator not in ZONE_OPERATORS or not profile or profile.get('rows') != row_count:
+            continue
+        matching = merge_ranges([
+            (start, end) for start, end, low, high in profile.get('zones', [])
+            if zone_matches(from_json_value(low, col.data_type), from_json_value(high, col.data_type),
+                            operator, value)
+        ])
+        ranges = matching if ranges is None else intersect_ranges(ranges, matching)
+    return ranges
+
+
+def merge_ranges(ranges):
+    """Une los rangos [inicio, fin) contiguos o solapados"""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [tuple(item) for item in merged]
+
+
+def intersect_ranges(left, right):
+    """Intersección de dos listas ordenadas de rangos [inicio, fin) disjuntos"""
+    result = []
+    i = j = 0
+    while i < len(left) and j < len(right):
+        start = max(left[i][0], right[j][0])
+        end = min(left[i][1], right[j][1])
+        if start < end:
+            result.append((start, end))
+        if left[i][1] < right[j][1]:
+            i += 1
+        else:
+            j += 1
+    return result
@@ -0,0 +1,97 @@
+import logging
+import traceback
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F
+from data_models.models import DataTable, TableExport
+from data_models.services.search_service import SearchService
+from excel_files.models import ColumnDefinition, ProcessingJob
+
+logger = logging.getLogger(__name__)
+
+
+class PurgeService:
+    """
+    Borrado rápido de tablas y archivos. Los datos se eliminan con SQL por
+    conjuntos (o eliminando el almacenamiento propio de la tabla) antes de
+    borrar los registros, de modo que el recolector de Django solo ve las
+    hojas, columnas y tablas, nunca millones de filas y celdas.
+    """
+
+    @staticmethod
+    def purge_exports(data_table):
+        """
+        Elimina los archivos exportados de una tabla y sus registros
+
+        Returns:
+            int: Número de exportaciones eliminadas
+        """
+        exports = TableExport.objects.filter(table=data_table)
+        for name in exports.values_list('file', flat=True):
+            if name and default_storage.exists(name):
+                default_storage.delete(name)
+        count, _ = exports.delete()
+        return count
+
+    @staticmethod
+    @transaction.atomic
+    def truncate_table(data_table):
+        """Vacía los datos de una tabla conservando su definición"""
+        PurgeService.purge_exports(data_table)
+        data_table.get_storage().delete(data_table)
+        SearchService.delete_from(data_table)
+        ColumnDefinition.objects.filter(sheet_id=data_table.sheet_id).update(profile=None)
+
+        data_table.row_count = 0
+        data_table.data_version = F('data_version') + 1
+        data_table.save(update_fields=['row_count', 'data_version'])
+        data_table.refresh_from_db(fields=['data_version'])
+        logger.info(f"Tabla {data_table.table_name} vaciada")
+
+    @staticmethod
+    @transaction.atomic
+    def purge_table(data_table):
+        """Elimina una tabla de datos con todos sus datos y exportaciones"""
+        PurgeService.purge_exports(data_table)
+        data_table.get_storage().delete(data_table)
+        SearchService.delete_from(data_table)
+        data_table.delete()
+        logger.info(f"Tabla {data_table.table_name} eliminada")
+
+    @staticmethod
+    def purge_file(excel_file):
+        """
+        Elimina un archivo Excel con sus hojas, tablas y exportaciones. Cada tabla
+        se elimina en su propia transacción para no bloquear SQLite durante todo
+        el borrado.
+        """
+        try:
+            for data_table in DataTable.objects.filter(sheet__excel_file=excel_file):
+                PurgeService.purge_table(data_table)
+
+            # El propio trabajo de borrado se conserva para registrar su resultado
+            ProcessingJob.objects.filter(excel_file=excel_file).exclude(job_type='purge_file').delete()
+
+            name = excel_file.name
+            excel_file.delete()
+            logger.info(f"Archivo {name} eliminado")
+        except Exception as e:
+            logger.error(f"Error al eliminar el archivo {excel_file.id}: {str(e)}")
+            logger.error(traceback.format_exc())
+            raise
+
+    @staticmethod
+    def schedule_file_purge(excel_file):
+        """
+        Marca un archivo como eliminado, de modo que deja de mostrarse de
+        inmediato, y encola su borrado en segundo plano
+
+        Returns:
+            ProcessingJob: Trabajo de borrado encolado
+        """
+        from excel_files.services.job_queue import JobQueue
+
+        excel_file.deleted = True
+        excel_file.save(update_fields=['deleted'])
+        # El id se guarda en las opciones: la referencia al archivo se pierde al borrarlo
+        return JobQueue.enqueue('purge_file', excel_file, options={'file_id': excel_file.id})
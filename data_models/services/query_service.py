@@ -0,0 +1,247 @@
+import logging
+from datetime import date
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from data_models.services.profiling import zone_row_ranges
+from data_models.services.storage.query import AGGREGATE_FUNCTIONS, FILTER_OPERATORS, TableQuery
+from excel_files.models import ColumnDefinition, ProcessingJob
+
+logger = logging.getLogger(__name__)
+
+BOOLEAN_VALUES = {'true': True, '1': True, 'sí': True, 'si': True, 'yes': True,
+                  'false': False, '0': False, 'no': False}
+NUMERIC_TYPES = ('integer', 'float', 'boolean')
+
+
+class QueryService:
+    """
+    API de consulta sobre los datos de una tabla: filtros, orden, proyección,
+    agrupación y agregados. La consulta se valida aquí y se ejecuta dentro del
+    backend de almacenamiento (SQL o Arrow); el resultado tiene un límite de
+    filas y se envía por bloques.
+
+    Formato de la consulta (JSON):
+        {
+            "select": ["nombre", "precio"],
+            "filters": [{"column": "precio", "op": "gte", "value": 10}],
+            "group_by": ["pais"],
+            "aggregates": [{"func": "sum", "column": "precio", "as": "total"}],
+            "sort": ["-total"],
+            "limit": 100,
+            "offset": 0
+        }
+
+    En el orden los nulos van siempre al final, sea ascendente o descendente,
+    en todos los backends.
+    """
+
+    @staticmethod
+    def get_max_rows():
+        return getattr(settings, 'QUERY_MAX_ROWS', 10000)
+
+    @staticmethod
+    def parse(data_table, spec):
+        """
+        Valida una consulta y convierte los valores de sus filtros al tipo de
+        cada columna. Los perfiles de las columnas indican qué rangos de filas
+        pueden cumplir los filtros.
+
+        Args:
+            data_table: Tabla consultada
+            spec: Consulta como diccionario (formato en la documentación de la clase)
+
+        Returns:
+            TableQuery: Consulta lista para StorageBackend.query
+
+        Raises:
+            ValueError: Si la consulta no es válida
+        """
+        if not isinstance(spec, dict):
+            raise ValueError("La consulta debe ser un objeto JSON")
+
+        columns = list(ColumnDefinition.objects.filter(sheet=data_table.sheet).order_by('column_index'))
+        by_name = {}
+        for col in columns:
+            by_name.setdefault(col.name, col)
+            by_name.setdefault(f"c{col.column_index}", col)
+
+        def column(name):
+            if name not in by_name:
+                raise ValueError(f"Columna desconocida: {name}")
+            return by_name[name]
+
+        group_by = [column(name) for name in QueryService._list(spec, 'group_by')]
+
+        aggregates = []
+        for item in QueryService._list(spec, 'aggregates'):
+            function = str(item.get('func', '')).lower() if isinstance(item, dict) else ''
+            if function not in AGGREGATE_FUNCTIONS:
+                raise ValueError(f"Función de agregación no válida: {function or item}")
+            col = column(item['column']) if item.get('column') not in (None, '*') else None
+            if col is None and function != 'count':
+                raise ValueError(f"La función {function} necesita una columna")
+            if function in ('sum', 'avg') and col.data_type not in NUMERIC_TYPES:
+                raise ValueError(f"La función {function} necesita una columna numérica: {col.name}")
+            alias = str(item.get('as') or (f"{function}_{col.name}" if col else function))
+            aggregates.append((function, col, alias))
+
+        output_names = [col.name for col in group_by] + [alias for _, _, alias in aggregates]
+        if len(set(output_names)) != len(output_names):
+            raise ValueError("Los nombres de las columnas del resultado se repiten; use 'as' en los agregados")
+
+        select = [column(name) for name in QueryService._list(spec, 'select')]
+        if group_by or aggregates:
+            if select:
+                raise ValueError("Con group_by o aggregates el resultado son las columnas agrupadas y los agregados")
+        elif not select:
+            select = columns
+
+        filters = []
+        for item in QueryService._list(spec, 'filters'):
+            if not isinstance(item, dict):
+                raise ValueError(f"Filtro no válido: {item}")
+            col = column(item.get('column'))
+            operator = item.get('op', 'eq')
+            if operator not in FILTER_OPERATORS:
+                raise ValueError(f"Operador de filtro no válido: {operator}")
+            filters.append((col, operator, QueryService._filter_value(col, operator, item.get('value'))))
+
+        aliases = {alias for _, _, alias in aggregates}
+        sort = []
+        for key in QueryService._list(spec, 'sort'):
+            key = str(key)
+            descending = key.startswith('-')
+            name = key.lstrip('-')
+            if group_by or aggregates:
+                if name in aliases:
+                    sort.append((name, descending))
+                    continue
+                col = column(name)
+                if col not in group_by:
+                    raise ValueError(f"Solo se puede ordenar por columnas agrupadas o agregados: {name}")
+            else:
+                col = column(name)
+            sort.append((col, descending))
+
+        try:
+            limit = int(spec.get('limit', getattr(settings, 'QUERY_DEFAULT_ROWS', 1000)))
+            offset = int(spec.get('offset', 0))
+        except (TypeError, ValueError):
+            raise ValueError("limit y offset deben ser números enteros")
+        limit = min(max(limit, 1), QueryService.get_max_rows())
+
+        # Los mapas de zonas de los perfiles descartan bloques de filas que no
+        # pueden cumplir los filtros antes de leer la tabla
+        row_ranges = zone_row_ranges(data_table.row_count, filters)
+
+        return TableQuery(select, filters, group_by, aggregates, sort, limit, max(offset, 0), row_ranges)
+
+    @staticmethod
+    def request_value_indexes(data_table, query):
+        """
+        Encola la creación de índices de valores para las columnas que la
+        consulta filtra u ordena y que aún no tienen, si el backend los usa y
+        la tabla tiene al menos QUERY_INDEX_MIN_ROWS filas. La consulta actual
+        no espera al índice; lo aprovechan las siguientes.
+
+        Returns:
+            list: column_index de las columnas pedidas
+        """
+        from excel_files.services.job_queue import JobQueue
+
+        if data_table.row_count < getattr(settings, 'QUERY_INDEX_MIN_ROWS', 10000):
+            return []
+
+        columns = data_table.get_storage().value_index_columns(query)
+        missing = sorted({col.column_index for col in columns} - set(data_table.value_indexes))
+        if missing:
+            job = JobQueue.enqueue('index_table', data_table.sheet.excel_file, sheet=data_table.sheet,
+                                   options={'columns': missing})
+            # Un trabajo pendiente de otra consulta se amplía con las columnas nuevas
+            requested = set(job.options.get('columns', []))
+            if job.status == 'pending' and not requested.issuperset(missing):
+                job.options['columns'] = sorted(requested | set(missing))
+                ProcessingJob.objects.filter(id=job.id, status='pending').update(options=job.options)
+        return missing
+
+    @staticmethod
+    def _list(spec, key):
+        value = spec.get(key) or []
+        if not isinstance(value, list):
+            raise ValueError(f"'{key}' debe ser una lista")
+        return value
+
+    @staticmethod
+    def _filter_value(col, operator, value):
+        if operator == 'isnull':
+            return bool(value)
+        if operator == 'contains':
+            return str(value)
+        if operator == 'in':
+            if not isinstance(value, list):
+                raise ValueError(f"El filtro 'in' de {col.name} necesita una lista")
+            return [QueryService._typed_value(col, item) for item in value]
+        return QueryService._typed_value(col, value)
+
+    @staticmethod
+    def _typed_value(col, value):
+        """Convierte un valor de filtro al tipo de datos de la columna"""
+        if value is None:
+            raise ValueError(f"Valor vacío en el filtro de {col.name}; use el operador isnull")
+        try:
+            if col.data_type == 'integer':
+                return int(value)
+            if col.data_type == 'float':
+                return float(value)
+            if col.data_type == 'boolean':
+                if isinstance(value, bool):
+                    return value
+                return BOOLEAN_VALUES[str(value).strip().lower()]
+            if col.data_type == 'date':
+                return date.fromisoformat(str(value))
+            if col.data_type == 'datetime':
+                parsed = parse_datetime(str(value))
+                if parsed is None:
+                    raise ValueError(value)
+                return parsed if timezone.is_aware(parsed) else timezone.make_aware(parsed)
+        except (KeyError, TypeError, ValueError):
+            raise ValueError(f"Valor no válido para la columna {col.name} ({col.data_type}): {value}")
+        return str(value)
+
+    @staticmethod
+    def iter_json(data_table, query):
+        """
+        Ejecuta una consulta y genera el resultado en JSON por bloques, para
+        enviarlo con un StreamingHttpResponse
+
+        Yields:
+            bytes: Documento {"columns", "rows", "row_count", "truncated"}
+        """
+        encoder = DjangoJSONEncoder(ensure_ascii=False)
+        yield f'{{"columns": {encoder.encode(query.output_names)}, "rows": ['.encode('utf-8')
+
+        row_count = 0
+        truncated = False
+        chunk = []
+        rows = data_table.get_storage().query(data_table, query)
+        try:
+            for row in rows:
+                if row_count == query.limit:
+                    # La fila de más solo indica que el resultado se truncó
+                    truncated = True
+                    break
+                chunk.append(encoder.encode(row))
+                row_count += 1
+                if len(chunk) == 1000:
+                    yield (('' if row_count == len(chunk) else ', ') + ', '.join(chunk)).encode('utf-8')
+                    chunk = []
+        finally:
+            # Cerrar el cursor del backend aunque no se lea el resultado completo
+            rows.close()
+
+        if chunk:
+            yield (('' if row_count == len(chunk) else ', ') + ', '.join(chunk)).encode('utf-8')
+        yield f'], "row_count": {row_count}, "truncated": {encoder.encode(truncated)}}}'.encode('utf-8')
+        logger.info(f"Consulta sobre {data_table.table_name}: {row_count} filas")
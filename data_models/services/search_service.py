@@ -0,0 +1,278 @@
+import logging
+import re
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils.html import escape
+from data_models.services.profiling import merge_ranges
+from data_models.services.storage.query import TableQuery
+
+logger = logging.getLogger(__name__)
+
+# Tabla virtual FTS5 con el texto de las celdas de todas las tablas. Cada
+# celda es una fila cuyo rowid codifica (tabla, fila, columna), de modo que
+# las celdas de una tabla o de un rango de filas son un rango de rowid
+SEARCH_TABLE = 'data_models_search'
+COLUMN_BITS = 14  # 16384 columnas, el máximo de Excel
+ROW_BITS = 24  # 16 millones de filas por tabla
+TABLE_BITS = 63 - ROW_BITS - COLUMN_BITS  # el rowid de SQLite es un entero de 64 bits con signo
+
+MAX_COLUMN_INDEX = (1 << COLUMN_BITS) - 1
+MAX_ROW_INDEX = (1 << ROW_BITS) - 1
+# El rango de rowid de una tabla acaba donde empezaría el de la siguiente, que también debe caber
+MAX_TABLE_ID = (1 << TABLE_BITS) - 2
+
+# Marcas de las coincidencias en el texto devuelto por highlight()
+MARK_START = '\x02'
+MARK_END = '\x03'
+
+# Palabras de una búsqueda: cada una se busca como prefijo
+TERM_PATTERN = re.compile(r'\w+', re.UNICODE)
+
+
+def check_rowid_bounds(table_id, row_index=0, column_index=0):
+    """
+    Comprueba que una celda cabe en el rowid de la tabla de búsqueda. Fuera de
+    los límites sus bits invadirían los de la fila o la tabla siguientes.
+
+    Raises:
+        ValueError: Si la tabla, la fila o la columna no caben en su campo
+    """
+    if not 0 <= table_id <= MAX_TABLE_ID:
+        raise ValueError(f"La tabla {table_id} supera el máximo de {MAX_TABLE_ID} del índice de búsqueda")
+    if not 0 <= row_index <= MAX_ROW_INDEX:
+        raise ValueError(f"La fila {row_index} de la tabla {table_id} supera el máximo de {MAX_ROW_INDEX} "
+                         f"del índice de búsqueda")
+    if not 0 <= column_index <= MAX_COLUMN_INDEX:
+        raise ValueError(f"La columna {column_index} de la tabla {table_id} supera el máximo de "
+                         f"{MAX_COLUMN_INDEX} del índice de búsqueda")
+
+
+def search_rowid(table_id, row_index, column_index=0):
+    """rowid de una celda en la tabla de búsqueda"""
+    check_rowid_bounds(table_id, row_index, column_index)
+    return (table_id << (ROW_BITS + COLUMN_BITS)) | (row_index << COLUMN_BITS) | column_index
+
+
+def table_rowid_end(table_id, row_index=MAX_ROW_INDEX):
+    """Límite exclusivo de los rowid de las filas de una tabla hasta row_index incluida"""
+    return search_rowid(table_id, row_index) + (1 << COLUMN_BITS)
+
+
+def highlight_html(text):
+    """Texto de una celda en HTML escapado, con las coincidencias entre <mark>"""
+    return escape(text).replace(MARK_START, '<mark>').replace(MARK_END, '</mark>')
+
+
+class SearchService:
+    """
+    Búsqueda de texto completo sobre las celdas de texto de las tablas con
+    SQLite FTS5. Los loaders de almacenamiento mantienen el índice fila a fila
+    durante la carga (completa, reanudada o incremental) y las búsquedas
+    devuelven las filas que contienen todas las palabras buscadas, con las
+    coincidencias resaltadas.
+
+    Se indexan las columnas de texto y, en el resto, los valores que no se
+    pudieron convertir a su tipo. Con otra base de datos que no sea SQLite el
+    índice no se mantiene y la búsqueda no está disponible.
+    """
+
+    @staticmethod
+    def is_available():
+        return connection.vendor == 'sqlite'
+
+    @staticmethod
+    def _ensure_table(cursor):
+        # remove_diacritics: "Mexico" encuentra "México"
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} "
+            f"USING fts5(value, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+        )
+
+    @staticmethod
+    def index_rows(data_table, columns, row_indexes, values, fallbacks):
+        """
+        Añade al índice el texto de las filas de un lote
+
+        Args:
+            row_indexes: row_index de cada fila del lote, en orden
+            values: {column_index: Series con los valores tipados}
+            fallbacks: {column_index: Series con el texto de los valores no convertibles}
+        """
+        if not SearchService.is_available() or not len(row_indexes):
+            return
+
+        rows = np.asarray(row_indexes, dtype=np.int64)
+        max_column = max((col.column_index for col in columns), default=0)
+        check_rowid_bounds(data_table.id, int(rows.min()), max_column)
+        check_rowid_bounds(data_table.id, int(rows.max()), max_column)
+        base = rows << COLUMN_BITS | (data_table.id << (ROW_BITS + COLUMN_BITS))
+        entries = []
+        for col in columns:
+            text = fallbacks[col.column_index].reset_index(drop=True)
+            if col.data_type in ('string', 'unknown'):
+                text = text.where(text.notna(), values[col.column_index].reset_index(drop=True))
+            text = text.astype(object)
+            present = text.notna().to_numpy()
+            if not present.any():
+                continue
+            rowids = (base[present] | col.column_index).tolist()
+            entries.extend(zip(rowids, text[present].astype(str).tolist()))
+
+        if entries:
+            with connection.cursor() as cursor:
+                SearchService._ensure_table(cursor)
+                cursor.executemany(f"INSERT INTO {SEARCH_TABLE} (rowid, value) VALUES (%s, %s)", entries)
+
+    @staticmethod
+    def delete_rows(data_table, row_indexes):
+        """Elimina del índice las celdas de las filas indicadas"""
+        if not SearchService.is_available() or not row_indexes:
+            return
+
+        with connection.cursor() as cursor:
+            SearchService._ensure_table(cursor)
+            cursor.executemany(
+                f"DELETE FROM {SEARCH_TABLE} WHERE rowid >= %s AND rowid < %s",
+                [(search_rowid(data_table.id, row_index), table_rowid_end(data_table.id, row_index))
+                 for row_index in row_indexes]
+            )
+
+    @staticmethod
+    def delete_from(data_table, row_index=0):
+        """Elimina del índice las celdas de las filas con row_index >= row_index (toda la tabla con 0)"""
+        if not SearchService.is_available():
+            return
+
+        with connection.cursor() as cursor:
+            SearchService._ensure_table(cursor)
+            cursor.execute(
+                f"DELETE FROM {SEARCH_TABLE} WHERE rowid >= %s AND rowid < %s",
+                [search_rowid(data_table.id, row_index), table_rowid_end(data_table.id)]
+            )
+
+    @staticmethod
+    def copy(source, target):
+        """Copia las entradas del índice de una tabla a otra con los mismos datos"""
+        if not SearchService.is_available():
+            return
+
+        offset = search_rowid(target.id, 0) - search_rowid(source.id, 0)
+        with connection.cursor() as cursor:
+            SearchService._ensure_table(cursor)
+            cursor.execute(
+                f"INSERT INTO {SEARCH_TABLE} (rowid, value) SELECT rowid + %s, value FROM {SEARCH_TABLE} "
+                f"WHERE rowid >= %s AND rowid < %s",
+                [offset, search_rowid(source.id, 0), table_rowid_end(source.id)]
+            )
+
+    @staticmethod
+    def rebuild(data_table, columns, batch_size=10000):
+        """
+        Reconstruye el índice de una tabla leyendo sus datos del almacenamiento,
+        para las tablas cargadas antes de tener índice de búsqueda
+        """
+        if not SearchService.is_available():
+            return
+
+        SearchService.delete_from(data_table)
+        start_idx = 0
+        for df in data_table.get_storage().iter_batches(data_table, columns, batch_size):
+            values = {}
+            fallbacks = {}
+            for col in columns:
+                series = df[col.column_index]
+                if col.data_type in ('string', 'unknown'):
+                    values[col.column_index] = series
+                    fallbacks[col.column_index] = pd.Series([None] * len(df), dtype=object)
+                else:
+                    # Los valores no convertibles se leen como texto
+                    fallbacks[col.column_index] = series.where(series.map(lambda value: isinstance(value, str)))
+            # Una transacción por lote: fuera de ella cada inserción se confirmaría por separado
+            with transaction.atomic():
+                SearchService.index_rows(data_table, columns, range(start_idx, start_idx + len(df)), values, fallbacks)
+            start_idx += len(df)
+
+        data_table.search_indexed = True
+        data_table.save(update_fields=['search_indexed'])
+        logger.info(f"Índice de búsqueda de {data_table.table_name} reconstruido: {start_idx} filas")
+
+    @staticmethod
+    def parse_query(text):
+        """
+        Convierte el texto buscado en una expresión MATCH de FTS5: cada palabra
+        entre comillas (sin operadores) y como prefijo, todas obligatorias
+
+        Returns:
+            str: Expresión MATCH, o None si el texto no tiene palabras
+        """
+        terms = TERM_PATTERN.findall(text or '')
+        if not terms:
+            return None
+        return ' '.join(f'"{term}"*' for term in terms)
+
+    @staticmethod
+    def search(data_table, columns, text, limit=None, after=None):
+        """
+        Busca texto en las celdas de una tabla
+
+        Las filas se devuelven en orden de row_index; para la página siguiente
+        se pasa en after el next_after del resultado.
+
+        Args:
+            columns: Definiciones de columnas de la tabla, en orden
+            text: Texto buscado
+            limit: Número máximo de filas. Por defecto SEARCH_DEFAULT_ROWS
+            after: Devolver solo filas con row_index mayor
+
+        Returns:
+            dict: {"rows": [{"row_index", "values", "highlights"}], "next_after"}.
+            highlights es {column_index: HTML con las coincidencias entre <mark>}
+        """
+        max_rows = getattr(settings, 'SEARCH_MAX_ROWS', 1000)
+        limit = min(max(limit or getattr(settings, 'SEARCH_DEFAULT_ROWS', 100), 1), max_rows)
+        match = SearchService.parse_query(text)
+        if match is None or not SearchService.is_available():
+            return {'rows': [], 'next_after': None}
+
+        start_row = max(after + 1, 0) if after is not None else 0
+        if start_row > MAX_ROW_INDEX:
+            return {'rows': [], 'next_after': None}
+
+        # Coincidencias en orden de rowid: las celdas de cada fila van juntas y
+        # basta con leer hasta la fila limit + 1
+        highlights = {}
+        truncated = False
+        with connection.cursor() as cursor:
+            SearchService._ensure_table(cursor)
+            cursor.execute(
+                f"SELECT rowid, highlight({SEARCH_TABLE}, 0, %s, %s) FROM {SEARCH_TABLE} "
+                f"WHERE {SEARCH_TABLE} MATCH %s AND rowid >= %s AND rowid < %s ORDER BY rowid",
+                [MARK_START, MARK_END, match, search_rowid(data_table.id, start_row),
+                 table_rowid_end(data_table.id)]
+            )
+            while not truncated:
+                hits = cursor.fetchmany(500)
+                if not hits:
+                    break
+                for rowid, value in hits:
+                    row_index = (rowid >> COLUMN_BITS) & MAX_ROW_INDEX
+                    if row_index not in highlights and len(highlights) == limit:
+                        truncated = True
+                        break
+                    highlights.setdefault(row_index, {})[rowid & MAX_COLUMN_INDEX] = highlight_html(value)
+
+        if not highlights:
+            return {'rows': [], 'next_after': None}
+
+        # Valores completos de las filas encontradas, leídos del almacenamiento
+        query = TableQuery(columns, limit=len(highlights),
+                           row_ranges=merge_ranges([(row, row + 1) for row in highlights]))
+        rows = []
+        for row in data_table.get_storage().query(data_table, query):
+            if row[0] in highlights:
+                rows.append({'row_index': row[0], 'values': row[1:], 'highlights': highlights[row[0]]})
+        rows = rows[:len(highlights)]
+
+        return {'rows': rows, 'next_after': rows[-1]['row_index'] if truncated and rows else None}
@@ -0,0 +1,41 @@
+import logging
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Valores por defecto de SQLite, para comparar con los de SQLITE_PRAGMAS
+SQLITE_DEFAULT_PRAGMAS = {
+    'journal_mode': 'DELETE',
+    'synchronous': 'FULL',
+    'cache_size': -2000,
+    'mmap_size': 0,
+    'temp_store': 'DEFAULT',
+}
+
+
+def get_sqlite_pragmas():
+    """PRAGMAs que se aplican a cada conexión SQLite (settings.SQLITE_PRAGMAS)"""
+    return getattr(settings, 'SQLITE_PRAGMAS', {})
+
+
+def apply_sqlite_pragmas(db_connection, pragmas):
+    """
+    Aplica PRAGMAs a una conexión sqlite3. Se ejecutan sobre la conexión
+    nativa, fuera de cualquier transacción: journal_mode no se puede cambiar
+    dentro de una.
+
+    Args:
+        db_connection: Conexión sqlite3 (connection.connection en Django)
+        pragmas: Diccionario {nombre: valor}
+    """
+    for name, value in pragmas.items():
+        try:
+            db_connection.execute(f"PRAGMA {name} = {value}")
+        except Exception as e:
+            # Una base de datos bloqueada no debe impedir abrir la conexión
+            logger.warning(f"No se pudo aplicar PRAGMA {name} = {value}: {str(e)}")
+
+
+def read_sqlite_pragmas(db_connection, names):
+    """Valores actuales de los PRAGMAs indicados"""
+    return {name: db_connection.execute(f"PRAGMA {name}").fetchone()[0] for name in names}
@@ -0,0 +1,18 @@
+from .base import StorageBackend, StorageLoader
+from .eav import EAVStorageBackend
+from .parquet import ParquetStorageBackend
+from .sql_table import SQLTableStorageBackend
+
+STORAGE_BACKENDS = {
+    EAVStorageBackend.name: EAVStorageBackend,
+    ParquetStorageBackend.name: ParquetStorageBackend,
+    SQLTableStorageBackend.name: SQLTableStorageBackend,
+}
+
+
+def get_storage_backend(name):
+    """Devuelve una instancia del backend de almacenamiento indicado"""
+    try:
+        return STORAGE_BACKENDS[name]()
+    except KeyError:
+        raise ValueError(f"Backend de almacenamiento desconocido: {name}")
@@ -0,0 +1,341 @@
+import logging
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+# Tipo Arrow de cada tipo de datos de ColumnDefinition
+ARROW_TYPES = {
+    'string': pa.string(),
+    'integer': pa.int64(),
+    'float': pa.float64(),
+    'date': pa.date32(),
+    'datetime': pa.timestamp('us', tz='UTC'),
+    'boolean': pa.bool_(),
+    'unknown': pa.string(),
+}
+
+# Tipo Arrow de las columnas de texto que se leen como códigos de un diccionario
+DICTIONARY_TYPE = pa.dictionary(pa.int32(), pa.string())
+
+
+def storage_column_name(column):
+    """Nombre físico de una columna: por posición, ya que los nombres normalizados pueden repetirse"""
+    return f"c{column.column_index}"
+
+
+def to_arrow_array(values, data_type):
+    """Convierte los valores tipados de una columna en un array Arrow"""
+    arrow_type = ARROW_TYPES.get(data_type, pa.string())
+    if data_type == 'datetime':
+        # pandas usa nanosegundos; Arrow guarda microsegundos
+        return pa.array(values, from_pandas=True).cast(arrow_type, safe=False)
+    return pa.array(values, type=arrow_type, from_pandas=True)
+
+
+def conform_series(series, data_type):
+    """
+    Ajusta una serie leída del almacenamiento al tipo de la columna. Los valores
+    guardados como texto porque no se pudieron convertir quedan como nulos.
+    """
+    if data_type == 'integer':
+        numbers = pd.to_numeric(series, errors='coerce')
+        if pd.api.types.is_float_dtype(numbers):
+            numbers = numbers.where(numbers == np.trunc(numbers))
+        return numbers.astype('Int64')
+    if data_type == 'float':
+        return pd.to_numeric(series, errors='coerce').astype('float64')
+    if data_type == 'date':
+        return pd.to_datetime(series, errors='coerce').dt.date
+    if data_type == 'datetime':
+        return pd.to_datetime(series, errors='coerce', utc=True)
+    if data_type == 'boolean':
+        return series.astype('boolean')
+    return series.astype(str).where(series.notna(), None)
+
+
+def to_record_batch(df, columns):
+    """
+    Convierte un lote de iter_batches (columnas por column_index) en un
+    RecordBatch de Arrow con los tipos de ARROW_TYPES y los nombres físicos
+    """
+    arrays = [to_arrow_array(conform_series(df[col.column_index], col.data_type), col.data_type) for col in columns]
+    return pa.RecordBatch.from_arrays(arrays, names=[storage_column_name(col) for col in columns])
+
+
+def to_python_list(series):
+    """Valores de una serie como objetos de Python, con None para los nulos"""
+    return series.astype(object).where(series.notna(), None).tolist()
+
+
+def row_hashes(values, fallbacks, columns):
+    """
+    Hash estable de cada fila de un lote, a partir de sus valores tipados y
+    del texto de los que no se pudieron convertir. Dos cargas del mismo
+    contenido dan los mismos hashes, lo que permite detectar filas cambiadas.
+
+    Returns:
+        list: Un entero de 64 bits con signo por fila
+    """
+    frame = {}
+    for col in columns:
+        frame[f"v{col.column_index}"] = values[col.column_index].reset_index(drop=True)
+        frame[f"f{col.column_index}"] = fallbacks[col.column_index].reset_index(drop=True)
+    if not frame:
+        return []
+    hashes = pd.util.hash_pandas_object(pd.DataFrame(frame), index=False)
+    return hashes.to_numpy().view(np.int64).tolist()
+
+
+class StorageLoader:
+    """
+    Escritor de una carga: recibe los lotes ya convertidos al tipo de cada
+    columna y los persiste. Se obtiene con StorageBackend.open_loader.
+
+    Attributes:
+        checkpoint: Filas (desde row_index 0) que quedan guardadas al confirmar
+            la transacción del último lote; una carga interrumpida se reanuda
+            desde aquí
+    """
+
+    def __init__(self, data_table, columns, start_row=0):
+        self.data_table = data_table
+        self.columns = columns
+        self.checkpoint = start_row
+
+    def write_batch(self, start_idx, values, fallbacks):
+        """
+        Escribe un lote de filas
+
+        Args:
+            start_idx: row_index de la primera fila del lote
+            values: {column_index: Series con los valores tipados}
+            fallbacks: {column_index: Series con el texto original de los valores
+                que no se pudieron convertir al tipo de la columna (None en el resto)}
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """Termina la carga y publica los datos escritos"""
+
+    def abort(self):
+        """Descarta una carga interrumpida"""
+
+    def _index_search(self, row_indexes, values, fallbacks):
+        """Añade el texto de las filas escritas al índice de búsqueda (ver SearchService)"""
+        from data_models.services.search_service import SearchService
+        SearchService.index_rows(self.data_table, self.columns, row_indexes, values, fallbacks)
+
+
+class IncrementalLoaderMixin:
+    """
+    Recarga incremental: compara el hash de cada fila nueva con el guardado en
+    la misma posición y solo escribe las filas nuevas o cambiadas. Cada lote se
+    aplica en su propia transacción; al cerrar se eliminan las filas que
+    sobran del final de la tabla. Si la recarga se interrumpe después de
+    aplicar algún lote, abort deja la tabla en carga hasta que otra la complete.
+
+    Los backends implementan _stored_hashes, _delete_rows y _delete_from; las
+    filas se escriben con el _write_rows del loader de carga completa, que va
+    después del mixin en la jerarquía. El índice de búsqueda se actualiza solo
+    para las filas cambiadas y eliminadas.
+    """
+
+    # Filas por sentencia al eliminar por row_index (límite de parámetros de SQLite)
+    DELETE_CHUNK_SIZE = 500
+
+    def __init__(self, data_table, columns):
+        super().__init__(data_table, columns)
+        self.row_count = 0
+        self.inserted = 0
+        self.updated = 0
+        self.deleted = 0
+
+    @property
+    def changed(self):
+        return bool(self.inserted or self.updated or self.deleted)
+
+    def write_batch(self, start_idx, values, fallbacks):
+        from data_models.services.search_service import SearchService
+
+        row_count = len(next(iter(values.values()))) if values else 0
+        hashes = row_hashes(values, fallbacks, self.columns)
+        stored = self._stored_hashes(start_idx, start_idx + row_count)
+        self.row_count = start_idx + row_count
+
+        positions = [i for i, row_hash in enumerate(hashes) if stored.get(start_idx + i) != row_hash]
+        if not positions:
+            return
+
+        row_indexes = [start_idx + i for i in positions]
+        replaced = [row_index for row_index in row_indexes if row_index in stored]
+        with transaction.atomic():
+            for i in range(0, len(replaced), self.DELETE_CHUNK_SIZE):
+                self._delete_rows(replaced[i:i + self.DELETE_CHUNK_SIZE])
+            SearchService.delete_rows(self.data_table, replaced)
+            self._write_rows(
+                row_indexes,
+                {index: series.iloc[positions] for index, series in values.items()},
+                {index: series.iloc[positions] for index, series in fallbacks.items()},
+                [hashes[i] for i in positions]
+            )
+        self.updated += len(replaced)
+        self.inserted += len(row_indexes) - len(replaced)
+
+    def close(self):
+        from data_models.services.search_service import SearchService
+
+        with transaction.atomic():
+            self.deleted = self._delete_from(self.row_count)
+            SearchService.delete_from(self.data_table, self.row_count)
+        logger.info(f"Recarga incremental de {self.data_table.table_name}: {self.inserted} filas nuevas, "
+                    f"{self.updated} cambiadas, {self.deleted} eliminadas")
+
+    def abort(self):
+        # Los lotes ya aplicados dejan filas de las dos versiones, que no cuadran
+        # con data_version ni con los perfiles de las columnas: la tabla se oculta
+        # y la siguiente recarga la vuelve a cargar completa (resume_data_table)
+        if self.changed:
+            self.data_table.status = 'loading'
+            self.data_table.loaded_rows = 0
+            self.data_table.save(update_fields=['status', 'loaded_rows'])
+
+    def _stored_hashes(self, start_row, end_row):
+        """{row_index: row_hash} de las filas guardadas en [start_row, end_row)"""
+        raise NotImplementedError
+
+    def _delete_rows(self, row_indexes):
+        """Elimina las filas indicadas"""
+        raise NotImplementedError
+
+    def _delete_from(self, row_index):
+        """Elimina las filas con row_index >= row_index y devuelve cuántas eran"""
+        raise NotImplementedError
+
+
+class StorageBackend:
+    """
+    Interfaz común de almacenamiento de los datos de una DataTable.
+
+    La fábrica de modelos escribe a través de open_loader y las vistas y la
+    exportación leen a través de read_rows e iter_batches, sin conocer la
+    disposición física de los datos.
+    """
+
+    name = None
+
+    def open_loader(self, data_table, columns, start_row=0):
+        """
+        Prepara una carga completa, reemplazando los datos existentes
+
+        Args:
+            start_row: Para reanudar una carga interrumpida: se conservan las
+                filas anteriores ya confirmadas y se descarta el resto. El loader
+                indica en checkpoint desde qué fila continúa realmente, que puede
+                ser anterior si el backend no conserva cargas parciales.
+        """
+        raise NotImplementedError
+
+    def read_rows(self, data_table, columns, start_row, limit, descending=False):
+        """
+        Devuelve una página de filas buscando por row_index (paginación por
+        cursor), de modo que el coste no depende de la profundidad de la página
+
+        Args:
+            start_row: Con descending=False, primera fila de la página
+                (row_index >= start_row); con descending=True, fila siguiente a
+                la última de la página (row_index < start_row)
+            limit: Número máximo de filas
+            descending: Leer hacia atrás, para la página anterior
+
+        Returns:
+            list: Filas en orden ascendente de row_index; cada fila es una lista
+            [row_index, valores en el orden de columns...]
+        """
+        raise NotImplementedError
+
+    def iter_batches(self, data_table, columns, batch_size=10000):
+        """
+        Recorre la tabla completa en orden de row_index
+
+        Yields:
+            DataFrame: Lote con una columna por definición, indexada por column_index
+        """
+        raise NotImplementedError
+
+    def iter_arrow_batches(self, data_table, columns, batch_size=10000):
+        """
+        Recorre la tabla completa en orden de row_index como lotes de Arrow
+
+        Yields:
+            RecordBatch: Lote con una columna por definición (nombres de
+            storage_column_name y tipos de ARROW_TYPES, o DICTIONARY_TYPE en
+            las columnas de arrow_dictionary_columns)
+        """
+        for df in self.iter_batches(data_table, columns, batch_size):
+            yield to_record_batch(df, columns)
+
+    def arrow_dictionary_columns(self, data_table):
+        """column_index de las columnas que iter_arrow_batches devuelve como arrays de diccionario"""
+        return []
+
+    def query(self, data_table, query):
+        """
+        Ejecuta una consulta con filtros, orden, agrupación y agregados dentro
+        del almacenamiento (SQL o Arrow), sin recorrer las filas en Python
+
+        Args:
+            query: TableQuery validada
+
+        Yields:
+            list: Filas del resultado en el orden de query.output_names, como
+            mucho query.fetch_limit
+        """
+        raise NotImplementedError
+
+    def copy(self, source, target, source_columns, target_columns):
+        """
+        Copia los datos de una tabla en otra del mismo backend con las mismas
+        columnas (por column_index), reemplazando los datos de la de destino
+
+        Args:
+            source: Tabla de origen
+            target: Tabla de destino
+            source_columns: Definiciones de columnas del origen, en orden
+            target_columns: Definiciones equivalentes del destino, en el mismo orden
+        """
+        raise NotImplementedError
+
+    def open_incremental_loader(self, data_table, columns):
+        """
+        Prepara una recarga incremental que solo escribe las filas cambiadas
+        (ver IncrementalLoaderMixin)
+
+        Returns:
+            StorageLoader: Loader incremental, o None si el backend o los datos
+            guardados no lo permiten y hay que hacer una carga completa
+        """
+        return None
+
+    def value_index_columns(self, query):
+        """
+        Columnas de una consulta cuyos filtros u orden podría resolver un
+        índice de valores del backend (ver create_value_indexes)
+
+        Returns:
+            list: Definiciones de columnas; vacía si el backend no usa índices
+        """
+        return []
+
+    def create_value_indexes(self, data_table, columns):
+        """
+        Crea índices sobre los valores de las columnas indicadas, si no
+        existen. La fábrica de modelos los crea después de cada carga completa,
+        no durante, para no frenar las inserciones.
+        """
+
+    def delete(self, data_table):
+        """Elimina todos los datos almacenados de la tabla, con sus índices de valores"""
+        raise NotImplementedError
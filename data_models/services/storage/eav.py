@@ -0,0 +1,557 @@
+import logging
+from itertools import repeat
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+from data_models.models import DataRow, DataCell, DataTable, DictionaryValue
+from .base import IncrementalLoaderMixin, StorageBackend, StorageLoader, conform_series, row_hashes, \
+    storage_column_name, to_arrow_array, to_python_list
+from .query import build_query_sql, filter_sql, iter_sql_rows, row_ranges_sql
+
+logger = logging.getLogger(__name__)
+
+# Campo de DataCell que guarda cada tipo de datos
+VALUE_FIELDS = {
+    'string': 'string_value',
+    'integer': 'integer_value',
+    'float': 'float_value',
+    'date': 'date_value',
+    'datetime': 'datetime_value',
+    'boolean': 'boolean_value',
+}
+
+# Campos de DataCell que escribe el loader: los de valor y el código de diccionario
+CELL_FIELDS = tuple(dict.fromkeys(VALUE_FIELDS.values())) + ('string_code',)
+
+
+def adapt_filter_value(value, data_type):
+    """Convierte un valor de filtro al formato con que Django guarda el campo de DataCell"""
+    if data_type == 'datetime':
+        return connection.ops.adapt_datetimefield_value(value)
+    if data_type == 'date':
+        return connection.ops.adapt_datefield_value(value)
+    if data_type == 'boolean':
+        return int(value)
+    return value
+
+
+def value_index_name(data_table, column_index):
+    """Nombre del índice parcial de valores de una columna de la tabla"""
+    return f"datacell_v{data_table.id}_{column_index}"
+
+
+def load_dictionaries(columns):
+    """
+    Diccionarios guardados de las columnas indicadas
+
+    Returns:
+        dict: {column_definition_id: {valor: código}}
+    """
+    dictionaries = {col.id: {} for col in columns}
+    entries = DictionaryValue.objects.filter(column_definition__in=columns).values_list(
+        'column_definition_id', 'value', 'code'
+    )
+    for column_id, value, code in entries:
+        dictionaries[column_id][value] = code
+    return dictionaries
+
+
+def delete_rows(rows):
+    """
+    Elimina filas y sus celdas con dos DELETE ... WHERE row_id IN (SELECT ...),
+    sin pasar por el recolector de Django, que carga en memoria las claves de
+    todas las filas y celdas antes de borrarlas
+
+    Args:
+        rows: QuerySet de DataRow
+
+    Returns:
+        int: Número de filas eliminadas
+    """
+    quote = connection.ops.quote_name
+    ids_sql, params = rows.values('id').query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {quote(DataCell._meta.db_table)} WHERE row_id IN ({ids_sql})", params)
+        cursor.execute(f"DELETE FROM {quote(DataRow._meta.db_table)} WHERE id IN ({ids_sql})", params)
+        return cursor.rowcount
+
+
+def delete_unused_dictionary_values(columns):
+    """
+    Elimina de los diccionarios de las columnas indicadas los valores que ya no
+    usa ninguna celda (filas borradas o cambiadas). Los códigos de cada columna
+    se leen una sola vez con el índice de column_definition_id.
+
+    Returns:
+        int: Número de valores eliminados
+    """
+    quote = connection.ops.quote_name
+    deleted = 0
+    with connection.cursor() as cursor:
+        for col in columns:
+            cursor.execute(
+                f"DELETE FROM {quote(DictionaryValue._meta.db_table)} "
+                f"WHERE column_definition_id = %s AND code NOT IN ("
+                f"SELECT string_code FROM {quote(DataCell._meta.db_table)} "
+                f"WHERE column_definition_id = %s AND string_code IS NOT NULL)",
+                [col.id, col.id]
+            )
+            deleted += cursor.rowcount
+    return deleted
+
+
+class EAVStorageLoader(StorageLoader):
+    """
+    Carga en las tablas DataRow/DataCell, una fila de DataCell por celda. Las
+    filas y las celdas se escriben con executemany sobre una sentencia
+    preparada, sin crear instancias de modelo, con los valores convertidos
+    como lo haría el ORM.
+
+    Las columnas de texto que repiten valores guardan en cada celda el código
+    de su valor en el diccionario de la columna (DictionaryValue). Una carga
+    completa las elige con su primer lote; al reanudarla o en las recargas
+    incrementales se siguen usando las de la tabla y sus diccionarios crecen
+    con los valores nuevos.
+    """
+
+    def __init__(self, data_table, columns, start_row=0):
+        super().__init__(data_table, columns, start_row)
+        self.choose_dictionaries = not start_row
+        self.dictionaries = load_dictionaries(
+            [col for col in columns if col.column_index in data_table.dictionary_columns]
+        )
+
+    def write_batch(self, start_idx, values, fallbacks):
+        if self.choose_dictionaries:
+            self._choose_dictionary_columns(values)
+        row_count = len(next(iter(values.values()))) if values else 0
+        hashes = row_hashes(values, fallbacks, self.columns)
+        self._write_rows(range(start_idx, start_idx + row_count), values, fallbacks, hashes)
+        self.checkpoint = start_idx + row_count
+
+    def _choose_dictionary_columns(self, values):
+        """
+        Elige las columnas de texto con diccionario: las que en el lote tienen
+        como mucho DATA_TABLE_DICTIONARY_MAX_RATIO valores distintos por valor
+        no nulo. La elección se guarda en la transacción del lote.
+        """
+        max_ratio = getattr(settings, 'DATA_TABLE_DICTIONARY_MAX_RATIO', 0.5)
+        chosen = []
+        for col in self.columns:
+            if col.data_type != 'string':
+                continue
+            present = int(values[col.column_index].notna().sum())
+            if present and values[col.column_index].nunique() <= present * max_ratio:
+                chosen.append(col)
+
+        self.choose_dictionaries = False
+        self.dictionaries = {col.id: {} for col in chosen}
+        self.data_table.dictionary_columns = [col.column_index for col in chosen]
+        DataTable.objects.filter(id=self.data_table.id).update(dictionary_columns=self.data_table.dictionary_columns)
+        if chosen:
+            logger.info(f"Columnas con diccionario en {self.data_table.table_name}: {[col.name for col in chosen]}")
+
+    def _write_rows(self, row_indexes, values, fallbacks, hashes):
+        row_indexes = list(row_indexes)
+        if not row_indexes:
+            return
+
+        quote = connection.ops.quote_name
+        row_table = quote(DataRow._meta.db_table)
+        cell_table = quote(DataCell._meta.db_table)
+        created_at = connection.ops.adapt_datetimefield_value(timezone.now())
+
+        with connection.cursor() as cursor:
+            # Crear filas y recuperar sus IDs por el índice (table, row_index)
+            cursor.executemany(
+                f"INSERT INTO {row_table} (table_id, row_index, row_hash, created_at) VALUES (%s, %s, %s, %s)",
+                [(self.data_table.id, row_index, row_hash, created_at)
+                 for row_index, row_hash in zip(row_indexes, hashes)]
+            )
+            cursor.execute(
+                f"SELECT row_index, id FROM {row_table} WHERE table_id = %s AND row_index >= %s AND row_index <= %s",
+                [self.data_table.id, min(row_indexes), max(row_indexes)]
+            )
+            row_ids = dict(cursor.fetchall())
+            ids = [row_ids[row_index] for row_index in row_indexes]
+
+            # Crear celdas: una tupla por celda, fila a fila, con una columna de
+            # valor por tipo de datos
+            columns = [
+                self._cell_values(col, ids, values[col.column_index], fallbacks[col.column_index],
+                                  self._encode(cursor, col, values[col.column_index], fallbacks[col.column_index]))
+                for col in self.columns
+            ]
+            cells = [cell for row_cells in zip(*columns) for cell in row_cells]
+            cursor.executemany(
+                f"INSERT INTO {cell_table} (row_id, column_definition_id, "
+                f"{', '.join(quote(field) for field in CELL_FIELDS)}) "
+                f"VALUES (%s, %s, {', '.join(['%s'] * len(CELL_FIELDS))})",
+                cells
+            )
+        self._index_search(row_indexes, values, fallbacks)
+        logger.info(f"Lote procesado: {len(ids)} filas, {len(cells)} celdas")
+
+    def _encode(self, cursor, col, values, fallbacks):
+        """
+        Códigos de diccionario del texto de una columna, calculados con
+        pd.factorize sobre el lote; los valores que aún no están en el
+        diccionario se añaden con códigos consecutivos tras el mayor existente
+
+        Returns:
+            list: Código de cada celda (None en las nulas), o None si la
+            columna no tiene diccionario
+        """
+        dictionary = self.dictionaries.get(col.id)
+        if dictionary is None:
+            return None
+
+        codes, uniques = pd.factorize(fallbacks.where(fallbacks.notna(), values))
+        if not len(uniques):
+            return [None] * len(codes)
+
+        new_values = [value for value in uniques if value not in dictionary]
+        if new_values:
+            # Tras eliminar valores sin uso quedan huecos: len(dictionary) no es el siguiente código
+            next_code = max(dictionary.values(), default=-1) + 1
+            entries = [(col.id, next_code + i, value) for i, value in enumerate(new_values)]
+            cursor.executemany(
+                f"INSERT INTO {connection.ops.quote_name(DictionaryValue._meta.db_table)} "
+                f"(column_definition_id, code, value) VALUES (%s, %s, %s)",
+                entries
+            )
+            dictionary.update((value, code) for _, code, value in entries)
+
+        # Código del diccionario de cada valor distinto del lote, aplicado a todas las celdas
+        mapping = np.array([dictionary[value] for value in uniques], dtype=np.int64)
+        encoded = mapping[codes].astype(object)
+        encoded[codes < 0] = None
+        return encoded.tolist()
+
+    @staticmethod
+    def _cell_values(col, ids, values, fallbacks, codes=None):
+        """
+        Tuplas (row_id, column_definition_id, *CELL_FIELDS) de las celdas de una
+        columna. Los valores que no se pudieron convertir se guardan como texto
+        y, en las columnas con diccionario, el texto se sustituye por su código.
+        """
+        slots = [repeat(None)] * len(CELL_FIELDS)
+        if codes is not None:
+            slots[CELL_FIELDS.index('string_code')] = codes
+            return list(zip(ids, repeat(col.id), *slots))
+
+        field = VALUE_FIELDS.get(col.data_type, 'string_value')
+        typed = to_python_list(values)
+        if col.data_type == 'date':
+            typed = [connection.ops.adapt_datefield_value(value) for value in typed]
+        elif col.data_type == 'datetime':
+            typed = [connection.ops.adapt_datetimefield_value(value) for value in typed]
+
+        fallbacks = to_python_list(fallbacks)
+        if field == 'string_value':
+            slots[CELL_FIELDS.index(field)] = [
+                fallback if fallback is not None else value for value, fallback in zip(typed, fallbacks)
+            ]
+        else:
+            slots[CELL_FIELDS.index('string_value')] = fallbacks
+            slots[CELL_FIELDS.index(field)] = typed
+        return list(zip(ids, repeat(col.id), *slots))
+
+
+class EAVIncrementalLoader(IncrementalLoaderMixin, EAVStorageLoader):
+    """Recarga incremental sobre DataRow/DataCell usando DataRow.row_hash"""
+
+    def __init__(self, data_table, columns):
+        super().__init__(data_table, columns)
+        # Las celdas que no cambian conservan sus códigos: se mantienen las columnas con diccionario
+        self.choose_dictionaries = False
+
+    def _stored_hashes(self, start_row, end_row):
+        return dict(DataRow.objects.filter(
+            table=self.data_table, row_index__gte=start_row, row_index__lt=end_row
+        ).values_list('row_index', 'row_hash'))
+
+    def _delete_rows(self, row_indexes):
+        delete_rows(DataRow.objects.filter(table=self.data_table, row_index__in=row_indexes))
+
+    def _delete_from(self, row_index):
+        return delete_rows(DataRow.objects.filter(table=self.data_table, row_index__gte=row_index))
+
+    def close(self):
+        super().close()
+        if self.changed:
+            deleted = delete_unused_dictionary_values(
+                [col for col in self.columns if col.id in self.dictionaries]
+            )
+            if deleted:
+                logger.info(f"{deleted} valores sin uso eliminados de los diccionarios de "
+                            f"{self.data_table.table_name}")
+
+
+class EAVStorageBackend(StorageBackend):
+    """
+    Almacenamiento genérico entidad-atributo-valor: una DataRow por fila y una
+    DataCell por celda, con una columna de valor por tipo de datos.
+    """
+
+    name = 'eav'
+
+    def open_loader(self, data_table, columns, start_row=0):
+        if start_row:
+            delete_rows(DataRow.objects.filter(table=data_table, row_index__gte=start_row))
+            delete_unused_dictionary_values(
+                [col for col in columns if col.column_index in data_table.dictionary_columns]
+            )
+        else:
+            self.delete(data_table)
+        return EAVStorageLoader(data_table, columns, start_row)
+
+    def open_incremental_loader(self, data_table, columns):
+        return EAVIncrementalLoader(data_table, columns)
+
+    def read_rows(self, data_table, columns, start_row, limit, descending=False):
+        return self._read_rows(data_table, columns, start_row, limit, descending)
+
+    def _read_rows(self, data_table, columns, start_row, limit, descending=False, encoded=False):
+        """
+        read_rows; con encoded=True las columnas con diccionario devuelven el
+        código de cada celda en lugar del texto (ver iter_arrow_batches)
+        """
+        # Ventana de filas buscada por el índice (table, row_index)
+        rows = DataRow.objects.filter(table=data_table)
+        if descending:
+            rows = rows.filter(row_index__lt=start_row).order_by('-row_index')
+        else:
+            rows = rows.filter(row_index__gte=start_row).order_by('row_index')
+
+        # Una sola consulta para todas las celdas de la ventana de filas
+        cells = DataCell.objects.filter(row_id__in=rows.values('id')[:limit]).order_by(
+            'row__row_index', 'column_definition__column_index'
+        )
+        fields = CELL_FIELDS
+        if data_table.dictionary_columns and not encoded:
+            # El texto de las celdas con código se decodifica en la misma consulta
+            cells = cells.with_string_text()
+            fields = tuple('string_text' if field == 'string_value' else field for field in CELL_FIELDS)
+        cells = cells.values_list('row__row_index', 'column_definition_id', *fields)
+
+        # Posición de cada columna en la fila y del campo que guarda su valor
+        slots = {col.id: i for i, col in enumerate(columns, start=1)}
+        value_positions = {
+            col.id: 2 + CELL_FIELDS.index(
+                'string_code' if encoded and col.column_index in data_table.dictionary_columns
+                else VALUE_FIELDS.get(col.data_type, 'string_value')
+            )
+            for col in columns
+        }
+        string_position = 2 + CELL_FIELDS.index('string_value')
+
+        result = []
+        current_row_index = None
+        for cell in cells:
+            row_index, column_id = cell[0], cell[1]
+            if row_index != current_row_index:
+                current_row_index = row_index
+                row_data = [row_index] + [None] * len(columns)
+                result.append(row_data)
+
+            slot = slots.get(column_id)
+            if slot is not None:
+                value = cell[value_positions[column_id]]
+                # Los valores no convertibles se guardaron como texto
+                row_data[slot] = value if value is not None else cell[string_position]
+        return result
+
+    def query(self, data_table, query):
+        # Pivote de las celdas a una fila con una columna c{column_index} por
+        # columna usada en la consulta, sobre el que se aplica la consulta
+        quote = connection.ops.quote_name
+        pivot = ['row.row_index AS row_index']
+        params = []
+        dictionary_table = quote(DictionaryValue._meta.db_table)
+        for col in query.referenced_columns:
+            # Solo el campo tipado: el texto de los valores no convertibles cuenta
+            # como nulo, igual que en los backends parquet y sql
+            value = f"cell.{quote(VALUE_FIELDS.get(col.data_type, 'string_value'))}"
+            if col.column_index in data_table.dictionary_columns:
+                value = (f"(SELECT {quote('value')} FROM {dictionary_table} "
+                         f"WHERE column_definition_id = {int(col.id)} AND code = cell.{quote('string_code')})")
+            pivot.append(f"MAX(CASE WHEN cell.column_definition_id = %s THEN {value} END) "
+                         f"AS {quote(storage_column_name(col))}")
+            params.append(col.id)
+
+        # Solo las celdas de las columnas usadas
+        join = ''
+        if params:
+            join = (f"LEFT JOIN {quote(DataCell._meta.db_table)} cell ON cell.row_id = row.id "
+                    f"AND cell.column_definition_id IN ({', '.join(['%s'] * len(params))}) ")
+            params = params + params
+        # Las zonas descartadas por los perfiles no se llegan a pivotar
+        where = 'row.table_id = %s'
+        params.append(data_table.id)
+        if query.row_ranges is not None:
+            condition, range_params = row_ranges_sql('row.row_index', query.row_ranges)
+            where += f" AND {condition}"
+            params.extend(range_params)
+        # Los filtros de columnas con índice de valores eligen las filas antes
+        # del pivote; el id de la columna va como literal para que SQLite
+        # reconozca el índice parcial
+        for col, operator, value in query.filters:
+            if col.column_index not in data_table.value_indexes or operator == 'contains':
+                continue
+            field = quote(VALUE_FIELDS.get(col.data_type, 'string_value'))
+            condition, filter_params = filter_sql(field, operator, value, col.data_type, adapt_filter_value)
+            if col.column_index in data_table.dictionary_columns:
+                # El filtro se evalúa sobre el diccionario y el índice busca sus códigos
+                code = quote('string_code')
+                if operator == 'isnull':
+                    condition = f"{code} IS NULL" if value else f"{code} IS NOT NULL"
+                else:
+                    condition, filter_params = filter_sql(quote('value'), operator, value, col.data_type,
+                                                          adapt_filter_value)
+                    condition = (f"{code} IN (SELECT code FROM {dictionary_table} "
+                                 f"WHERE column_definition_id = {int(col.id)} AND {condition})")
+            where += (f" AND row.id IN (SELECT row_id FROM {quote(DataCell._meta.db_table)} "
+                      f"WHERE column_definition_id = {int(col.id)} AND {condition})")
+            params.extend(filter_params)
+        source = (
+            f"(SELECT {', '.join(pivot)} FROM {quote(DataRow._meta.db_table)} row {join}"
+            f"WHERE {where} GROUP BY row.id, row.row_index)"
+        )
+
+        sql, params = build_query_sql(source, params, query, adapt_filter_value)
+        yield from iter_sql_rows(sql, params, query)
+
+    def iter_batches(self, data_table, columns, batch_size=10000):
+        # Recorrer la tabla por páginas de row_index con los valores ya tipados
+        start_row = 0
+        while True:
+            rows = self.read_rows(data_table, columns, start_row, batch_size)
+            if not rows:
+                break
+
+            yield pd.DataFrame([row[1:] for row in rows], columns=[col.column_index for col in columns])
+            start_row = rows[-1][0] + 1
+
+    def iter_arrow_batches(self, data_table, columns, batch_size=10000):
+        # Las columnas con diccionario pasan sus códigos a arrays de diccionario
+        # de Arrow, sin decodificar el texto de cada celda
+        dictionaries = {
+            col.column_index: pa.array(
+                DictionaryValue.objects.filter(column_definition=col).order_by('code').values_list('value', flat=True),
+                type=pa.string()
+            )
+            for col in columns if col.column_index in data_table.dictionary_columns
+        }
+        if not dictionaries:
+            yield from super().iter_arrow_batches(data_table, columns, batch_size)
+            return
+
+        start_row = 0
+        while True:
+            rows = self._read_rows(data_table, columns, start_row, batch_size, encoded=True)
+            if not rows:
+                break
+
+            arrays = []
+            for i, col in enumerate(columns, start=1):
+                column_values = [row[i] for row in rows]
+                if col.column_index in dictionaries:
+                    arrays.append(pa.DictionaryArray.from_arrays(
+                        pa.array(column_values, type=pa.int32()), dictionaries[col.column_index]
+                    ))
+                else:
+                    series = conform_series(pd.Series(column_values), col.data_type)
+                    arrays.append(to_arrow_array(series, col.data_type))
+            yield pa.RecordBatch.from_arrays(arrays, names=[storage_column_name(col) for col in columns])
+            start_row = rows[-1][0] + 1
+
+    def arrow_dictionary_columns(self, data_table):
+        return list(data_table.dictionary_columns)
+
+    def copy(self, source, target, source_columns, target_columns):
+        self.delete(target)
+
+        quote = connection.ops.quote_name
+        row_table = quote(DataRow._meta.db_table)
+        cell_table = quote(DataCell._meta.db_table)
+        value_fields = ', '.join(quote(field) for field in CELL_FIELDS)
+        source_values = ', '.join(f"cell.{quote(field)}" for field in CELL_FIELDS)
+
+        # Columna de destino de cada columna de origen, por posición
+        column_map = ' '.join(
+            f"WHEN {source_col.id} THEN {target_col.id}"
+            for source_col, target_col in zip(source_columns, target_columns)
+        )
+
+        # Dos sentencias INSERT ... SELECT: las filas y luego sus celdas, sin
+        # pasar los valores por Python
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {row_table} (table_id, row_index, row_hash, created_at) "
+                f"SELECT %s, row_index, row_hash, %s FROM {row_table} WHERE table_id = %s",
+                [target.id, connection.ops.adapt_datetimefield_value(timezone.now()), source.id]
+            )
+            if not column_map:
+                return
+            cursor.execute(
+                f"INSERT INTO {cell_table} (row_id, column_definition_id, {value_fields}) "
+                f"SELECT target_row.id, CASE cell.column_definition_id {column_map} END, {source_values} "
+                f"FROM {cell_table} cell "
+                f"JOIN {row_table} source_row ON source_row.id = cell.row_id "
+                f"JOIN {row_table} target_row ON target_row.table_id = %s "
+                f"AND target_row.row_index = source_row.row_index "
+                f"WHERE source_row.table_id = %s AND cell.column_definition_id IN "
+                f"({', '.join(str(col.id) for col in source_columns)})",
+                [target.id, source.id]
+            )
+            # Los diccionarios se copian con los mismos códigos
+            cursor.execute(
+                f"INSERT INTO {quote(DictionaryValue._meta.db_table)} (column_definition_id, code, value) "
+                f"SELECT CASE column_definition_id {column_map} END, code, value "
+                f"FROM {quote(DictionaryValue._meta.db_table)} WHERE column_definition_id IN "
+                f"({', '.join(str(col.id) for col in source_columns)})"
+            )
+        target.dictionary_columns = list(source.dictionary_columns)
+        DataTable.objects.filter(id=target.id).update(dictionary_columns=target.dictionary_columns)
+
+    def value_index_columns(self, query):
+        # Los índices solo sirven a los filtros: el orden se aplica después del pivote
+        return list({
+            col.column_index: col for col, operator, _ in query.filters
+            if operator != 'contains'
+        }.values())
+
+    def create_value_indexes(self, data_table, columns):
+        # Índices parciales (valor, row_id) limitados a las celdas de cada
+        # columna; en las columnas con diccionario, (código, row_id)
+        quote = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            for col in columns:
+                field = quote(VALUE_FIELDS.get(col.data_type, 'string_value'))
+                if col.column_index in data_table.dictionary_columns:
+                    field = quote('string_code')
+                name = quote(value_index_name(data_table, col.column_index))
+                cursor.execute(
+                    f"CREATE INDEX IF NOT EXISTS {name} ON {quote(DataCell._meta.db_table)} ({field}, row_id) "
+                    f"WHERE column_definition_id = {int(col.id)}"
+                )
+                if connection.vendor == 'sqlite':
+                    # Sin estadísticas SQLite no distingue el índice parcial del
+                    # de column_definition_id; ANALYZE solo recorre este índice
+                    cursor.execute(f"ANALYZE {name}")
+
+    def delete(self, data_table):
+        # Sin los índices de valores, el borrado y la carga siguiente no tienen que mantenerlos
+        with connection.cursor() as cursor:
+            for column_index in data_table.value_indexes:
+                cursor.execute(f"DROP INDEX IF EXISTS "
+                               f"{connection.ops.quote_name(value_index_name(data_table, column_index))}")
+        delete_rows(DataRow.objects.filter(table=data_table))
+
+        DictionaryValue.objects.filter(column_definition__sheet=data_table.sheet_id).delete()
+        data_table.dictionary_columns = []
+        DataTable.objects.filter(id=data_table.id).update(dictionary_columns=[])
@@ -0,0 +1,383 @@
+import logging
+import os
+import shutil
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from django.conf import settings
+from .base import ARROW_TYPES, StorageBackend, StorageLoader, storage_column_name, to_arrow_array
+
+logger = logging.getLogger(__name__)
+
+
+def get_table_dir(data_table):
+    """Directorio con las partes Parquet de una tabla"""
+    base_dir = getattr(settings, 'DATA_TABLE_PARQUET_DIR', os.path.join(settings.MEDIA_ROOT, 'tables'))
+    return os.path.join(base_dir, str(data_table.id))
+
+
+def build_schema(columns):
+    """Esquema Arrow de la tabla a partir de sus definiciones de columnas"""
+    fields = [pa.field('row_index', pa.int64(), nullable=False)]
+    for col in columns:
+        fields.append(pa.field(storage_column_name(col), ARROW_TYPES.get(col.data_type, pa.string())))
+    return pa.schema(fields)
+
+
+# Función de agregación de Arrow equivalente a cada función SQL
+ARROW_AGGREGATES = {
+    'count': 'count',
+    'sum': 'sum',
+    'avg': 'mean',
+    'min': 'min',
+    'max': 'max',
+}
+
+
+def build_filter(filters):
+    """Expresión de Arrow con los filtros de una TableQuery, o None si no hay"""
+    expression = None
+    for col, operator, value in filters:
+        field = pc.field(storage_column_name(col))
+        arrow_type = ARROW_TYPES.get(col.data_type, pa.string())
+        if operator == 'isnull':
+            condition = field.is_null() if value else field.is_valid()
+        elif operator == 'in':
+            condition = field.isin(pa.array(value, type=arrow_type))
+        elif operator == 'contains':
+            condition = pc.match_substring(field.cast(pa.string()), str(value))
+        else:
+            scalar = pa.scalar(value, type=arrow_type)
+            condition = {
+                'eq': field == scalar,
+                'ne': field != scalar,
+                'lt': field < scalar,
+                'lte': field <= scalar,
+                'gt': field > scalar,
+                'gte': field >= scalar,
+            }[operator]
+        expression = condition if expression is None else expression & condition
+    return expression
+
+
+def build_row_ranges_filter(ranges):
+    """Expresión de Arrow que limita row_index a los rangos [inicio, fin) indicados"""
+    field = pc.field('row_index')
+    expression = pc.scalar(False)
+    for start, end in ranges:
+        expression = expression | ((field >= start) & (field < end))
+    return expression
+
+
+def top_rows(table, sort_keys, k):
+    """
+    Las k primeras filas de una tabla de Arrow según sort_keys, sin ordenar.
+    pc.select_k_unstable descarta las filas con nulo en la primera clave, que
+    en el orden de las consultas van al final: con nulos se ordena y se corta.
+    """
+    if table.num_rows <= k:
+        return table
+    if table.column(sort_keys[0][0]).null_count == 0:
+        return table.take(pc.select_k_unstable(table, k, sort_keys))
+    return table.sort_by(sort_keys).slice(0, k)
+
+
+def table_rows(table, names):
+    """Filas de una tabla de Arrow como listas en el orden de names"""
+    return map(list, zip(*(table.column(name).to_pylist() for name in names)))
+
+
+class ParquetStorageLoader(StorageLoader):
+    """
+    Carga en partes Parquet. Los lotes se acumulan hasta completar un grupo de
+    filas y cada parte se cierra al alcanzar DATA_TABLE_PARQUET_PART_ROWS. La
+    carga se escribe en un directorio temporal que reemplaza al anterior al
+    cerrar, de modo que una recarga nunca deja la tabla a medias.
+
+    Solo las partes cerradas son archivos completos: el checkpoint avanza al
+    cerrar cada parte y una carga reanudada conserva las partes cerradas del
+    directorio temporal.
+    """
+
+    def __init__(self, data_table, columns, start_row=0):
+        super().__init__(data_table, columns)
+        self.schema = build_schema(columns)
+        self.table_dir = get_table_dir(data_table)
+        self.loading_dir = f"{self.table_dir}.loading"
+        self.row_group_size = getattr(settings, 'DATA_TABLE_PARQUET_ROW_GROUP_SIZE', 50000)
+        self.part_rows = getattr(settings, 'DATA_TABLE_PARQUET_PART_ROWS', 1000000)
+
+        self.pending = []
+        self.pending_rows = 0
+        self.writer = None
+        self.part_idx = 0
+        self.part_rows_written = 0
+        self.discarded = 0
+
+        if start_row and os.path.isdir(self.loading_dir):
+            self._resume(start_row)
+        else:
+            shutil.rmtree(self.loading_dir, ignore_errors=True)
+            os.makedirs(self.loading_dir)
+
+    def _resume(self, start_row):
+        """Conserva las partes cerradas que no pasan de start_row y elimina las demás"""
+        keep = True
+        for name in sorted(name for name in os.listdir(self.loading_dir) if name.endswith('.parquet')):
+            path = os.path.join(self.loading_dir, name)
+            rows = None
+            if keep:
+                try:
+                    rows = pq.read_metadata(path).num_rows
+                except Exception:
+                    # Parte que se estaba escribiendo: sin pie de archivo
+                    rows = None
+            if rows is None or self.checkpoint + rows > start_row:
+                keep = False
+                os.remove(path)
+                continue
+            self.checkpoint += rows
+            self.part_idx += 1
+
+    def write_batch(self, start_idx, values, fallbacks):
+        row_count = len(next(iter(values.values()))) if values else 0
+        arrays = [pa.array(range(start_idx, start_idx + row_count), type=pa.int64())]
+        for col in self.columns:
+            arrays.append(to_arrow_array(values[col.column_index], col.data_type))
+            # Los valores que no se pudieron convertir quedan como nulos
+            self.discarded += int(fallbacks[col.column_index].notna().sum())
+
+        self.pending.append(pa.Table.from_arrays(arrays, schema=self.schema))
+        self.pending_rows += row_count
+        # El índice de búsqueda guarda también el texto de los valores no convertibles
+        self._index_search(range(start_idx, start_idx + row_count), values, fallbacks)
+        if self.pending_rows >= self.row_group_size:
+            self._flush()
+
+    def _flush(self):
+        if not self.pending:
+            return
+
+        if self.writer is None:
+            path = os.path.join(self.loading_dir, f"part-{self.part_idx:05d}.parquet")
+            self.writer = pq.ParquetWriter(path, self.schema)
+
+        table = pa.concat_tables(self.pending)
+        self.writer.write_table(table, row_group_size=self.row_group_size)
+        self.part_rows_written += table.num_rows
+        self.pending = []
+        self.pending_rows = 0
+
+        if self.part_rows_written >= self.part_rows:
+            self.writer.close()
+            self.writer = None
+            self.part_idx += 1
+            self.checkpoint += self.part_rows_written
+            self.part_rows_written = 0
+
+    def close(self):
+        self._flush()
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+        if self.discarded:
+            logger.warning(f"Tabla {self.data_table.table_name}: {self.discarded} valores no convertibles "
+                           f"se guardaron como nulos en Parquet")
+
+        shutil.rmtree(self.table_dir, ignore_errors=True)
+        os.replace(self.loading_dir, self.table_dir)
+
+    def abort(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+        shutil.rmtree(self.loading_dir, ignore_errors=True)
+
+
+class ParquetStorageBackend(StorageBackend):
+    """
+    Almacenamiento columnar: cada tabla es un directorio de partes Parquet con
+    grupos de filas, ordenadas por row_index.
+    """
+
+    name = 'parquet'
+
+    def open_loader(self, data_table, columns, start_row=0):
+        return ParquetStorageLoader(data_table, columns, start_row)
+
+    def _parts(self, data_table):
+        table_dir = get_table_dir(data_table)
+        if not os.path.isdir(table_dir):
+            return []
+        return [os.path.join(table_dir, name) for name in sorted(os.listdir(table_dir)) if name.endswith('.parquet')]
+
+    def read_rows(self, data_table, columns, start_row, limit, descending=False):
+        names = ['row_index'] + [storage_column_name(col) for col in columns]
+        groups = [
+            (parquet_file, group)
+            for parquet_file in map(pq.ParquetFile, self._parts(data_table))
+            for group in range(parquet_file.num_row_groups)
+        ]
+        if descending:
+            groups.reverse()
+
+        # Leer solo los grupos de filas cuyo rango de row_index cubre la página
+        tables = []
+        found = 0
+        for parquet_file, group in groups:
+            statistics = parquet_file.metadata.row_group(group).column(0).statistics
+            if statistics is not None and statistics.has_min_max:
+                if descending and statistics.min >= start_row:
+                    continue
+                if not descending and statistics.max < start_row:
+                    continue
+
+            table = parquet_file.read_row_group(group, columns=names)
+            if descending:
+                table = table.filter(pc.less(table['row_index'], start_row))
+                table = table.slice(max(table.num_rows - (limit - found), 0))
+            else:
+                table = table.filter(pc.greater_equal(table['row_index'], start_row))
+                table = table.slice(0, limit - found)
+
+            tables.append(table)
+            found += table.num_rows
+            if found >= limit:
+                break
+
+        if descending:
+            tables.reverse()
+        result = []
+        for table in tables:
+            result.extend(map(list, zip(*(table.column(name).to_pylist() for name in names))))
+        return result
+
+    def query(self, data_table, query):
+        parts = self._parts(data_table)
+        if not parts:
+            return
+
+        expression = build_filter(query.filters)
+        if query.row_ranges is not None:
+            # Con las estadísticas de row_index se saltan grupos de filas enteros
+            ranges = build_row_ranges_filter(query.row_ranges)
+            expression = ranges if expression is None else expression & ranges
+        if query.is_aggregate:
+            yield from self._aggregate(ds.dataset(parts, format='parquet'), query, expression)
+            return
+
+        names = ['row_index'] + [storage_column_name(col) for col in query.select]
+        if query.sort:
+            # El orden se resuelve en Arrow sobre las columnas necesarias. Solo
+            # se conservan las offset + límite primeras filas vistas hasta el
+            # momento, así que la memoria no depende de las filas que cumplen
+            # los filtros (la API limita el límite a QUERY_MAX_ROWS)
+            sort_names = [storage_column_name(col) for col, _ in query.sort]
+            sort_keys = [
+                (storage_column_name(col), 'descending' if descending else 'ascending')
+                for col, descending in query.sort
+            ]
+            # Arrow deja los nulos al final, igual que build_query_sql en los
+            # backends SQL; row_index desempata y hace el resultado estable
+            sort_keys.append(('row_index', 'ascending'))
+            k = query.offset + query.fetch_limit
+
+            top = None
+            batches = ds.dataset(parts, format='parquet').to_batches(
+                columns=list(dict.fromkeys(names + sort_names)), filter=expression
+            )
+            for batch in batches:
+                if not batch.num_rows:
+                    continue
+                candidates = pa.Table.from_batches([batch])
+                if top is not None:
+                    candidates = pa.concat_tables([top, candidates])
+                top = top_rows(candidates, sort_keys, k)
+            if top is None:
+                return
+
+            top = top.sort_by(sort_keys)
+            yield from table_rows(top.slice(query.offset, query.fetch_limit), names)
+            return
+
+        # Sin orden: las partes ya están ordenadas por row_index y se leen hasta
+        # completar el límite
+        skip = query.offset
+        remaining = query.fetch_limit
+        for path in parts:
+            batches = ds.dataset(path, format='parquet').to_batches(
+                columns=names, filter=expression, use_threads=False
+            )
+            for batch in batches:
+                if skip >= batch.num_rows:
+                    skip -= batch.num_rows
+                    continue
+                batch = batch.slice(skip, remaining)
+                skip = 0
+                yield from table_rows(batch, names)
+                remaining -= batch.num_rows
+                if remaining <= 0:
+                    return
+
+    def _aggregate(self, dataset, query, expression):
+        keys = [storage_column_name(col) for col in query.group_by]
+        aggregations = []
+        result_names = {}
+        for function, col, alias in query.aggregates:
+            if col is None:
+                aggregations.append(([], 'count_all'))
+                result_names[alias] = 'count_all'
+            else:
+                name = storage_column_name(col)
+                aggregations.append((name, ARROW_AGGREGATES[function]))
+                result_names[alias] = f"{name}_{ARROW_AGGREGATES[function]}"
+
+        needed = keys + [name for name, _ in aggregations if name]
+        table = dataset.to_table(columns=list(dict.fromkeys(needed)), filter=expression)
+        result = table.group_by(keys).aggregate(aggregations)
+
+        if query.sort:
+            result = result.sort_by([
+                (result_names[key] if isinstance(key, str) else storage_column_name(key),
+                 'descending' if descending else 'ascending')
+                for key, descending in query.sort
+            ])
+        result = result.slice(query.offset, query.fetch_limit)
+        yield from table_rows(result, keys + [result_names[alias] for _, _, alias in query.aggregates])
+
+    def iter_batches(self, data_table, columns, batch_size=10000):
+        names = [storage_column_name(col) for col in columns]
+        for path in self._parts(data_table):
+            parquet_file = pq.ParquetFile(path)
+            for batch in parquet_file.iter_batches(batch_size=batch_size, columns=names):
+                df = batch.to_pandas()
+                df.columns = [col.column_index for col in columns]
+                yield df
+
+    def iter_arrow_batches(self, data_table, columns, batch_size=10000):
+        # Los lotes ya están en los tipos de Arrow: se devuelven sin pasar por pandas
+        names = [storage_column_name(col) for col in columns]
+        for path in self._parts(data_table):
+            yield from pq.ParquetFile(path).iter_batches(batch_size=batch_size, columns=names)
+
+    def copy(self, source, target, source_columns, target_columns):
+        # Las partes no se modifican nunca (una recarga escribe un directorio
+        # nuevo), así que se pueden compartir con enlaces duros
+        target_dir = get_table_dir(target)
+        loading_dir = f"{target_dir}.loading"
+        shutil.rmtree(loading_dir, ignore_errors=True)
+        os.makedirs(loading_dir)
+        for path in self._parts(source):
+            destination = os.path.join(loading_dir, os.path.basename(path))
+            try:
+                os.link(path, destination)
+            except OSError:
+                shutil.copy2(path, destination)
+
+        shutil.rmtree(target_dir, ignore_errors=True)
+        os.replace(loading_dir, target_dir)
+
+    def delete(self, data_table):
+        shutil.rmtree(get_table_dir(data_table), ignore_errors=True)
@@ -0,0 +1,212 @@
+from datetime import date, datetime, timezone as dt_timezone
+from django.db import connection
+from django.utils.dateparse import parse_datetime
+from .base import storage_column_name
+
+# Operadores de comparación de los filtros
+COMPARISON_OPERATORS = {
+    'eq': '=',
+    'ne': '!=',
+    'lt': '<',
+    'lte': '<=',
+    'gt': '>',
+    'gte': '>=',
+}
+FILTER_OPERATORS = tuple(COMPARISON_OPERATORS) + ('in', 'contains', 'isnull')
+AGGREGATE_FUNCTIONS = ('count', 'sum', 'avg', 'min', 'max')
+
+
+class TableQuery:
+    """
+    Consulta sobre los datos de una tabla, ya validada y con los valores de
+    los filtros convertidos al tipo de su columna. La construye QueryService
+    y la ejecuta cada backend con StorageBackend.query.
+
+    Attributes:
+        select: Columnas proyectadas (sin agregación)
+        filters: Lista de (columna, operador, valor), combinados con AND
+        group_by: Columnas de agrupación
+        aggregates: Lista de (función, columna o None para count(*), alias)
+        sort: Lista de (columna o alias, descendente)
+        limit: Número máximo de filas del resultado
+        offset: Filas del resultado que se saltan
+        row_ranges: Rangos [inicio, fin) de row_index que pueden cumplir los
+            filtros según los mapas de zonas, o None para leer toda la tabla
+    """
+
+    def __init__(self, select, filters=(), group_by=(), aggregates=(), sort=(), limit=1000, offset=0,
+                 row_ranges=None):
+        self.select = list(select)
+        self.filters = list(filters)
+        self.group_by = list(group_by)
+        self.aggregates = list(aggregates)
+        self.sort = list(sort)
+        self.limit = limit
+        self.offset = offset
+        self.row_ranges = row_ranges
+
+    @property
+    def is_aggregate(self):
+        return bool(self.group_by or self.aggregates)
+
+    @property
+    def fetch_limit(self):
+        """Filas que lee el backend: una más del límite para saber si el resultado se truncó"""
+        return self.limit + 1
+
+    @property
+    def output_names(self):
+        if self.is_aggregate:
+            return [col.name for col in self.group_by] + [alias for _, _, alias in self.aggregates]
+        return ['row_index'] + [col.name for col in self.select]
+
+    @property
+    def output_types(self):
+        """Tipo de datos de cada columna del resultado"""
+        if not self.is_aggregate:
+            return ['integer'] + [col.data_type for col in self.select]
+
+        types = [col.data_type for col in self.group_by]
+        for function, col, _ in self.aggregates:
+            if function == 'count':
+                types.append('integer')
+            elif function == 'avg':
+                types.append('float')
+            elif function == 'sum':
+                types.append('integer' if col.data_type in ('integer', 'boolean') else 'float')
+            else:
+                types.append(col.data_type)
+        return types
+
+    @property
+    def referenced_columns(self):
+        """Columnas de la tabla que necesita la consulta, sin repetir"""
+        columns = list(self.select) + list(self.group_by)
+        columns += [col for col, _, _ in self.filters]
+        columns += [col for _, col, _ in self.aggregates if col is not None]
+        columns += [key for key, _ in self.sort if not isinstance(key, str)]
+        return list({col.column_index: col for col in columns}.values())
+
+
+def convert_value(value, data_type):
+    """
+    Convierte un valor leído con SQL al tipo de la columna. Los valores
+    guardados como texto porque no se pudieron convertir se devuelven tal cual.
+    """
+    if value is None:
+        return None
+    try:
+        if data_type == 'date' and isinstance(value, str):
+            return date.fromisoformat(value[:10])
+        if data_type == 'datetime' and isinstance(value, str):
+            parsed = parse_datetime(value)
+            if parsed is None:
+                return value
+            return parsed if parsed.tzinfo else parsed.replace(tzinfo=dt_timezone.utc)
+        if data_type == 'boolean' and value in (0, 1):
+            return bool(value)
+    except ValueError:
+        pass
+    return value
+
+
+def row_ranges_sql(name, ranges):
+    """Condición SQL que limita row_index a los rangos [inicio, fin) indicados"""
+    if not ranges:
+        return '0 = 1', []
+    conditions = ' OR '.join([f"({name} >= %s AND {name} < %s)"] * len(ranges))
+    return f"({conditions})", [bound for row_range in ranges for bound in row_range]
+
+
+def filter_sql(name, operator, value, data_type, adapt):
+    """
+    Condición SQL de un filtro sobre una expresión
+
+    Returns:
+        tuple: (condición, parámetros)
+    """
+    if operator == 'isnull':
+        return (f"{name} IS NULL" if value else f"{name} IS NOT NULL"), []
+    if operator == 'in':
+        if not value:
+            return '0 = 1', []
+        return f"{name} IN ({', '.join(['%s'] * len(value))})", [adapt(item, data_type) for item in value]
+    if operator == 'contains':
+        escaped = str(value).replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        return f"{name} LIKE %s ESCAPE '\\'", [f"%{escaped}%"]
+    return f"{name} {COMPARISON_OPERATORS[operator]} %s", [adapt(value, data_type)]
+
+
+def build_query_sql(source_sql, source_params, query, adapt):
+    """
+    Compila una TableQuery a SQL sobre una fuente con las columnas row_index y
+    c{column_index} (la tabla física del backend SQL o el pivote del EAV)
+
+    Args:
+        source_sql: SELECT o nombre de tabla que se usa como FROM
+        source_params: Parámetros de source_sql
+        query: TableQuery
+        adapt: Función (valor, tipo de datos) que convierte un valor de filtro
+            al formato con que el backend guarda la columna
+
+    Returns:
+        tuple: (sql, params)
+    """
+    quote = connection.ops.quote_name
+
+    def column_sql(col):
+        return quote(storage_column_name(col))
+
+    params = list(source_params)
+    where = []
+    for col, operator, value in query.filters:
+        condition, condition_params = filter_sql(column_sql(col), operator, value, col.data_type, adapt)
+        where.append(condition)
+        params.extend(condition_params)
+
+    if query.row_ranges is not None:
+        condition, range_params = row_ranges_sql('row_index', query.row_ranges)
+        where.append(condition)
+        params.extend(range_params)
+
+    if query.is_aggregate:
+        select = [f"{column_sql(col)} AS {quote(col.name)}" for col in query.group_by]
+        for function, col, alias in query.aggregates:
+            argument = '*' if col is None else column_sql(col)
+            select.append(f"{function.upper()}({argument}) AS {quote(alias)}")
+    else:
+        select = ['row_index'] + [column_sql(col) for col in query.select]
+
+    order = []
+    for key, descending in query.sort:
+        name = quote(key) if isinstance(key, str) else column_sql(key)
+        # Nulos siempre al final, como el orden de Arrow en el backend parquet
+        order.append(f"{name} IS NULL")
+        order.append(f"{name} DESC" if descending else name)
+    if not query.is_aggregate:
+        # row_index desempata y da un orden estable para paginar con offset
+        order.append('row_index')
+
+    sql = f"SELECT {', '.join(select)} FROM {source_sql} AS source"
+    if where:
+        sql += f" WHERE {' AND '.join(where)}"
+    if query.group_by:
+        sql += f" GROUP BY {', '.join(column_sql(col) for col in query.group_by)}"
+    if order:
+        sql += f" ORDER BY {', '.join(order)}"
+    sql += " LIMIT %s OFFSET %s"
+    params += [query.fetch_limit, query.offset]
+    return sql, params
+
+
+def iter_sql_rows(sql, params, query, batch_size=1000):
+    """Ejecuta una consulta compilada y devuelve sus filas por bloques, con los valores ya tipados"""
+    types = query.output_types
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                yield [convert_value(value, data_type) for value, data_type in zip(row, types)]
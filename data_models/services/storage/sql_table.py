@@ -0,0 +1,276 @@
+import logging
+from datetime import date, datetime, timezone as dt_timezone
+import pandas as pd
+from django.db import connection
+from .base import IncrementalLoaderMixin, StorageBackend, StorageLoader, row_hashes, storage_column_name, \
+    to_python_list
+from .query import build_query_sql, iter_sql_rows
+
+logger = logging.getLogger(__name__)
+
+# Tipo SQL de cada tipo de datos de ColumnDefinition
+SQL_TYPES = {
+    'string': 'TEXT',
+    'integer': 'INTEGER',
+    'float': 'REAL',
+    'date': 'DATE',
+    'datetime': 'DATETIME',
+    'boolean': 'BOOLEAN',
+    'unknown': 'TEXT',
+}
+
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+
+def get_physical_table_name(data_table):
+    """Nombre de la tabla SQL que guarda los datos de una DataTable"""
+    return f"data_models_table_{data_table.id}"
+
+
+def to_db_value(value, data_type):
+    """Convierte un valor tipado al formato con que se guarda en la tabla SQL"""
+    if value is None:
+        return None
+    if data_type == 'date':
+        return value.isoformat()
+    if data_type == 'datetime':
+        return value.astimezone(dt_timezone.utc).strftime(DATETIME_FORMAT)
+    if data_type == 'boolean':
+        return int(value)
+    return value
+
+
+def from_db_value(value, data_type):
+    """
+    Convierte un valor leído de la tabla SQL al tipo de la columna. Los valores
+    guardados como texto porque no se pudieron convertir se devuelven tal cual.
+    """
+    if value is None:
+        return None
+    try:
+        if data_type == 'date':
+            return date.fromisoformat(value)
+        if data_type == 'datetime':
+            return datetime.strptime(value, DATETIME_FORMAT).replace(tzinfo=dt_timezone.utc)
+        if data_type == 'boolean':
+            return bool(value)
+    except (TypeError, ValueError):
+        pass
+    return value
+
+
+class SQLTableStorageLoader(StorageLoader):
+    """Carga en una tabla SQL propia de la DataTable mediante executemany"""
+
+    def __init__(self, data_table, columns, start_row=0):
+        super().__init__(data_table, columns, start_row)
+        quote = connection.ops.quote_name
+        self.table = quote(get_physical_table_name(data_table))
+        names = ['row_index', 'row_hash'] + [storage_column_name(col) for col in columns]
+        placeholders = ', '.join(['%s'] * len(names))
+        self.insert_sql = f"INSERT INTO {self.table} ({', '.join(quote(n) for n in names)}) VALUES ({placeholders})"
+
+    def write_batch(self, start_idx, values, fallbacks):
+        row_count = len(next(iter(values.values()))) if values else 0
+        hashes = row_hashes(values, fallbacks, self.columns)
+        self._write_rows(range(start_idx, start_idx + row_count), values, fallbacks, hashes)
+        self.checkpoint = start_idx + row_count
+
+    def _write_rows(self, row_indexes, values, fallbacks, hashes):
+        column_values = []
+        for col in self.columns:
+            # Los valores que no se pudieron convertir se guardan como texto en la misma columna
+            column_values.append([
+                fallback if fallback is not None else to_db_value(value, col.data_type)
+                for value, fallback in zip(to_python_list(values[col.column_index]),
+                                           to_python_list(fallbacks[col.column_index]))
+            ])
+
+        rows = list(zip(row_indexes, hashes, *column_values))
+        with connection.cursor() as cursor:
+            cursor.executemany(self.insert_sql, rows)
+        self._index_search(row_indexes, values, fallbacks)
+        logger.info(f"Lote procesado: {len(rows)} filas en {get_physical_table_name(self.data_table)}")
+
+
+class SQLTableIncrementalLoader(IncrementalLoaderMixin, SQLTableStorageLoader):
+    """Recarga incremental sobre la tabla SQL usando su columna row_hash"""
+
+    def _stored_hashes(self, start_row, end_row):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT row_index, row_hash FROM {self.table} WHERE row_index >= %s AND row_index < %s",
+                [start_row, end_row]
+            )
+            return dict(cursor.fetchall())
+
+    def _delete_rows(self, row_indexes):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {self.table} WHERE row_index IN ({', '.join(['%s'] * len(row_indexes))})",
+                row_indexes
+            )
+
+    def _delete_from(self, row_index):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table} WHERE row_index >= %s", [row_index])
+            return cursor.rowcount
+
+
+class SQLTableStorageBackend(StorageBackend):
+    """
+    Almacenamiento en una tabla SQL física por DataTable, con una columna
+    tipada por definición de columna y row_index como clave primaria.
+    """
+
+    name = 'sql'
+
+    def open_loader(self, data_table, columns, start_row=0):
+        quote = connection.ops.quote_name
+        table = quote(get_physical_table_name(data_table))
+        column_sql = ', '.join(
+            f"{quote(storage_column_name(col))} {SQL_TYPES.get(col.data_type, 'TEXT')}" for col in columns
+        )
+
+        if start_row and self._has_row_hash(data_table):
+            # Reanudación: se conservan las filas ya confirmadas
+            with connection.cursor() as cursor:
+                cursor.execute(f"DELETE FROM {table} WHERE row_index >= %s", [start_row])
+            return SQLTableStorageLoader(data_table, columns, start_row)
+
+        # La recarga reemplaza la tabla completa
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {table}")
+            cursor.execute(f"CREATE TABLE {table} (row_index INTEGER PRIMARY KEY, row_hash INTEGER, {column_sql})")
+
+        return SQLTableStorageLoader(data_table, columns)
+
+    def open_incremental_loader(self, data_table, columns):
+        # Las tablas creadas antes de guardar row_hash necesitan una carga completa
+        if not self._has_row_hash(data_table):
+            return None
+        return SQLTableIncrementalLoader(data_table, columns)
+
+    def _has_row_hash(self, data_table):
+        if not self._table_exists(data_table):
+            return False
+        with connection.cursor() as cursor:
+            description = connection.introspection.get_table_description(cursor, get_physical_table_name(data_table))
+        return 'row_hash' in {column.name for column in description}
+
+    def _select_sql(self, data_table, columns, where='', order='row_index'):
+        quote = connection.ops.quote_name
+        names = ['row_index']
+        for col in columns:
+            name = quote(storage_column_name(col))
+            # Leer fechas como texto: así el conversor del driver no falla con los
+            # valores no convertibles que se guardaron tal cual
+            if col.data_type in ('date', 'datetime'):
+                name = f"CAST({name} AS TEXT)"
+            names.append(name)
+        return f"SELECT {', '.join(names)} FROM {quote(get_physical_table_name(data_table))} {where} ORDER BY {order}"
+
+    def _table_exists(self, data_table):
+        return get_physical_table_name(data_table) in connection.introspection.table_names()
+
+    def read_rows(self, data_table, columns, start_row, limit, descending=False):
+        if not self._table_exists(data_table):
+            return []
+
+        if descending:
+            sql = self._select_sql(data_table, columns, 'WHERE row_index < %s', 'row_index DESC')
+        else:
+            sql = self._select_sql(data_table, columns, 'WHERE row_index >= %s')
+
+        with connection.cursor() as cursor:
+            cursor.execute(f"{sql} LIMIT %s", [start_row, limit])
+            rows = [
+                [row[0]] + [from_db_value(value, col.data_type) for col, value in zip(columns, row[1:])]
+                for row in cursor.fetchall()
+            ]
+        return rows[::-1] if descending else rows
+
+    def query(self, data_table, query):
+        if not self._table_exists(data_table):
+            return
+
+        quote = connection.ops.quote_name
+        names = ['row_index']
+        for col in query.referenced_columns:
+            names.append(f"{self._query_expression(col)} AS {quote(storage_column_name(col))}")
+        source = f"(SELECT {', '.join(names)} FROM {quote(get_physical_table_name(data_table))})"
+
+        sql, params = build_query_sql(source, [], query, to_db_value)
+        yield from iter_sql_rows(sql, params, query)
+
+    @staticmethod
+    def _query_expression(col):
+        """
+        Expresión con que las consultas leen una columna. En las columnas no
+        textuales el texto de los valores no convertibles, que se guardó en la
+        misma columna, cuenta como nulo, igual que en los backends eav y parquet
+        """
+        name = connection.ops.quote_name(storage_column_name(col))
+        if col.data_type in ('integer', 'float', 'boolean'):
+            return f"CASE WHEN typeof({name}) IN ('integer', 'real') THEN {name} END"
+        if col.data_type in ('date', 'datetime'):
+            # Las fechas se guardan como texto ISO: solo valen las que SQLite reconoce
+            return f"CASE WHEN date({name}) = substr({name}, 1, 10) THEN {name} END"
+        return name
+
+    def value_index_columns(self, query):
+        # Un índice (columna, row_index) resuelve los filtros y también el orden
+        columns = [col for col, operator, _ in query.filters if operator != 'contains']
+        if not query.is_aggregate:
+            columns += [key for key, _ in query.sort if not isinstance(key, str)]
+        return list({col.column_index: col for col in columns}.values())
+
+    def create_value_indexes(self, data_table, columns):
+        if not self._table_exists(data_table):
+            return
+
+        quote = connection.ops.quote_name
+        table = get_physical_table_name(data_table)
+        with connection.cursor() as cursor:
+            for col in columns:
+                # Sobre la misma expresión que usan las consultas, para que el planificador lo elija
+                name = quote(f"{table}_{storage_column_name(col)}_value_idx")
+                cursor.execute(
+                    f"CREATE INDEX IF NOT EXISTS {name} ON {quote(table)} (({self._query_expression(col)}), row_index)"
+                )
+                if connection.vendor == 'sqlite':
+                    cursor.execute(f"ANALYZE {name}")
+
+    def iter_batches(self, data_table, columns, batch_size=10000):
+        if not self._table_exists(data_table):
+            return
+
+        with connection.cursor() as cursor:
+            cursor.execute(self._select_sql(data_table, columns))
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield pd.DataFrame(
+                    [[from_db_value(value, col.data_type) for col, value in zip(columns, row[1:])] for row in rows],
+                    columns=[col.column_index for col in columns]
+                )
+
+    def copy(self, source, target, source_columns, target_columns):
+        self.open_loader(target, target_columns)
+        if not self._table_exists(source):
+            return
+
+        quote = connection.ops.quote_name
+        keys = ['row_index', 'row_hash'] if self._has_row_hash(source) else ['row_index']
+        source_names = ', '.join(keys + [quote(storage_column_name(col)) for col in source_columns])
+        target_names = ', '.join(keys + [quote(storage_column_name(col)) for col in target_columns])
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {quote(get_physical_table_name(target))} ({target_names}) "
+                f"SELECT {source_names} FROM {quote(get_physical_table_name(source))}"
+            )
+
+    def delete(self, data_table):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {connection.ops.quote_name(get_physical_table_name(data_table))}")
@@ -0,0 +1,25 @@
+import logging
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from data_models.models import DataTable
+from data_models.services.sqlite_pragmas import apply_sqlite_pragmas, get_sqlite_pragmas
+
+logger = logging.getLogger(__name__)
+
+
+@receiver(post_delete, sender=DataTable)
+def delete_table_storage(sender, instance, **kwargs):
+    """Elimina los datos fuera de la base de datos (p. ej. Parquet) al borrar una tabla"""
+    if instance.storage_backend != 'eav':
+        try:
+            instance.get_storage().delete(instance)
+        except Exception as e:
+            logger.error(f"Error al eliminar el almacenamiento de la tabla {instance.id}: {str(e)}")
+
+
+@receiver(connection_created)
+def configure_sqlite_connection(sender, connection, **kwargs):
+    """Ajusta cada conexión SQLite nueva para la ingesta (WAL, caché, mmap)"""
+    if connection.vendor == 'sqlite':
+        apply_sqlite_pragmas(connection.connection, get_sqlite_pragmas())
@@ -1,3 +1,1138 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import os
+import pickle
+import shutil
+import sqlite3
+import tempfile
+from datetime import date, datetime, timezone as dt_timezone
+from types import SimpleNamespace
+from unittest import mock
+import pandas as pd
+import pyarrow.parquet as pq
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import Client, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from openpyxl import Workbook, load_workbook
+from data_models.management.commands.benchmark_eav_loader import BulkCreateEAVLoader
+from data_models.models import DataCell, DataRow, DataTable, DictionaryValue, TableExport
+from data_models.services import model_factory
+from data_models.services.coercion import coerce_batch
+from data_models.services.export_service import ExportService
+from data_models.services.ingest_pool import ColumnSpec, IngestPool, coerce_part
+from data_models.services.model_factory import DataModelFactory
+from data_models.services.pagination import TableCursor
+from data_models.services.purge_service import PurgeService
+from data_models.services.query_service import QueryService
+from data_models.services.sqlite_pragmas import read_sqlite_pragmas
+from data_models.services.storage.eav import EAVStorageLoader
+from data_models.services.search_service import (
+    MAX_COLUMN_INDEX, MAX_ROW_INDEX, MAX_TABLE_ID, SEARCH_TABLE, SearchService, search_rowid, table_rowid_end
+)
+from data_models.services.storage.parquet import get_table_dir
+from data_models.services.storage.sql_table import get_physical_table_name
+from data_models.signals import configure_sqlite_connection
+from excel_files.models import ColumnDefinition, ExcelFile, ExcelSheet, ProcessingJob
+from excel_files.services.file_manager import ExcelFileManager
+from excel_files.services.job_queue import JobQueue
+from excel_files.services.schema_detector import SchemaDetector
+from excel_files.services.sheet_cache import SheetCache
 
-# Create your tests here.
+
+def build_workbook(header, rows):
+    """Contenido de un .xlsx con una hoja 'Datos' con la cabecera y las filas indicadas"""
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.title = 'Datos'
+    sheet.append(list(header))
+    for row in rows:
+        sheet.append(list(row))
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+class DataTableTestCase(TestCase):
+    """
+    Base de los tests que cargan tablas de datos: los archivos subidos, la
+    caché de hojas y los datos Parquet van a un directorio temporal
+    """
+
+    HEADER = ('id', 'pais', 'importe')
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(
+            MEDIA_ROOT=media_root,
+            SHEET_CACHE_DIR=f"{media_root}/cache/sheets",
+            DATA_TABLE_PARQUET_DIR=f"{media_root}/tables",
+            INGEST_WORKERS=1,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    @staticmethod
+    def make_rows(count, start=1):
+        """Filas (id, pais, importe) con países repetidos, aptas para diccionario"""
+        countries = ('ES', 'FR', 'PT')
+        return [(i, countries[i % 3], i * 1.5) for i in range(start, start + count)]
+
+    def upload_sheet(self, rows, header=None):
+        """Sube un libro con una hoja, la registra y detecta sus columnas"""
+        content = build_workbook(header or self.HEADER, rows)
+        excel_file = ExcelFile.objects.create(name='datos.xlsx', file=SimpleUploadedFile('datos.xlsx', content))
+        sheet = ExcelFileManager.read_excel_sheets(excel_file.id)[0]
+        SchemaDetector.detect_column_types(sheet.id)
+        return sheet
+
+    def replace_sheet(self, sheet, rows, header=None):
+        """Sube una nueva versión del libro de una hoja"""
+        content = build_workbook(header or self.HEADER, rows)
+        ExcelFileManager.replace_file(sheet.excel_file, SimpleUploadedFile('datos.xlsx', content))
+
+    def create_table(self, rows, storage_backend='eav', batch_size=1000, header=None):
+        sheet = self.upload_sheet(rows, header)
+        return DataModelFactory.create_data_table_from_sheet(sheet.id, batch_size=batch_size,
+                                                             storage_backend=storage_backend)
+
+    def read_all(self, data_table):
+        """Filas guardadas de la tabla como tuplas (row_index, valores...)"""
+        data_table = DataTable.objects.get(id=data_table.id)
+        columns = list(data_table.sheet.columns.order_by('column_index'))
+        return [tuple(row) for row in data_table.get_storage().read_rows(data_table, columns, 0, 10 ** 6)]
+
+
+class TableCursorTests(DataTableTestCase):
+    """Paginación por cursor de DataModelFactory.get_table_data"""
+
+    def test_cursor_round_trip(self):
+        data_table = self.create_table(self.make_rows(25))
+
+        first = DataModelFactory.get_table_data(data_table.id, page_size=10)
+        self.assertEqual([row[0] for row in first['rows']], list(range(10)))
+        self.assertIsNone(first['prev_cursor'])
+        self.assertEqual(first['total_pages'], 3)
+
+        second = DataModelFactory.get_table_data(data_table.id, page_size=10, cursor=first['next_cursor'])
+        self.assertEqual([row[0] for row in second['rows']], list(range(10, 20)))
+        self.assertEqual(second['page'], 2)
+        self.assertEqual(second['rows'][0][1:], [11, 'PT', 16.5])
+
+        back = DataModelFactory.get_table_data(data_table.id, page_size=10, cursor=second['prev_cursor'])
+        self.assertEqual(back['rows'], first['rows'])
+
+        last = DataModelFactory.get_table_data(data_table.id, page_size=10, cursor=first['last_cursor'])
+        self.assertEqual([row[0] for row in last['rows']], list(range(20, 25)))
+        self.assertIsNone(last['next_cursor'])
+
+    def test_cursor_decodes_its_position(self):
+        data_table = self.create_table(self.make_rows(3))
+
+        cursor = TableCursor.encode(data_table, 40, descending=True)
+        self.assertEqual(TableCursor.decode(cursor, data_table), (40, True))
+
+    def test_cursor_from_another_table_is_rejected(self):
+        data_table = self.create_table(self.make_rows(25))
+        other_table = self.create_table(self.make_rows(25, start=100))
+
+        cursor = DataModelFactory.get_table_data(other_table.id, page_size=10)['next_cursor']
+        with self.assertRaises(ValueError):
+            TableCursor.decode(cursor, data_table)
+        with self.assertRaises(ValueError):
+            DataModelFactory.get_table_data(data_table.id, page_size=10, cursor=cursor)
+
+    def test_tampered_cursor_is_rejected(self):
+        data_table = self.create_table(self.make_rows(25))
+
+        cursor = DataModelFactory.get_table_data(data_table.id, page_size=10)['next_cursor']
+        with self.assertRaises(ValueError):
+            DataModelFactory.get_table_data(data_table.id, page_size=10, cursor=cursor[:-2] + 'xx')
+
+
+class RefreshDataTableTests(DataTableTestCase):
+    """Recargas incrementales de DataModelFactory.refresh_data_table"""
+
+    def expected(self, rows):
+        return [(row_index,) + tuple(row) for row_index, row in enumerate(rows)]
+
+    def test_refresh_applies_inserted_changed_and_deleted_rows(self):
+        for backend in ('eav', 'sql', 'parquet'):
+            with self.subTest(backend=backend):
+                rows = self.make_rows(30)
+                data_table = self.create_table(rows, storage_backend=backend)
+                version = data_table.data_version
+
+                # Una fila cambiada y cinco nuevas al final
+                rows[4] = (5, 'ES', 999.5)
+                rows += self.make_rows(5, start=31)
+                self.replace_sheet(data_table.sheet, rows)
+                data_table = DataModelFactory.refresh_data_table(data_table.sheet_id, batch_size=10)
+                self.assertEqual(self.read_all(data_table), self.expected(rows))
+                self.assertEqual((data_table.status, data_table.row_count), ('ready', 35))
+                self.assertEqual(data_table.data_version, version + 1)
+
+                # Filas eliminadas del final
+                rows = rows[:20]
+                self.replace_sheet(data_table.sheet, rows)
+                data_table = DataModelFactory.refresh_data_table(data_table.sheet_id, batch_size=10)
+                self.assertEqual(self.read_all(data_table), self.expected(rows))
+                self.assertEqual(data_table.row_count, 20)
+                self.assertEqual(data_table.data_version, version + 2)
+
+    def test_refresh_only_rewrites_changed_rows(self):
+        rows = self.make_rows(30)
+        data_table = self.create_table(rows)
+        row_ids = dict(DataRow.objects.filter(table=data_table).values_list('row_index', 'id'))
+
+        rows[4] = (5, 'ES', 999.5)
+        self.replace_sheet(data_table.sheet, rows)
+        DataModelFactory.refresh_data_table(data_table.sheet_id, batch_size=10)
+
+        refreshed_ids = dict(DataRow.objects.filter(table=data_table).values_list('row_index', 'id'))
+        self.assertEqual({row_index for row_index in row_ids if refreshed_ids[row_index] != row_ids[row_index]}, {4})
+
+    def test_refresh_without_changes_keeps_data_version(self):
+        rows = self.make_rows(30)
+        data_table = self.create_table(rows)
+
+        self.replace_sheet(data_table.sheet, list(rows))
+        refreshed = DataModelFactory.refresh_data_table(data_table.sheet_id, batch_size=10)
+        self.assertEqual(refreshed.data_version, data_table.data_version)
+        self.assertEqual(self.read_all(refreshed), self.expected(rows))
+
+    def test_failed_refresh_hides_table_until_retried(self):
+        rows = self.make_rows(30)
+        data_table = self.create_table(rows)
+        version = data_table.data_version
+
+        # El primer lote cambia y se aplica; el segundo falla
+        rows[4] = (5, 'ES', 999.5)
+        rows[24] = (25, 'ES', 999.5)
+        self.replace_sheet(data_table.sheet, rows)
+        coerce_batch = model_factory.coerce_batch
+        calls = []
+
+        def failing_coerce_batch(*args, **kwargs):
+            calls.append(args)
+            if len(calls) == 2:
+                raise RuntimeError("Fallo simulado")
+            return coerce_batch(*args, **kwargs)
+
+        with mock.patch.object(model_factory, 'coerce_batch', side_effect=failing_coerce_batch):
+            with self.assertRaises(ValueError):
+                DataModelFactory.refresh_data_table(data_table.sheet_id, batch_size=10)
+
+        data_table.refresh_from_db()
+        self.assertEqual((data_table.status, data_table.loaded_rows), ('loading', 0))
+
+        # Repetir la recarga la completa desde el principio y publica una nueva versión
+        data_table = DataModelFactory.refresh_data_table(data_table.sheet_id, batch_size=10)
+        self.assertEqual(data_table.status, 'ready')
+        self.assertEqual(self.read_all(data_table), self.expected(rows))
+        self.assertGreater(data_table.data_version, version)
+        importe = data_table.sheet.columns.get(name='importe')
+        self.assertEqual(importe.profile['max'], 999.5)
+
+
+@override_settings(PROFILE_ZONE_ROWS=10)
+class ZoneMapQueryTests(DataTableTestCase):
+    """Consultas con zonas descartadas por los perfiles de las columnas"""
+
+    QUERIES = [
+        {'filters': [{'column': 'id', 'op': 'gt', 'value': 42}]},
+        {'filters': [{'column': 'importe', 'op': 'lte', 'value': 12}], 'sort': ['-importe']},
+        {'filters': [{'column': 'id', 'op': 'in', 'value': [3, 27, 48]},
+                     {'column': 'pais', 'op': 'ne', 'value': 'ES'}]},
+        {'filters': [{'column': 'id', 'op': 'gte', 'value': 15}, {'column': 'id', 'op': 'lt', 'value': 25}],
+         'group_by': ['pais'], 'aggregates': [{'func': 'count'}, {'func': 'sum', 'column': 'importe'}],
+         'sort': ['pais']},
+        {'filters': [{'column': 'id', 'op': 'eq', 'value': 1000}]},
+    ]
+
+    def run_query(self, data_table, query):
+        rows = data_table.get_storage().query(data_table, query)
+        return [tuple(row) for row in rows]
+
+    def test_pruned_query_returns_same_rows_as_full_scan(self):
+        for backend in ('eav', 'sql', 'parquet'):
+            data_table = self.create_table(self.make_rows(50), storage_backend=backend, batch_size=20)
+            for spec in self.QUERIES:
+                with self.subTest(backend=backend, spec=spec):
+                    query = QueryService.parse(data_table, spec)
+                    self.assertIsNotNone(query.row_ranges)
+                    self.assertLess(sum(end - start for start, end in query.row_ranges), 50)
+                    pruned = self.run_query(data_table, query)
+
+                    query.row_ranges = None
+                    self.assertEqual(pruned, self.run_query(data_table, query))
+
+    def test_pruned_query_on_unsorted_column(self):
+        rows = self.make_rows(50)
+        rows[7] = (8, 'ES', 70.0)
+        data_table = self.create_table(rows, batch_size=20)
+
+        query = QueryService.parse(data_table, {'filters': [{'column': 'importe', 'op': 'gte', 'value': 69}]})
+        self.assertEqual(query.row_ranges, [(0, 10), (40, 50)])
+        self.assertEqual([row[0] for row in self.run_query(data_table, query)], [7, 45, 46, 47, 48, 49])
+
+    def test_stale_profile_is_not_used(self):
+        data_table = self.create_table(self.make_rows(50))
+        DataTable.objects.filter(id=data_table.id).update(row_count=60)
+        data_table.refresh_from_db()
+
+        query = QueryService.parse(data_table, {'filters': [{'column': 'id', 'op': 'gt', 'value': 42}]})
+        self.assertIsNone(query.row_ranges)
+
+
+class QueryFallbackTests(DataTableTestCase):
+    """Valores no convertibles al tipo de su columna en la API de consulta"""
+
+    QUERIES = [
+        ({'filters': [{'column': 'importe', 'op': 'gt', 'value': 40}]}, [26, 27, 28, 29]),
+        ({'filters': [{'column': 'importe', 'op': 'isnull', 'value': True}], 'select': ['importe']}, [[5, None]]),
+        ({'aggregates': [{'func': 'max', 'column': 'importe'}, {'func': 'count', 'column': 'importe'}]},
+         [[45.0, 29]]),
+        # El backend lee una fila de más del límite para saber si el resultado se truncó
+        ({'select': ['importe'], 'sort': ['-importe'], 'limit': 2}, [[29, 45.0], [28, 43.5], [27, 42.0]]),
+    ]
+
+    def test_text_fallbacks_are_null_in_every_backend(self):
+        rows = self.make_rows(30)
+        rows[5] = (6, 'ES', 'n/a')
+        for backend in ('eav', 'sql', 'parquet'):
+            # La muestra de la detección no vio el texto: la columna es float
+            sheet = self.upload_sheet(rows)
+            sheet.columns.filter(name='importe').update(data_type='float')
+            data_table = DataModelFactory.create_data_table_from_sheet(sheet.id, storage_backend=backend)
+            for spec, expected in self.QUERIES:
+                with self.subTest(backend=backend, spec=spec):
+                    query = QueryService.parse(data_table, spec)
+                    result = list(data_table.get_storage().query(data_table, query))
+                    if spec.get('filters') and not spec.get('select'):
+                        result = [row[0] for row in result]
+                    self.assertEqual(result, expected)
+
+
+
+@override_settings(QUERY_INDEX_MIN_ROWS=1)
+class QueryViewTests(DataTableTestCase):
+    """API de consulta: un GET no escribe nada y el POST que encola índices exige CSRF"""
+
+    QUERY = {'filters': [{'column': 'pais', 'op': 'eq', 'value': 'ES'}], 'select': ['id']}
+
+    def setUp(self):
+        super().setUp()
+        self.data_table = self.create_table(self.make_rows(30), storage_backend='sql')
+        self.url = reverse('data_models:query', kwargs={'table_id': self.data_table.id})
+        self.client = Client(enforce_csrf_checks=True)
+
+    def index_jobs(self):
+        return ProcessingJob.objects.filter(job_type='index_table')
+
+    def test_get_does_not_enqueue_indexes(self):
+        response = self.client.get(self.url, {'q': json.dumps(self.QUERY)})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(json.loads(b''.join(response.streaming_content))['rows']), 10)
+        self.assertFalse(self.index_jobs().exists())
+
+    def test_post_requires_csrf_token(self):
+        response = self.client.post(self.url, json.dumps(self.QUERY), content_type='application/json')
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(self.index_jobs().exists())
+
+    def test_post_enqueues_indexes(self):
+        self.client.get(reverse('excel_files:bulk_upload'))
+        token = self.client.cookies['csrftoken'].value
+        response = self.client.post(self.url, json.dumps(self.QUERY), content_type='application/json',
+                                    HTTP_X_CSRFTOKEN=token)
+        self.assertEqual(response.status_code, 200)
+        job = self.index_jobs().get()
+        self.assertEqual(job.options['columns'], [1])
+
+class ResumeDataTableTests(DataTableTestCase):
+    """Cargas por lotes confirmados y reanudación con DataModelFactory.resume_data_table"""
+
+    def test_resume_after_failed_batch(self):
+        rows = self.make_rows(35)
+        process_batch = DataModelFactory._process_batch
+        for backend in ('eav', 'sql', 'parquet'):
+            with self.subTest(backend=backend):
+                sheet = self.upload_sheet(rows)
+                starts = []
+
+                def failing_process_batch(data_table, batch_df, columns, start_idx, *args, **kwargs):
+                    if start_idx == 20:
+                        raise ValueError("Fallo simulado")
+                    return process_batch(data_table, batch_df, columns, start_idx, *args, **kwargs)
+
+                with mock.patch.object(DataModelFactory, '_process_batch', side_effect=failing_process_batch):
+                    with self.assertRaises(ValueError):
+                        DataModelFactory.create_data_table_from_sheet(sheet.id, batch_size=10,
+                                                                      storage_backend=backend)
+
+                # Los dos lotes anteriores al fallo quedan confirmados
+                data_table = DataTable.objects.get(sheet=sheet)
+                self.assertEqual(data_table.status, 'loading')
+                self.assertLessEqual(data_table.loaded_rows, 20)
+                if backend != 'parquet':
+                    self.assertEqual(data_table.loaded_rows, 20)
+                    self.assertEqual(self.read_all(data_table), [(i,) + rows[i] for i in range(20)])
+
+                def recording_process_batch(data_table, batch_df, columns, start_idx, *args, **kwargs):
+                    starts.append(start_idx)
+                    return process_batch(data_table, batch_df, columns, start_idx, *args, **kwargs)
+
+                with mock.patch.object(DataModelFactory, '_process_batch', side_effect=recording_process_batch):
+                    data_table = DataModelFactory.resume_data_table(sheet.id, batch_size=10)
+
+                self.assertEqual((data_table.status, data_table.row_count, data_table.loaded_rows),
+                                 ('ready', 35, 35))
+                self.assertEqual(self.read_all(data_table), [(i,) + row for i, row in enumerate(rows)])
+                if backend != 'parquet':
+                    # La carga continúa desde el checkpoint
+                    self.assertEqual(starts, [20, 30])
+                # Las filas ya confirmadas se perfilan sin volver a escribirse
+                self.assertEqual(data_table.sheet.columns.get(name='id').profile['rows'], 35)
+
+    def test_resume_of_ready_table_reloads_it(self):
+        rows = self.make_rows(15)
+        data_table = self.create_table(rows)
+
+        data_table = DataModelFactory.resume_data_table(data_table.sheet_id, batch_size=10)
+        self.assertEqual(data_table.status, 'ready')
+        self.assertEqual(self.read_all(data_table), [(i,) + row for i, row in enumerate(rows)])
+
+
+class DictionaryColumnTests(DataTableTestCase):
+    """Columnas de texto guardadas como códigos de diccionario en el backend EAV"""
+
+    def setUp(self):
+        super().setUp()
+        self.rows = self.make_rows(30)
+        self.data_table = self.create_table(self.rows, batch_size=10)
+        self.pais = self.data_table.sheet.columns.get(name='pais')
+
+    def run_query(self, spec):
+        query = QueryService.parse(self.data_table, spec)
+        return [tuple(row) for row in self.data_table.get_storage().query(self.data_table, query)]
+
+    def test_repeated_text_is_stored_as_codes(self):
+        self.assertEqual(self.data_table.dictionary_columns, [self.pais.column_index])
+        self.assertEqual(DictionaryValue.objects.filter(column_definition=self.pais).count(), 3)
+        cells = DataCell.objects.filter(column_definition=self.pais)
+        self.assertFalse(cells.filter(string_code__isnull=True).exists())
+        self.assertFalse(cells.filter(string_value__isnull=False).exists())
+
+    def test_read_decodes_text(self):
+        self.assertEqual(self.read_all(self.data_table), [(i,) + row for i, row in enumerate(self.rows)])
+
+        page = DataModelFactory.get_table_data(self.data_table.id, page_size=5)
+        self.assertEqual([row[2] for row in page['rows']], [row[1] for row in self.rows[:5]])
+
+    def test_get_value_does_not_query_per_cell(self):
+        with self.assertNumQueries(1):
+            values = [cell.get_value() for cell in DataCell.objects.filter(
+                column_definition=self.pais).with_string_text().select_related('column_definition').order_by(
+                'row__row_index')]
+        self.assertEqual(values, [row[1] for row in self.rows])
+
+        row = DataRow.objects.get(table=self.data_table, row_index=1)
+        with self.assertNumQueries(1):
+            values = [cell.get_value() for cell in row.cells.with_string_text().select_related(
+                'column_definition').order_by('column_definition__column_index')]
+        self.assertEqual(values, list(self.rows[1]))
+
+    def test_get_value_without_annotation_reads_dictionary(self):
+        cell = DataCell.objects.select_related('column_definition').get(
+            row__table=self.data_table, row__row_index=2, column_definition=self.pais
+        )
+        self.assertFalse(hasattr(cell, 'string_text'))
+        with self.assertNumQueries(1):
+            self.assertEqual(cell.get_value(), self.rows[2][1])
+
+    def test_query_filters_and_groups_decoded_text(self):
+        expected = [(i,) + row for i, row in enumerate(self.rows) if row[1] == 'FR']
+        self.assertEqual(self.run_query({'filters': [{'column': 'pais', 'op': 'eq', 'value': 'FR'}]}), expected)
+        self.assertEqual(
+            self.run_query({'filters': [{'column': 'pais', 'op': 'in', 'value': ['FR', 'XX']}]}), expected
+        )
+        self.assertEqual(
+            self.run_query({'group_by': ['pais'], 'aggregates': [{'func': 'count'}], 'sort': ['pais']}),
+            [('ES', 10), ('FR', 10), ('PT', 10)]
+        )
+
+        # Con índice de valores el filtro busca los códigos del diccionario
+        DataModelFactory.create_value_indexes(self.data_table.sheet_id, [self.pais.column_index])
+        self.data_table.refresh_from_db()
+        self.assertEqual(self.run_query({'filters': [{'column': 'pais', 'op': 'eq', 'value': 'FR'}]}), expected)
+        self.assertEqual(
+            len(self.run_query({'filters': [{'column': 'pais', 'op': 'gt', 'value': 'ES'}]})), 20
+        )
+
+    def test_exports_decode_text(self):
+        lines = b''.join(ExportService.iter_csv(self.data_table.id)).decode('utf-8').splitlines()
+        self.assertEqual(lines[0], '"id","pais","importe"')
+        self.assertEqual(lines[2], '2,"PT",3')
+
+        records = [json.loads(line) for line in
+                   b''.join(ExportService.iter_ndjson(self.data_table.id)).decode('utf-8').splitlines()]
+        self.assertEqual([record['pais'] for record in records], [row[1] for row in self.rows])
+
+        export = ExportService.export_to_parquet(self.data_table.id)
+        table = pq.read_table(export.file.path)
+        self.assertEqual(table.column('pais').to_pylist(), [row[1] for row in self.rows])
+
+    def test_refresh_extends_dictionary(self):
+        rows = list(self.rows)
+        rows[3] = (4, 'IT', 6.0)
+        self.replace_sheet(self.data_table.sheet, rows)
+        data_table = DataModelFactory.refresh_data_table(self.data_table.sheet_id, batch_size=10)
+
+        self.assertEqual(data_table.dictionary_columns, [self.pais.column_index])
+        self.assertEqual(self.read_all(data_table), [(i,) + row for i, row in enumerate(rows)])
+        self.assertEqual(
+            list(DictionaryValue.objects.filter(column_definition=self.pais).order_by('code').values_list(
+                'value', flat=True)),
+            ['FR', 'PT', 'ES', 'IT']
+        )
+
+    def dictionary(self):
+        return dict(DictionaryValue.objects.filter(column_definition=self.pais).values_list('value', 'code'))
+
+    def test_refresh_removes_unused_dictionary_values(self):
+        self.assertEqual(self.dictionary(), {'FR': 0, 'PT': 1, 'ES': 2})
+
+        # Todas las filas de PT pasan a IT: PT deja de usarse y su código queda libre
+        rows = [(i, 'IT' if pais == 'PT' else pais, importe) for i, pais, importe in self.rows]
+        self.replace_sheet(self.data_table.sheet, rows)
+        data_table = DataModelFactory.refresh_data_table(self.data_table.sheet_id, batch_size=10)
+        self.assertEqual(self.dictionary(), {'FR': 0, 'ES': 2, 'IT': 3})
+
+        # Los códigos nuevos siguen al mayor, sin reutilizar huecos ni chocar con IT
+        rows[0] = (1, 'DE', 1.5)
+        self.replace_sheet(data_table.sheet, rows)
+        data_table = DataModelFactory.refresh_data_table(self.data_table.sheet_id, batch_size=10)
+        self.assertEqual(self.dictionary(), {'FR': 0, 'ES': 2, 'IT': 3, 'DE': 4})
+        self.assertEqual(self.read_all(data_table), [(i,) + row for i, row in enumerate(rows)])
+
+    def test_truncate_removes_dictionary(self):
+        PurgeService.truncate_table(self.data_table)
+        self.assertFalse(DictionaryValue.objects.filter(column_definition=self.pais).exists())
+        self.assertEqual(DataTable.objects.get(id=self.data_table.id).dictionary_columns, [])
+
+
+class DateCoercionTests(SimpleTestCase):
+    """Conversión de fechas: desplazamientos UTC mezclados, valores sin zona y texto no convertible"""
+
+    values = pd.DataFrame({'fecha': [
+        '2024-01-15 10:00:00+01:00',
+        '2024-07-15 10:00:00+02:00',
+        '2024-03-05T08:30:00Z',
+        '2024-01-16 10:00:00',
+        'sin fecha',
+        None,
+    ]})
+
+    def coerce(self, data_type):
+        with timezone.override('Europe/Madrid'):
+            values, fallbacks = coerce_batch(self.values, [ColumnSpec('fecha', 0, data_type)])
+        return values[0].tolist(), fallbacks[0].tolist()
+
+    def test_datetimes_with_mixed_offsets(self):
+        values, fallbacks = self.coerce('datetime')
+        with timezone.override('Europe/Madrid'):
+            local = timezone.get_current_timezone()
+            expected = [
+                datetime(2024, 1, 15, 9, tzinfo=dt_timezone.utc),
+                datetime(2024, 7, 15, 8, tzinfo=dt_timezone.utc),
+                datetime(2024, 3, 5, 8, 30, tzinfo=dt_timezone.utc),
+                # Sin zona: la hora escrita se interpreta en la zona actual
+                datetime(2024, 1, 16, 10).replace(tzinfo=local),
+            ]
+        self.assertEqual(values[:4], expected)
+        self.assertEqual([str(v.tz) for v in values[:4]], ['Europe/Madrid'] * 4)
+        self.assertTrue(pd.isna(values[4]) and pd.isna(values[5]))
+        self.assertEqual(fallbacks, [None, None, None, None, 'sin fecha', None])
+
+    def test_dates_with_mixed_offsets(self):
+        values, fallbacks = self.coerce('date')
+        self.assertEqual(values, [date(2024, 1, 15), date(2024, 7, 15), date(2024, 3, 5), date(2024, 1, 16),
+                                  None, None])
+        self.assertEqual(fallbacks, [None, None, None, None, 'sin fecha', None])
+
+    def test_naive_datetime_column_is_localized(self):
+        batch = pd.DataFrame({'fecha': pd.to_datetime(['2024-01-16 10:00', None, '2024-03-31 02:30'])})
+        with timezone.override('Europe/Madrid'):
+            values, fallbacks = coerce_batch(batch, [ColumnSpec('fecha', 0, 'datetime')])
+        self.assertEqual(values[0][0], pd.Timestamp('2024-01-16 10:00', tz='Europe/Madrid'))
+        # La hora inexistente del cambio de horario no se puede convertir y conserva su texto
+        self.assertTrue(pd.isna(values[0][1]) and pd.isna(values[0][2]))
+        self.assertEqual(fallbacks[0].tolist(), [None, None, '2024-03-31 02:30:00'])
+
+
+class SQLitePragmaTests(TestCase):
+    """PRAGMAs de SQLITE_PRAGMAS aplicados a cada conexión nueva"""
+
+    def test_django_connection_is_configured(self):
+        connection.ensure_connection()
+        self.assertEqual(read_sqlite_pragmas(connection.connection, ['cache_size', 'temp_store']),
+                         {'cache_size': -64000, 'temp_store': 2})
+
+    @override_settings(SQLITE_PRAGMAS={'journal_mode': 'WAL', 'synchronous': 'NORMAL'})
+    def test_hook_configures_sqlite_connections_only(self):
+        workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, workdir, ignore_errors=True)
+        names = ['journal_mode', 'synchronous']
+
+        raw = sqlite3.connect(f"{workdir}/datos.sqlite3")
+        self.addCleanup(raw.close)
+        configure_sqlite_connection(sender=None, connection=SimpleNamespace(vendor='sqlite', connection=raw))
+        self.assertEqual(read_sqlite_pragmas(raw, names), {'journal_mode': 'wal', 'synchronous': 1})
+
+        other = sqlite3.connect(f"{workdir}/otra.sqlite3")
+        self.addCleanup(other.close)
+        configure_sqlite_connection(sender=None, connection=SimpleNamespace(vendor='postgresql', connection=other))
+        self.assertEqual(read_sqlite_pragmas(other, names), {'journal_mode': 'delete', 'synchronous': 2})
+
+
+class EAVLoaderTests(DataTableTestCase):
+    """Carga EAV con executemany frente a la referencia con bulk_create del benchmark"""
+
+    def load(self, loader_class, rows, batch_size=7):
+        sheet = self.upload_sheet(rows)
+        sheet.columns.filter(name='importe').update(data_type='float')
+        columns = list(sheet.columns.order_by('column_index'))
+        data_table = DataTable.objects.create(sheet=sheet, table_name=f"eav_{loader_class.__name__}",
+                                              storage_backend='eav')
+
+        loader = loader_class(data_table, columns)
+        frame = pd.DataFrame(rows, columns=self.HEADER)
+        for start in range(0, len(rows), batch_size):
+            values, fallbacks = coerce_batch(frame.iloc[start:start + batch_size], columns)
+            loader.write_batch(start, values, fallbacks)
+        loader.close()
+        return data_table
+
+    def test_executemany_loader_matches_bulk_create(self):
+        rows = self.make_rows(20)
+        rows[3] = (4, None, 'n/a')
+        rows[8] = (9, 'ES', None)
+
+        loaded = self.load(EAVStorageLoader, rows)
+        reference = self.load(BulkCreateEAVLoader, rows)
+
+        self.assertEqual(self.read_all(loaded), self.read_all(reference))
+        # Las lecturas muestran el texto original de los valores no convertibles
+        self.assertEqual(self.read_all(loaded)[3], (3, 4, None, 'n/a'))
+        # Una fila y una celda por valor, con el texto repetido guardado como código
+        self.assertEqual(DataRow.objects.filter(table=loaded).count(), 20)
+        self.assertEqual(DataCell.objects.filter(row__table=loaded).count(), 60)
+        self.assertEqual(DataTable.objects.get(id=loaded.id).dictionary_columns, [1])
+        self.assertEqual(DictionaryValue.objects.filter(column_definition__sheet=loaded.sheet).count(), 3)
+        self.assertEqual(DataCell.objects.filter(row__table=loaded, string_value='n/a').count(), 1)
+
+
+@override_settings(DATA_TABLE_PARQUET_ROW_GROUP_SIZE=10, DATA_TABLE_PARQUET_PART_ROWS=20)
+class ParquetStorageTests(DataTableTestCase):
+    """Backend Parquet: partes de 20 filas con grupos de 10"""
+
+    def open_table(self, rows):
+        sheet = self.upload_sheet(rows)
+        columns = list(sheet.columns.order_by('column_index'))
+        data_table = DataTable.objects.create(sheet=sheet, table_name='parquet_datos', storage_backend='parquet')
+        return data_table, columns
+
+    @staticmethod
+    def write(loader, columns, rows, start, end, batch_size=5):
+        frame = pd.DataFrame(rows, columns=DataTableTestCase.HEADER)
+        for position in range(start, end, batch_size):
+            values, fallbacks = coerce_batch(frame.iloc[position:min(position + batch_size, end)], columns)
+            loader.write_batch(position, values, fallbacks)
+
+    def test_loader_checkpoint_and_resume(self):
+        rows = self.make_rows(50)
+        data_table, columns = self.open_table(rows)
+        storage = data_table.get_storage()
+
+        loader = storage.open_loader(data_table, columns)
+        self.write(loader, columns, rows, 0, 45)
+        # Solo las partes cerradas cuentan: la tercera está a medio escribir
+        self.assertEqual(loader.checkpoint, 40)
+        self.assertEqual(storage.read_rows(data_table, columns, 0, 100), [])
+
+        # Una reanudación a mitad de parte descarta esa parte y las siguientes
+        loader = storage.open_loader(data_table, columns, start_row=30)
+        self.assertEqual(loader.checkpoint, 20)
+        SearchService.delete_from(data_table, loader.checkpoint)
+        self.write(loader, columns, rows, 20, 50)
+        loader.close()
+
+        self.assertEqual(self.read_all(data_table), [(i, *row) for i, row in enumerate(rows)])
+        self.assertEqual(len(os.listdir(get_table_dir(data_table))), 3)
+        self.assertFalse(os.path.exists(f"{get_table_dir(data_table)}.loading"))
+
+    def test_read_rows_reads_only_covering_row_groups(self):
+        rows = self.make_rows(50)
+        data_table = self.create_table(rows, storage_backend='parquet', batch_size=10)
+        columns = list(data_table.sheet.columns.order_by('column_index'))
+        storage = data_table.get_storage()
+        self.assertEqual(len(os.listdir(get_table_dir(data_table))), 3)
+
+        with mock.patch.object(pq.ParquetFile, 'read_row_group', autospec=True,
+                               side_effect=pq.ParquetFile.read_row_group) as read_row_group:
+            page = storage.read_rows(data_table, columns, 35, 5)
+            self.assertEqual([row[0] for row in page], [35, 36, 37, 38, 39])
+            # Filas 30-39: segundo grupo de la segunda parte
+            self.assertEqual([call.args[1] for call in read_row_group.call_args_list], [1])
+
+            read_row_group.reset_mock()
+            page = storage.read_rows(data_table, columns, 35, 8, descending=True)
+            self.assertEqual([row[0] for row in page], list(range(27, 35)))
+            self.assertEqual(read_row_group.call_count, 2)
+
+    def test_sorted_query_keeps_only_top_rows(self):
+        rows = self.make_rows(50)
+        for i in (4, 17, 33):
+            rows[i] = (i + 1, None, None)
+        tables = {backend: self.create_table(rows, storage_backend=backend) for backend in ('eav', 'parquet')}
+
+        specs = [
+            {'sort': ['-id'], 'limit': 6, 'offset': 3},
+            {'sort': ['-importe'], 'limit': 5},
+            {'sort': ['importe'], 'limit': 4, 'offset': 45},
+            {'sort': ['pais', '-id'], 'limit': 7, 'offset': 10},
+            {'filters': [{'column': 'id', 'op': 'gt', 'value': 20}], 'sort': ['-pais'], 'limit': 50},
+        ]
+        for spec in specs:
+            with self.subTest(spec=spec):
+                results = {}
+                for backend, data_table in tables.items():
+                    query = QueryService.parse(data_table, spec)
+                    query.row_ranges = None
+                    results[backend] = [list(row) for row in data_table.get_storage().query(data_table, query)]
+                self.assertEqual(results['parquet'], results['eav'])
+
+    def test_copy_links_parts(self):
+        rows = self.make_rows(50)
+        source = self.create_table(rows, storage_backend='parquet')
+        sheet = self.upload_sheet(rows)
+        copy = DataModelFactory.clone_data_table(source, sheet)
+
+        source_parts = sorted(os.listdir(get_table_dir(source)))
+        self.assertEqual(sorted(os.listdir(get_table_dir(copy))), source_parts)
+        for name in source_parts:
+            self.assertTrue(os.path.samefile(os.path.join(get_table_dir(source), name),
+                                             os.path.join(get_table_dir(copy), name)))
+
+        # La copia sigue siendo legible cuando se elimina la original
+        source.get_storage().delete(source)
+        self.assertEqual([row[1:] for row in self.read_all(copy)], rows)
+
+
+
+class PurgeServiceTests(DataTableTestCase):
+    """Vaciado y borrado de tablas y archivos con todos sus datos derivados"""
+
+    BACKENDS = ('eav', 'sql', 'parquet')
+
+    def search_count(self, data_table):
+        if not SearchService.is_available():
+            return 0
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT COUNT(*) FROM {SEARCH_TABLE} WHERE rowid >= %s AND rowid < %s",
+                [search_rowid(data_table.id, 0), search_rowid(data_table.id + 1, 0)]
+            )
+            return cursor.fetchone()[0]
+
+    def storage_exists(self, data_table):
+        """Indica si quedan datos de la tabla en el almacenamiento de su backend"""
+        if data_table.storage_backend == 'sql':
+            return get_physical_table_name(data_table) in connection.introspection.table_names()
+        if data_table.storage_backend == 'parquet':
+            return os.path.isdir(get_table_dir(data_table))
+        return DataRow.objects.filter(table_id=data_table.id).exists()
+
+    def create_with_exports(self, backend):
+        data_table = self.create_table(self.make_rows(30), storage_backend=backend)
+        export = ExportService.export_to_parquet(data_table.id)
+        self.assertTrue(default_storage.exists(export.file.name))
+        self.assertTrue(self.storage_exists(data_table))
+        if SearchService.is_available():
+            self.assertGreater(self.search_count(data_table), 0)
+        return DataTable.objects.get(id=data_table.id), export
+
+    def test_truncate_table_removes_data(self):
+        for backend in self.BACKENDS:
+            with self.subTest(backend=backend):
+                data_table, export = self.create_with_exports(backend)
+                version = data_table.data_version
+
+                PurgeService.truncate_table(data_table)
+
+                self.assertFalse(self.storage_exists(data_table))
+                self.assertFalse(DataCell.objects.filter(row__table_id=data_table.id).exists())
+                self.assertFalse(DictionaryValue.objects.filter(column_definition__sheet=data_table.sheet).exists())
+                self.assertEqual(self.search_count(data_table), 0)
+                self.assertFalse(TableExport.objects.filter(table=data_table).exists())
+                self.assertFalse(default_storage.exists(export.file.name))
+
+                data_table = DataTable.objects.get(id=data_table.id)
+                self.assertEqual((data_table.row_count, data_table.data_version), (0, version + 1))
+                self.assertFalse(data_table.sheet.columns.filter(profile__isnull=False).exists())
+
+    def test_purge_file_removes_everything(self):
+        for backend in self.BACKENDS:
+            with self.subTest(backend=backend):
+                data_table, export = self.create_with_exports(backend)
+                excel_file = data_table.sheet.excel_file
+                sheet_id = data_table.sheet_id
+
+                job = PurgeService.schedule_file_purge(excel_file)
+                JobQueue.run(JobQueue.claim_next('tests'))
+                job.refresh_from_db()
+                self.assertEqual(job.status, 'completed')
+
+                self.assertFalse(ExcelFile.objects.filter(id=excel_file.id).exists())
+                self.assertFalse(ExcelSheet.objects.filter(id=sheet_id).exists())
+                self.assertFalse(ColumnDefinition.objects.filter(sheet_id=sheet_id).exists())
+                self.assertFalse(DataTable.objects.filter(id=data_table.id).exists())
+                self.assertFalse(DataCell.objects.filter(row__table_id=data_table.id).exists())
+                self.assertFalse(DictionaryValue.objects.filter(column_definition__sheet_id=sheet_id).exists())
+                self.assertFalse(self.storage_exists(data_table))
+                self.assertEqual(self.search_count(data_table), 0)
+                self.assertFalse(default_storage.exists(export.file.name))
+
+                # El progreso del archivo eliminado se sigue consultando a través del trabajo de borrado
+                response = self.client.get(reverse('excel_files:progress', kwargs={'pk': excel_file.id}))
+                self.assertTrue(response.json()['deleted'])
+
+    def test_deleted_file_is_hidden_from_views(self):
+        data_table = self.create_table(self.make_rows(10))
+        excel_file = data_table.sheet.excel_file
+        table_kwargs = {'table_id': data_table.id}
+        self.assertEqual(self.client.get(reverse('data_models:view_table', kwargs=table_kwargs)).status_code, 200)
+
+        # Antes de que el trabajo de borrado se ejecute el archivo ya no se muestra
+        PurgeService.schedule_file_purge(excel_file)
+        self.assertEqual(self.client.get(reverse('excel_files:detail', kwargs={'pk': excel_file.id})).status_code, 404)
+        response = self.client.get(reverse('excel_files:list'))
+        self.assertNotIn(excel_file, response.context['object_list'])
+        self.assertEqual(response.context['total_files'], 0)
+        for name in ('view_table', 'table_rows', 'search', 'profile', 'export_csv'):
+            with self.subTest(view=name):
+                self.assertEqual(self.client.get(reverse(f'data_models:{name}', kwargs=table_kwargs)).status_code, 404)
+
+
+class SearchServiceTests(DataTableTestCase):
+    """Índice de búsqueda: rowid empaquetado y mantenimiento durante cargas, recargas y copias"""
+
+    def setUp(self):
+        super().setUp()
+        if not SearchService.is_available():
+            self.skipTest('La búsqueda de texto necesita SQLite')
+        self.rows = self.make_rows(30)
+
+    def found(self, data_table, text):
+        columns = list(data_table.sheet.columns.order_by('column_index'))
+        return [row['row_index'] for row in SearchService.search(data_table, columns, text, limit=1000)['rows']]
+
+    def matching(self, rows, country):
+        return [row_index for row_index, row in enumerate(rows) if row[1] == country]
+
+    def test_rowid_bounds(self):
+        self.assertEqual(search_rowid(1, MAX_ROW_INDEX, MAX_COLUMN_INDEX) + 1, search_rowid(2, 0))
+        self.assertEqual(table_rowid_end(1), search_rowid(2, 0))
+        self.assertLess(table_rowid_end(MAX_TABLE_ID), 2 ** 63)
+
+        for table_id, row_index, column_index in ((MAX_TABLE_ID + 1, 0, 0), (1, MAX_ROW_INDEX + 1, 0),
+                                                  (1, 0, MAX_COLUMN_INDEX + 1), (1, -1, 0)):
+            with self.subTest(table_id=table_id, row_index=row_index, column_index=column_index):
+                with self.assertRaises(ValueError):
+                    search_rowid(table_id, row_index, column_index)
+
+    def test_index_rows_rejects_overflow(self):
+        data_table = self.create_table(self.rows)
+        columns = list(data_table.sheet.columns.order_by('column_index'))
+        values = {col.column_index: pd.Series(['XX']) for col in columns}
+        fallbacks = {col.column_index: pd.Series([None], dtype=object) for col in columns}
+
+        with self.assertRaisesRegex(ValueError, 'índice de búsqueda'):
+            SearchService.index_rows(data_table, columns, [MAX_ROW_INDEX + 1], values, fallbacks)
+        self.assertEqual(self.found(data_table, 'PT'), self.matching(self.rows, 'PT'))
+        # Una página posterior a la última fila posible está vacía en vez de fallar
+        self.assertEqual(SearchService.search(data_table, columns, 'PT', after=MAX_ROW_INDEX)['rows'], [])
+
+    def test_delete_rows_and_rebuild(self):
+        data_table = self.create_table(self.rows)
+        expected = self.matching(self.rows, 'PT')
+
+        SearchService.delete_rows(data_table, expected[:2])
+        self.assertEqual(self.found(data_table, 'PT'), expected[2:])
+        SearchService.delete_from(data_table, 10)
+        self.assertEqual(self.found(data_table, 'PT'), [row for row in expected[2:] if row < 10])
+
+        SearchService.rebuild(data_table, list(data_table.sheet.columns.order_by('column_index')))
+        self.assertEqual(self.found(data_table, 'PT'), expected)
+        self.assertEqual(self.found(data_table, 'pt es'), [])
+
+    def test_search_after_refresh(self):
+        data_table = self.create_table(self.rows)
+        other = self.create_table(self.rows)
+
+        rows = list(self.rows)
+        rows[1] = (2, 'Italia', 3.0)
+        rows = rows[:25]
+        self.replace_sheet(data_table.sheet, rows)
+        data_table = DataModelFactory.refresh_data_table(data_table.sheet_id, batch_size=10)
+
+        self.assertEqual(self.found(data_table, 'ital'), [1])
+        self.assertEqual(self.found(data_table, 'PT'), self.matching(rows, 'PT'))
+        # El índice de la otra tabla no cambia
+        self.assertEqual(self.found(other, 'PT'), self.matching(self.rows, 'PT'))
+        self.assertEqual(self.found(other, 'ital'), [])
+
+    def test_search_after_clone(self):
+        # openpyxl guarda la hora en el libro: el duplicado reutiliza los mismos bytes
+        content = build_workbook(self.HEADER, self.rows)
+        excel_file = ExcelFile.objects.create(name='datos.xlsx', file=SimpleUploadedFile('datos.xlsx', content))
+        sheet = ExcelFileManager.read_excel_sheets(excel_file.id)[0]
+        SchemaDetector.detect_column_types(sheet.id)
+        source = DataModelFactory.create_data_table_from_sheet(sheet.id)
+
+        duplicate = ExcelFile.objects.create(name='copia.xlsx', file=SimpleUploadedFile('copia.xlsx', content))
+        self.assertIsNotNone(ExcelFileManager.link_duplicate(duplicate))
+        clone = DataTable.objects.get(sheet__excel_file=duplicate)
+
+        expected = self.matching(self.rows, 'PT')
+        self.assertEqual(self.found(clone, 'PT'), expected)
+        # La copia conserva sus entradas cuando se elimina la tabla original
+        PurgeService.purge_table(DataTable.objects.get(id=source.id))
+        self.assertEqual(self.found(clone, 'PT'), expected)
+
+
+class ExportTests(DataTableTestCase):
+    """Contenido de las exportaciones CSV, JSON Lines y Excel con texto a escapar y valores nulos"""
+
+    HEADER = ('id', 'nombre', 'pais', 'importe')
+    BACKENDS = ('eav', 'sql', 'parquet')
+
+    def setUp(self):
+        super().setUp()
+        special = ['Pérez, Ana', 'dice "hola"', 'línea\nnueva', None, "tab\tcoma,'simple'", '']
+        self.rows = [
+            (i, special[i - 1] if i <= len(special) else f'cliente {i}', 'ES' if i % 2 else 'FR',
+             None if i % 5 == 0 else i * 1.25)
+            for i in range(1, 31)
+        ]
+        # El texto vacío se lee como celda vacía, igual que el nulo
+        self.expected = [(i, nombre or None, pais, importe) for i, nombre, pais, importe in self.rows]
+
+    @staticmethod
+    def normalize(row):
+        """Fila exportada como texto o valores nativos llevada a (int, str | None, str, float | None)"""
+        id_, nombre, pais, importe = row
+        return (int(id_), nombre if nombre not in (None, '') else None, pais,
+                float(importe) if importe not in (None, '') else None)
+
+    def test_csv_export(self):
+        for backend in self.BACKENDS:
+            with self.subTest(backend=backend):
+                data_table = self.create_table(self.rows, storage_backend=backend)
+                content = b''.join(ExportService.iter_csv(data_table.id)).decode('utf-8')
+                self.assertIn('"dice ""hola"""', content)
+                rows = list(csv.reader(io.StringIO(content, newline='')))
+                self.assertEqual(rows[0], list(self.HEADER))
+                self.assertEqual([self.normalize(row) for row in rows[1:]], self.expected)
+
+                response = self.client.get(reverse('data_models:export_csv', kwargs={'table_id': data_table.id}))
+                self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+                self.assertIn('.csv"', response['Content-Disposition'])
+                self.assertEqual(b''.join(response.streaming_content).decode('utf-8'), content)
+
+    def test_ndjson_export(self):
+        for backend in self.BACKENDS:
+            with self.subTest(backend=backend):
+                data_table = self.create_table(self.rows, storage_backend=backend)
+                content = b''.join(ExportService.iter_ndjson(data_table.id)).decode('utf-8')
+                records = [json.loads(line) for line in content.splitlines()]
+                self.assertEqual(list(records[0]), list(self.HEADER))
+                self.assertEqual([self.normalize(record.values()) for record in records], self.expected)
+                # Los nulos son null en JSON, no texto vacío
+                self.assertIsNone(records[4]['importe'])
+                self.assertIsNone(records[3]['nombre'])
+
+                response = self.client.get(reverse('data_models:export_json', kwargs={'table_id': data_table.id}))
+                self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+                self.assertEqual(b''.join(response.streaming_content).decode('utf-8'), content)
+
+    def test_excel_export(self):
+        for backend in self.BACKENDS:
+            with self.subTest(backend=backend):
+                data_table = self.create_table(self.rows, storage_backend=backend)
+                export = ExportService.export_to_excel(data_table.id)
+                with export.file.open('rb') as handle:
+                    rows = list(load_workbook(handle).worksheets[0].values)
+                self.assertEqual(rows[0], self.HEADER)
+                self.assertEqual([self.normalize(row) for row in rows[1:]], self.expected)
+                self.assertIsNone(rows[5][3])
+
+                response = self.client.get(reverse('data_models:export_excel', kwargs={'table_id': data_table.id}))
+                self.assertEqual(response.status_code, 200)
+                workbook = load_workbook(io.BytesIO(b''.join(response.streaming_content)))
+                self.assertEqual(list(workbook.worksheets[0].values), rows)
+
+
+class ExportReuseTests(DataTableTestCase):
+    """Reutilización de exportaciones por versión de los datos y opciones"""
+
+    def setUp(self):
+        super().setUp()
+        self.rows = self.make_rows(30)
+        self.data_table = self.create_table(self.rows)
+
+    def export(self, export_format='parquet'):
+        if export_format == 'excel':
+            return ExportService.export_to_excel(self.data_table.id)
+        return ExportService.export_to_parquet(self.data_table.id)
+
+    def test_export_is_reused_while_data_unchanged(self):
+        for export_format in ('parquet', 'excel'):
+            with self.subTest(export_format=export_format):
+                first = self.export(export_format)
+                with mock.patch.object(ExportService, f'_write_{export_format}') as write:
+                    self.assertEqual(self.export(export_format), first)
+                write.assert_not_called()
+                self.assertEqual(TableExport.objects.filter(format=export_format).count(), 1)
+
+    def test_other_options_build_new_export(self):
+        first = self.export()
+        with override_settings(EXPORT_PARQUET_ROW_GROUP_SIZE=10):
+            second = self.export()
+            self.assertEqual(self.export(), second)
+        self.assertNotEqual(second.options_key, first.options_key)
+        self.assertEqual(pq.ParquetFile(second.file.path).metadata.num_row_groups, 3)
+        self.assertEqual(self.export(), first)
+
+    def test_missing_file_is_rebuilt(self):
+        first = self.export()
+        default_storage.delete(first.file.name)
+        second = self.export()
+        self.assertNotEqual(second.id, first.id)
+        self.assertTrue(default_storage.exists(second.file.name))
+
+    def test_reload_invalidates_export(self):
+        first = self.export()
+
+        # Una recarga sin cambios conserva la versión de los datos y la exportación
+        self.replace_sheet(self.data_table.sheet, self.rows)
+        DataModelFactory.refresh_data_table(self.data_table.sheet_id)
+        self.assertEqual(DataTable.objects.get(id=self.data_table.id).data_version, first.data_version)
+        self.assertEqual(self.export(), first)
+
+        rows = list(self.rows)
+        rows[0] = (1, 'IT', 99.5)
+        self.replace_sheet(self.data_table.sheet, rows)
+        DataModelFactory.refresh_data_table(self.data_table.sheet_id)
+        second = self.export()
+        self.assertEqual(second.data_version, first.data_version + 1)
+        self.assertEqual(pq.read_table(second.file.path).slice(0, 1).to_pylist(),
+                         [{'id': 1, 'pais': 'IT', 'importe': 99.5}])
+
+
+class IngestPoolTests(DataTableTestCase):
+    """Carga de las hojas de un libro con varios procesos de trabajo"""
+
+    def setUp(self):
+        super().setUp()
+        settings_override = override_settings(INGEST_WORKERS=2, SHEET_READER_CHUNK_SIZE=10)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def upload_workbook(self, sheets):
+        """Sube un libro con las hojas {nombre: filas} y detecta sus columnas"""
+        workbook = Workbook()
+        workbook.remove(workbook.active)
+        for name, rows in sheets.items():
+            worksheet = workbook.create_sheet(name)
+            worksheet.append(list(self.HEADER))
+            for row in rows:
+                worksheet.append(list(row))
+        buffer = io.BytesIO()
+        workbook.save(buffer)
+        excel_file = ExcelFile.objects.create(name='libro.xlsx',
+                                              file=SimpleUploadedFile('libro.xlsx', buffer.getvalue()))
+        for sheet in ExcelFileManager.read_excel_sheets(excel_file.id):
+            SchemaDetector.detect_column_types(sheet.id)
+        return excel_file
+
+    def test_specs_and_profiles_pickle(self):
+        data_table = self.create_table(self.make_rows(25))
+        columns = list(data_table.sheet.columns.order_by('column_index'))
+        specs = [ColumnSpec(col.original_name, col.column_index, col.data_type) for col in columns]
+        self.assertEqual(pickle.loads(pickle.dumps(specs)), specs)
+
+        path = SheetCache.get_sheet_parts(data_table.sheet.excel_file, data_table.sheet.name)[0]
+        row_count, values, fallbacks, profiler = coerce_part(path, specs)
+        restored = pickle.loads(pickle.dumps((row_count, values, fallbacks, profiler)))
+        self.assertEqual(restored[0], 10)
+        self.assertEqual(restored[3].profiles(), profiler.profiles())
+        for col in specs:
+            pd.testing.assert_series_equal(restored[1][col.column_index], values[col.column_index])
+
+    def test_imap_bounds_pending_work(self):
+        submitted = []
+
+        def tasks():
+            for i in range(20):
+                submitted.append(i)
+                yield i, (i, 2)
+
+        results = []
+        with IngestPool() as pool:
+            self.assertEqual(pool.workers, 2)
+            self.assertIsNotNone(pool.executor)
+            for key, result in pool.imap(pow, tasks()):
+                # Como mucho dos tareas por proceso por delante del resultado entregado
+                self.assertLessEqual(len(submitted) - len(results), pool.workers * 2)
+                results.append((key, result))
+        self.assertEqual(results, [(i, i ** 2) for i in range(20)])
+
+    def test_create_tables_in_parallel_and_resume(self):
+        sheets = {'Ventas': self.make_rows(35), 'Compras': self.make_rows(22, start=100), 'Vacia': []}
+        excel_file = self.upload_workbook(sheets)
+
+        # La carga se interrumpe en el segundo lote de la primera hoja
+        save_checkpoint = DataModelFactory._save_checkpoint
+        calls = []
+
+        def fail_on_second(data_table, checkpoint):
+            calls.append(checkpoint)
+            if len(calls) == 2:
+                raise OSError('disco lleno')
+            save_checkpoint(data_table, checkpoint)
+
+        with mock.patch.object(DataModelFactory, '_save_checkpoint', side_effect=fail_on_second):
+            with self.assertRaises(OSError):
+                DataModelFactory.create_data_tables_from_file(excel_file.id, storage_backend='eav')
+        interrupted = DataTable.objects.get(sheet__excel_file=excel_file, sheet__name='Ventas')
+        self.assertEqual((interrupted.status, interrupted.loaded_rows), ('loading', 10))
+
+        progress = []
+        data_tables = DataModelFactory.create_data_tables_from_file(
+            excel_file.id, progress_callback=lambda *args: progress.append(args)
+        )
+        self.assertEqual([table.sheet.name for table in data_tables], ['Ventas', 'Compras', 'Vacia'])
+        self.assertEqual(data_tables[0].id, interrupted.id)
+        for data_table in data_tables:
+            with self.subTest(sheet=data_table.sheet.name):
+                data_table = DataTable.objects.get(id=data_table.id)
+                self.assertEqual(data_table.status, 'ready')
+                self.assertEqual(data_table.row_count, len(sheets[data_table.sheet.name]))
+                self.assertEqual([row[1:] for row in self.read_all(data_table)], sheets[data_table.sheet.name])
+        self.assertEqual(progress[-1], ('load', 57, 57))
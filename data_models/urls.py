@@ -5,5 +5,12 @@ app_name = "data_models"
 
 urlpatterns = [
     path('table/<int:table_id>/', views.view_table_data, name='view_table'),
-    path('table/<int:table_id>/export/parquet/', views.export_table_parquet, name='export_parquet')
+    path('table/<int:table_id>/rows/', views.table_rows_json, name='table_rows'),
+    path('table/<int:table_id>/query/', views.query_table, name='query'),
+    path('table/<int:table_id>/search/', views.search_table_json, name='search'),
+    path('table/<int:table_id>/profile/', views.table_profile, name='profile'),
+    path('table/<int:table_id>/export/parquet/', views.export_table_parquet, name='export_parquet'),
+    path('table/<int:table_id>/export/csv/', views.export_table_csv, name='export_csv'),
+    path('table/<int:table_id>/export/json/', views.export_table_json, name='export_json'),
+    path('table/<int:table_id>/export/excel/', views.export_table_excel, name='export_excel'),
 ]
\ No newline at end of file
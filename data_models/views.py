@@ -1,45 +1,206 @@
+import json
 import logging
 import os
 from django.shortcuts import render, get_object_or_404, redirect
-from django.http import FileResponse
+from django.http import FileResponse, JsonResponse, StreamingHttpResponse
 from django.conf import settings
 from django.contrib import messages
+from excel_files.models import ColumnDefinition
 from .models import DataTable
 from .services.model_factory import DataModelFactory
 from .services.export_service import ExportService
+from .services.query_service import QueryService
+from .services.search_service import SearchService
 
 logger = logging.getLogger(__name__)
 
-def view_table_data(request, table_id):
+# Límite de filas por página en la vista y en la API JSON
+MAX_PAGE_SIZE = 1000
+
+def _get_page_params(request):
+    """Lee de la consulta la página, el tamaño de página y el cursor"""
+    try:
+        page = max(int(request.GET.get('page', 1)), 1)
+        page_size = int(request.GET.get('page_size', 50))
+    except ValueError:
+        page, page_size = 1, 50
+    page_size = min(max(page_size, 1), MAX_PAGE_SIZE)
+    return page, page_size, request.GET.get('cursor')
+
+
+def _get_table_page(table_id, page, page_size, cursor):
+    try:
+        return DataModelFactory.get_table_data(table_id, page, page_size, cursor=cursor)
+    except ValueError:
+        # Cursor caducado o manipulado: volver a la página solicitada
+        logger.warning(f"Cursor de paginación no válido para la tabla {table_id}")
+        return DataModelFactory.get_table_data(table_id, page, page_size)
+
+
+def _search_table(request, data_table):
     """
-    Vista para mostrar los datos de una tabla en formato tabular
+    Busca el texto del parámetro q en la tabla (ver SearchService.search), con
+    los parámetros limit y after para paginar
+
+    Returns:
+        tuple: (definiciones de columnas, resultado de la búsqueda)
     """
-    data_table = get_object_or_404(DataTable, id=table_id)
+    try:
+        limit = int(request.GET.get('limit') or 0) or None
+        after = int(request.GET['after']) if request.GET.get('after') else None
+    except ValueError:
+        limit, after = None, None
+    columns = list(ColumnDefinition.objects.filter(sheet=data_table.sheet).order_by('column_index'))
+    return columns, SearchService.search(data_table, columns, request.GET.get('q', ''), limit, after)
+
 
-    # Obtener número de página de la consulta
-    page = int(request.GET.get('page', 1))
-    page_size = int(request.GET.get('page_size', 50))  # Ajusta según necesites
+def view_table_data(request, table_id):
+    """
+    Vista para mostrar los datos de una tabla en formato tabular. Con el
+    parámetro q muestra las filas que contienen el texto buscado.
+    """
+    data_table = get_object_or_404(DataTable, id=table_id, status='ready', sheet__excel_file__deleted=False)
 
-    # Usar el método existente para obtener los datos
-    table_data = DataModelFactory.get_table_data(table_id, page, page_size)
+    search_text = request.GET.get('q', '').strip()
+    if search_text:
+        columns, result = _search_table(request, data_table)
+        # Cada celda con su valor y, si coincide con la búsqueda, su texto resaltado
+        rows = [
+            {
+                'row_index': row['row_index'],
+                'cells': [{'value': value, 'html': row['highlights'].get(col.column_index)}
+                          for col, value in zip(columns, row['values'])],
+            }
+            for row in result['rows']
+        ]
+        context = {
+            'data_table': data_table,
+            'search_text': search_text,
+            'search_available': SearchService.is_available(),
+            'columns': columns,
+            'rows': rows,
+            'next_after': result['next_after'],
+        }
+        return render(request, 'data_models/view_table.html', context)
 
-    # Calcular total de páginas
-    total_pages = (table_data['total_rows'] + page_size - 1) // page_size
+    # Obtener la página de la consulta: por cursor o por número de página
+    page, page_size, cursor = _get_page_params(request)
 
-    offset = (page - 1) * page_size
+    table_data = _get_table_page(table_id, page, page_size, cursor)
 
     context = {
         'data_table': data_table,
         'table_data': table_data,
-        'current_page': page,
-        'total_pages': total_pages,
+        'current_page': table_data['page'],
+        'total_pages': table_data['total_pages'],
         'page_size': page_size,
-        'offset': offset
     }
 
     return render(request, 'data_models/view_table.html', context)
 
 
+def table_rows_json(request, table_id):
+    """
+    Devuelve en JSON una página de datos de la tabla, con los cursores para
+    pedir la siguiente y la anterior
+    """
+    get_object_or_404(DataTable, id=table_id, status='ready', sheet__excel_file__deleted=False)
+
+    page, page_size, cursor = _get_page_params(request)
+    table_data = _get_table_page(table_id, page, page_size, cursor)
+
+    return JsonResponse(table_data)
+
+
+def query_table(request, table_id):
+    """
+    API de consulta: filtros, orden, proyección, agrupación y agregados
+    ejecutados en el almacenamiento de la tabla. La consulta llega en JSON en
+    el cuerpo de un POST o en el parámetro q de un GET (ver QueryService) y el
+    resultado se envía en JSON por bloques.
+
+    Un GET no modifica nada. Un POST, protegido por CSRF como el resto de la
+    aplicación (cabecera X-CSRFToken con la cookie csrftoken), encola además
+    la creación de índices de valores para las columnas que filtra u ordena.
+    """
+    data_table = get_object_or_404(DataTable, id=table_id, status='ready', sheet__excel_file__deleted=False)
+
+    try:
+        raw = request.body if request.method == 'POST' else request.GET.get('q', '{}')
+        query = QueryService.parse(data_table, json.loads(raw or '{}'))
+    except json.JSONDecodeError as e:
+        return JsonResponse({'error': f'JSON no válido: {str(e)}'}, status=400)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    # Índices para las columnas filtradas u ordenadas, creados en segundo plano
+    if request.method == 'POST':
+        QueryService.request_value_indexes(data_table, query)
+
+    return StreamingHttpResponse(QueryService.iter_json(data_table, query), content_type='application/json')
+
+
+def search_table_json(request, table_id):
+    """
+    Búsqueda de texto en JSON: las filas que contienen todas las palabras del
+    parámetro q (como prefijos, sin distinguir mayúsculas ni acentos), con el
+    HTML de las celdas coincidentes resaltado con <mark>. Para la página
+    siguiente se pasa next_after en el parámetro after.
+    """
+    data_table = get_object_or_404(DataTable, id=table_id, status='ready', sheet__excel_file__deleted=False)
+
+    if not SearchService.is_available():
+        return JsonResponse({'error': 'La búsqueda de texto solo está disponible con SQLite'}, status=501)
+
+    columns, result = _search_table(request, data_table)
+    names = {col.column_index: col.name for col in columns}
+    return JsonResponse({
+        'query': request.GET.get('q', ''),
+        'columns': [col.name for col in columns],
+        'rows': [
+            {
+                'row_index': row['row_index'],
+                'values': row['values'],
+                'highlights': {names[index]: html for index, html in row['highlights'].items()},
+            }
+            for row in result['rows']
+        ],
+        'next_after': result['next_after'],
+    })
+
+
+def table_profile(request, table_id):
+    """
+    Devuelve en JSON el perfil de cada columna de la tabla (nulos, distintos,
+    mínimo, máximo, media, valores más frecuentes, histograma), calculado
+    durante la carga, sin leer los datos
+    """
+    data_table = get_object_or_404(DataTable, id=table_id, status='ready', sheet__excel_file__deleted=False)
+
+    columns = []
+    for col in ColumnDefinition.objects.filter(sheet=data_table.sheet).order_by('column_index'):
+        profile = col.get_profile()
+        if profile is not None:
+            # Los mapas de zonas son internos de la API de consulta
+            profile = {key: value for key, value in profile.items() if key != 'zones'}
+        columns.append({
+            'name': col.name,
+            'original_name': col.original_name,
+            'column_index': col.column_index,
+            'data_type': col.data_type,
+            'indexed': col.column_index in data_table.value_indexes,
+            'dictionary': col.column_index in data_table.dictionary_columns,
+            'profile': profile,
+        })
+
+    return JsonResponse({
+        'table': data_table.table_name,
+        'row_count': data_table.row_count,
+        'data_version': data_table.data_version,
+        'columns': columns,
+    })
+
+
 def export_table_parquet(request, table_id):
     """
     Vista para exportar una tabla de datos a formato Parquet
@@ -52,7 +213,7 @@ def export_table_parquet(request, table_id):
         FileResponse con el archivo Parquet para descargar o redirección a la vista de tabla
     """
     try:
-        data_table = get_object_or_404(DataTable, id=table_id)
+        data_table = get_object_or_404(DataTable, id=table_id, status='ready', sheet__excel_file__deleted=False)
 
         # Exportar tabla a Parquet usando el servicio actualizado
         export_service = ExportService()
@@ -84,3 +245,65 @@ def export_table_parquet(request, table_id):
         logger.error(f"Error al exportar tabla {table_id} a Parquet: {str(e)}")
         messages.error(request, f"Error al exportar tabla: {str(e)}")
         return redirect('data_models:view_table', table_id=table_id)
+
+
+def export_table_csv(request, table_id):
+    """
+    Vista para descargar una tabla en CSV. El archivo se genera por lotes
+    mientras se envía, sin construirlo antes en memoria ni en disco.
+    """
+    data_table = get_object_or_404(DataTable, id=table_id, status='ready', sheet__excel_file__deleted=False)
+
+    response = StreamingHttpResponse(ExportService.iter_csv(table_id), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{_export_file_name(data_table)}.csv"'
+    return response
+
+
+def export_table_json(request, table_id):
+    """
+    Vista para descargar una tabla en JSON Lines (un objeto JSON por fila),
+    generado por lotes mientras se envía
+    """
+    data_table = get_object_or_404(DataTable, id=table_id, status='ready', sheet__excel_file__deleted=False)
+
+    response = StreamingHttpResponse(ExportService.iter_ndjson(table_id), content_type='application/x-ndjson')
+    response['Content-Disposition'] = f'attachment; filename="{_export_file_name(data_table)}.jsonl"'
+    return response
+
+
+def export_table_excel(request, table_id):
+    """
+    Vista para exportar una tabla de datos a formato Excel (.xlsx)
+
+    Returns:
+        FileResponse con el archivo para descargar o redirección a la vista de tabla
+    """
+    try:
+        data_table = get_object_or_404(DataTable, id=table_id, status='ready', sheet__excel_file__deleted=False)
+        export = ExportService.export_to_excel(table_id)
+
+        download = request.GET.get('download', 'true').lower() == 'true'
+        if download:
+            response = FileResponse(
+                export.file.open('rb'),
+                content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+            )
+            response['Content-Disposition'] = f'attachment; filename="{os.path.basename(export.file.name)}"'
+
+            logger.info(f"Usuario {request.user.username if request.user.is_authenticated else 'anónimo'} "
+                        f"ha descargado la tabla {data_table.table_name} en formato Excel")
+            return response
+
+        messages.success(request,
+                         f"Exportación a Excel completada con éxito. El archivo está disponible en la sección 'Exportaciones previas'.")
+        return redirect('data_models:view_table', table_id=table_id)
+
+    except Exception as e:
+        logger.error(f"Error al exportar tabla {table_id} a Excel: {str(e)}")
+        messages.error(request, f"Error al exportar tabla: {str(e)}")
+        return redirect('data_models:view_table', table_id=table_id)
+
+
+def _export_file_name(data_table):
+    """Nombre base de los archivos descargados"""
+    return data_table.table_name.replace(" ", "_").replace('"', '').lower()
@@ -1,6 +1,7 @@
 from django.contrib import admin
-from .models import ExcelFile, ExcelSheet, ColumnDefinition
+from .models import ExcelFile, ExcelSheet, ColumnDefinition, ProcessingJob
 
 admin.site.register(ExcelFile)
 admin.site.register(ExcelSheet)
 admin.site.register(ColumnDefinition)
+admin.site.register(ProcessingJob)
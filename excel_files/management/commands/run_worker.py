@@ -0,0 +1,34 @@
+import os
+import socket
+import time
+from django.core.management.base import BaseCommand
+from excel_files.services.job_queue import JobQueue
+
+
+class Command(BaseCommand):
+    help = "Ejecuta el worker local que procesa la cola de trabajos de archivos Excel"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Procesa los trabajos pendientes y termina")
+        parser.add_argument('--sleep', type=float, default=2.0, help="Segundos de espera cuando la cola está vacía")
+        parser.add_argument('--name', default=None, help="Nombre del worker (por defecto host:pid)")
+
+    def handle(self, *args, **options):
+        worker_name = options['name'] or f"{socket.gethostname()}:{os.getpid()}"
+        self.stdout.write(f"Worker {worker_name} iniciado")
+
+        try:
+            while True:
+                JobQueue.requeue_stale()
+                job = JobQueue.claim_next(worker_name)
+
+                if job is None:
+                    if options['once']:
+                        break
+                    time.sleep(options['sleep'])
+                    continue
+
+                self.stdout.write(f"Trabajo {job.id}: {job}")
+                JobQueue.run(job)
+        except KeyboardInterrupt:
+            self.stdout.write("Worker detenido")
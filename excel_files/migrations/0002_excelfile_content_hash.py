@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 11:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("excel_files", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="excelfile",
+            name="content_hash",
+            field=models.CharField(blank=True, db_index=True, max_length=64, null=True),
+        ),
+    ]
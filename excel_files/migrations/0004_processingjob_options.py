@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 11:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("excel_files", "0003_processingjob"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="processingjob",
+            name="options",
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
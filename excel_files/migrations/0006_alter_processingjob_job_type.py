@@ -0,0 +1,27 @@
+# Generated by Django 5.2 on 2026-10-18 11:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("excel_files", "0005_alter_processingjob_job_type"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="processingjob",
+            name="job_type",
+            field=models.CharField(
+                choices=[
+                    ("process_file", "Procesar archivo"),
+                    ("detect_sheets", "Detectar columnas"),
+                    ("create_table", "Crear tabla de datos"),
+                    ("create_tables", "Crear tablas del libro"),
+                    ("ingest_files", "Carga masiva de archivos"),
+                ],
+                max_length=30,
+            ),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-18 11:36
+
+import excel_files.models
+import excel_files.uploads
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("excel_files", "0006_alter_processingjob_job_type"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="excelfile",
+            name="file",
+            field=models.FileField(
+                storage=excel_files.uploads.ContentAddressedStorage(),
+                upload_to=excel_files.models.get_file_path,
+            ),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2 on 2026-10-18 11:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("excel_files", "0007_alter_excelfile_file"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="processingjob",
+            name="job_type",
+            field=models.CharField(
+                choices=[
+                    ("process_file", "Procesar archivo"),
+                    ("detect_sheets", "Detectar columnas"),
+                    ("create_table", "Crear tabla de datos"),
+                    ("create_tables", "Crear tablas del libro"),
+                    ("ingest_files", "Carga masiva de archivos"),
+                    ("refresh_file", "Actualizar con una nueva versión"),
+                ],
+                max_length=30,
+            ),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2 on 2026-10-18 11:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("excel_files", "0008_alter_processingjob_job_type"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="excelfile",
+            name="deleted",
+            field=models.BooleanField(db_index=True, default=False),
+        ),
+        migrations.AlterField(
+            model_name="processingjob",
+            name="job_type",
+            field=models.CharField(
+                choices=[
+                    ("process_file", "Procesar archivo"),
+                    ("detect_sheets", "Detectar columnas"),
+                    ("create_table", "Crear tabla de datos"),
+                    ("create_tables", "Crear tablas del libro"),
+                    ("ingest_files", "Carga masiva de archivos"),
+                    ("refresh_file", "Actualizar con una nueva versión"),
+                    ("purge_file", "Eliminar archivo"),
+                ],
+                max_length=30,
+            ),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 12:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("excel_files", "0009_excelfile_deleted_alter_processingjob_job_type"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="columndefinition",
+            name="profile",
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2 on 2026-10-18 12:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("excel_files", "0010_columndefinition_profile"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="processingjob",
+            name="job_type",
+            field=models.CharField(
+                choices=[
+                    ("process_file", "Procesar archivo"),
+                    ("detect_sheets", "Detectar columnas"),
+                    ("create_table", "Crear tabla de datos"),
+                    ("create_tables", "Crear tablas del libro"),
+                    ("ingest_files", "Carga masiva de archivos"),
+                    ("refresh_file", "Actualizar con una nueva versión"),
+                    ("purge_file", "Eliminar archivo"),
+                    ("index_table", "Crear índices de consulta"),
+                ],
+                max_length=30,
+            ),
+        ),
+    ]
@@ -1,11 +1,17 @@
 from django.db import models
 import uuid
 import os
+from excel_files.uploads import ContentAddressedStorage, compute_content_hash
 
 
 def get_file_path(instance, filename):
-    """Genera una ruta única para cada archivo subido"""
+    """
+    Genera la ruta de cada archivo subido a partir del hash de su contenido,
+    de modo que los archivos idénticos comparten ruta y se guardan una vez
+    """
     ext = filename.split('.')[-1]
+    if instance.content_hash:
+        return os.path.join('excel_files', instance.content_hash[:2], f"{instance.content_hash}.{ext}")
     filename = f"{uuid.uuid4()}.{ext}"
     return os.path.join('excel_files', filename)
 
@@ -16,25 +22,55 @@ class ExcelFile(models.Model):
     """
     name = models.CharField(max_length=255)
     description = models.TextField(blank=True, null=True)
-    file = models.FileField(upload_to=get_file_path)
+    file = models.FileField(upload_to=get_file_path, storage=ContentAddressedStorage())
     uploaded_at = models.DateTimeField(auto_now_add=True)
     processed = models.BooleanField(default=False)
     error = models.TextField(blank=True, null=True)
+    content_hash = models.CharField(max_length=64, blank=True, null=True, db_index=True)
+    # Borrado pendiente: el archivo ya no se muestra y un trabajo purge_file lo elimina
+    deleted = models.BooleanField(default=False, db_index=True)
 
     objects = models.Manager()
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        # El hash del contenido decide la ruta del archivo: calcularlo antes de guardarlo
+        if self.file and not self.file._committed:
+            self.content_hash = compute_content_hash(self.file.file)
+        super(ExcelFile, self).save(*args, **kwargs)
+
     def delete(self, *args, **kwargs):
         """
 
         """
-        if self.file:
-            if os.path.isfile(self.file.path):
-                os.remove(self.file.path)
+        self.release_content()
         super(ExcelFile, self).delete(*args, **kwargs)
 
+    def release_content(self):
+        """Elimina el archivo físico y sus hojas en caché si ningún otro registro los comparte"""
+        self.release_version(self.file.name if self.file else None, self.content_hash)
+
+    def release_version(self, file_name, content_hash):
+        """
+        Elimina un archivo físico y las hojas en caché de un contenido si ningún
+        otro registro los comparte. Con los valores anteriores a una sustitución
+        libera la versión que este registro ya no usa.
+        """
+        others = ExcelFile.objects.exclude(pk=self.pk)
+
+        # El archivo físico se comparte entre las subidas del mismo contenido
+        if file_name and not others.filter(file=file_name).exists():
+            path = self.file.storage.path(file_name)
+            if os.path.isfile(path):
+                os.remove(path)
+
+        # Eliminar las hojas en caché si ningún otro archivo comparte el contenido
+        if content_hash and not others.filter(content_hash=content_hash).exists():
+            from excel_files.services.sheet_cache import SheetCache
+            SheetCache.invalidate(content_hash)
+
 
 class ExcelSheet(models.Model):
     """
@@ -74,6 +110,8 @@ class ColumnDefinition(models.Model):
     column_index = models.IntegerField()
     data_type = models.CharField(max_length=20, choices=DATA_TYPES)
     nullable = models.BooleanField(default=True)
+    # Estadísticas calculadas al cargar la tabla de datos (ver ColumnProfiler)
+    profile = models.JSONField(blank=True, null=True)
 
     objects = models.Manager()
 
@@ -82,3 +120,77 @@ class ColumnDefinition(models.Model):
 
     def __str__(self):
         return f"{self.sheet.name} - {self.name} ({self.data_type})"
+
+    def get_profile(self):
+        """Perfil de la columna si se calculó con su tipo de datos actual"""
+        if self.profile and self.profile.get('data_type') == self.data_type:
+            return self.profile
+        return None
+
+
+class ProcessingJob(models.Model):
+    """Trabajo de procesamiento en segundo plano, ejecutado por el comando run_worker"""
+    JOB_TYPES = (
+        ('process_file', 'Procesar archivo'),
+        ('detect_sheets', 'Detectar columnas'),
+        ('create_table', 'Crear tabla de datos'),
+        ('create_tables', 'Crear tablas del libro'),
+        ('ingest_files', 'Carga masiva de archivos'),
+        ('refresh_file', 'Actualizar con una nueva versión'),
+        ('purge_file', 'Eliminar archivo'),
+        ('index_table', 'Crear índices de consulta'),
+    )
+
+    STATUS_CHOICES = (
+        ('pending', 'Pendiente'),
+        ('running', 'En ejecución'),
+        ('completed', 'Completado'),
+        ('failed', 'Fallido'),
+        ('cancelled', 'Cancelado'),
+    )
+
+    ACTIVE_STATUSES = ('pending', 'running')
+
+    job_type = models.CharField(max_length=30, choices=JOB_TYPES)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', db_index=True)
+    # El trabajo sobrevive al archivo para que el borrado (purge_file) pueda registrar su resultado
+    excel_file = models.ForeignKey(ExcelFile, on_delete=models.SET_NULL, related_name='jobs', blank=True, null=True)
+    sheet = models.ForeignKey(ExcelSheet, on_delete=models.CASCADE, related_name='jobs', blank=True, null=True)
+    options = models.JSONField(default=dict, blank=True)
+
+    # Progreso de la etapa actual
+    stage = models.CharField(max_length=50, blank=True, default='')
+    rows_processed = models.BigIntegerField(default=0)
+    rows_total = models.BigIntegerField(default=0)
+
+    # Reintentos y cancelación
+    attempts = models.IntegerField(default=0)
+    max_attempts = models.IntegerField(default=3)
+    run_after = models.DateTimeField(blank=True, null=True)
+    cancel_requested = models.BooleanField(default=False)
+    error = models.TextField(blank=True, null=True)
+
+    worker = models.CharField(max_length=255, blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    heartbeat_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    objects = models.Manager()
+
+    class Meta:
+        ordering = ['created_at']
+
+    def __str__(self):
+        file_name = self.excel_file.name if self.excel_file else 'archivo eliminado'
+        return f"{self.get_job_type_display()} - {file_name} ({self.status})"
+
+    @property
+    def is_active(self):
+        return self.status in self.ACTIVE_STATUSES
+
+    def get_percent(self):
+        """Porcentaje de avance de la etapa actual"""
+        if not self.rows_total:
+            return 100 if self.status == 'completed' else 0
+        return min(100, int(self.rows_processed * 100 / self.rows_total))
@@ -0,0 +1,174 @@
+import logging
+import os
+import time
+import traceback
+import zipfile
+from django.core.files import File
+from excel_files.models import ExcelFile
+from excel_files.services.sheet_cache import SheetCache
+
+logger = logging.getLogger(__name__)
+
+# Extensiones aceptadas en la carga masiva, sueltas o dentro de un zip
+EXCEL_EXTENSIONS = ('.xlsx', '.xlsm', '.xls')
+
+
+def parse_workbook(file_path, content_hash=None):
+    """
+    Etapas de lectura y parseo de un libro: calcula su hash y lo deja en la
+    caché de hojas. Se ejecuta en un proceso de trabajo: no usa la base de
+    datos, y los errores se devuelven para no detener el resto del lote.
+
+    Returns:
+        tuple: (hash del contenido, mensaje de error o None)
+    """
+    try:
+        content_hash = content_hash or SheetCache.compute_file_hash(file_path)
+        if not SheetCache.is_cached(content_hash):
+            SheetCache.populate_path(file_path, content_hash)
+        return content_hash, None
+    except Exception as e:
+        return None, str(e)
+
+
+class BulkIngestService:
+    """
+    Carga masiva de libros: registra muchos archivos de una vez y los ingiere
+    en cadena. Mientras el proceso principal registra hojas, detecta columnas
+    y carga las tablas de un libro, el pool de procesos ya está leyendo y
+    parseando los siguientes.
+    """
+
+    @staticmethod
+    def register_files(uploaded_files, description=None):
+        """
+        Guarda los archivos subidos como ExcelFile. Los zip se expanden y se
+        registra cada libro que contienen.
+
+        Args:
+            uploaded_files: Archivos subidos (UploadedFile)
+            description: Descripción común para todos los archivos
+
+        Returns:
+            tuple: (archivos registrados, nombres rechazados)
+        """
+        excel_files = []
+        rejected = []
+        for name, file_obj in BulkIngestService._iter_workbooks(uploaded_files, rejected):
+            # Al guardar se calcula el hash y los archivos idénticos comparten ruta
+            excel_file = ExcelFile(name=os.path.splitext(name)[0], description=description, file=file_obj)
+            excel_file.save()
+            excel_files.append(excel_file)
+
+        logger.info(f"Carga masiva: {len(excel_files)} archivos registrados, {len(rejected)} rechazados")
+        return excel_files, rejected
+
+    @staticmethod
+    def _iter_workbooks(uploaded_files, rejected):
+        for upload in uploaded_files:
+            name = os.path.basename(upload.name)
+            if name.lower().endswith('.zip'):
+                try:
+                    archive = zipfile.ZipFile(upload)
+                except zipfile.BadZipFile:
+                    rejected.append(name)
+                    continue
+
+                with archive:
+                    for member in archive.infolist():
+                        member_name = os.path.basename(member.filename)
+                        # Saltar directorios y metadatos de macOS
+                        if member.is_dir() or member.filename.startswith('__MACOSX/') or member_name.startswith('.'):
+                            continue
+                        if not member_name.lower().endswith(EXCEL_EXTENSIONS):
+                            rejected.append(f"{name}/{member.filename}")
+                            continue
+                        with archive.open(member) as member_file:
+                            yield member_name, File(member_file, name=member_name)
+            elif name.lower().endswith(EXCEL_EXTENSIONS):
+                yield name, upload
+            else:
+                rejected.append(name)
+
+    @staticmethod
+    def ingest_files(excel_file_ids, create_tables=False, storage_backend=None, workers=None,
+                     progress_callback=None):
+        """
+        Ingiere una lista de archivos en cadena. Cada archivo registra su
+        propio resultado (processed al crear sus tablas, o error); un fallo no
+        detiene a los demás.
+
+        Args:
+            excel_file_ids: IDs de los archivos a ingerir
+            create_tables: Crear también las tablas de datos de todas las hojas
+            storage_backend: Backend de almacenamiento de las tablas
+            workers: Procesos que parsean libros en paralelo
+            progress_callback: Función (etapa, archivos procesados, archivos totales)
+
+        Returns:
+            dict: Resumen con los totales y el rendimiento del lote
+        """
+        from data_models.services.ingest_pool import IngestPool
+        from data_models.services.model_factory import DataModelFactory
+        from excel_files.services.file_manager import ExcelFileManager
+        from excel_files.services.schema_detector import SchemaDetector
+
+        files = {f.id: f for f in ExcelFile.objects.filter(id__in=excel_file_ids)}
+        ordered = [files[file_id] for file_id in excel_file_ids if file_id in files]
+        tasks = ((excel_file.id, (excel_file.file.path, excel_file.content_hash)) for excel_file in ordered)
+
+        started = time.monotonic()
+        summary = {'files': len(ordered), 'succeeded': 0, 'failed': 0, 'sheets': 0, 'rows': 0, 'bytes': 0}
+        if progress_callback:
+            progress_callback('ingest', 0, len(ordered))
+
+        with IngestPool(workers) as pool:
+            for done, (file_id, (content_hash, parse_error)) in enumerate(pool.imap(parse_workbook, tasks), 1):
+                excel_file = files[file_id]
+                try:
+                    if parse_error:
+                        raise ValueError(parse_error)
+
+                    summary['bytes'] += excel_file.file.size
+                    excel_file.content_hash = content_hash
+                    excel_file.save(update_fields=['content_hash'])
+
+                    if ExcelFileManager.link_duplicate(excel_file):
+                        # Mismo contenido que un archivo anterior: hojas y tablas copiadas
+                        sheets = list(excel_file.sheets.all())
+                        pending_ids = [sheet.id for sheet in excel_file.sheets.filter(data_table__isnull=True)]
+                    else:
+                        sheets = ExcelFileManager.read_excel_sheets(excel_file.id)
+                        for sheet in sheets:
+                            SchemaDetector.detect_column_types(sheet.id)
+                        pending_ids = None
+
+                    if create_tables and pending_ids != []:
+                        # El pool ya está ocupado parseando los siguientes libros
+                        DataModelFactory.create_data_tables_from_file(
+                            excel_file.id, sheet_ids=pending_ids, workers=1, storage_backend=storage_backend
+                        )
+
+                    ExcelFile.objects.filter(id=excel_file.id).update(error=None)
+                    summary['succeeded'] += 1
+                    summary['sheets'] += len(sheets)
+                    summary['rows'] += sum(sheet.row_count for sheet in sheets)
+                except Exception as e:
+                    logger.error(f"Error al ingerir el archivo {excel_file.id}: {str(e)}")
+                    logger.error(traceback.format_exc())
+                    ExcelFile.objects.filter(id=excel_file.id).update(error=str(e))
+                    summary['failed'] += 1
+
+                if progress_callback:
+                    progress_callback('ingest', done, len(ordered))
+
+        seconds = time.monotonic() - started
+        summary['seconds'] = round(seconds, 3)
+        summary['files_per_second'] = round(summary['files'] / seconds, 2) if seconds else None
+        summary['rows_per_second'] = round(summary['rows'] / seconds) if seconds else None
+        summary['mb_per_second'] = round(summary['bytes'] / seconds / (1024 * 1024), 2) if seconds else None
+
+        logger.info(f"Carga masiva terminada: {summary['succeeded']}/{summary['files']} archivos, "
+                    f"{summary['rows']} filas en {summary['seconds']}s "
+                    f"({summary['rows_per_second']} filas/s, {summary['mb_per_second']} MB/s)")
+        return summary
@@ -1,6 +1,10 @@
 import pandas as pd
 import logging
-from excel_files.models import ExcelFile, ExcelSheet
+import zipfile
+from django.db import transaction
+from excel_files.models import ExcelFile, ExcelSheet, ColumnDefinition
+from excel_files.services.sheet_cache import SheetCache
+from excel_files.services.workbook_metadata import WorkbookMetadataReader
 import traceback
 
 logger = logging.getLogger(__name__)
@@ -29,22 +33,108 @@ class ExcelFileManager:
             raise
 
     @staticmethod
-    def read_excel_sheets(excel_file_id):
+    def replace_file(excel_file, file_obj):
+        """
+        Sustituye el contenido de un archivo por una nueva versión del mismo
+        libro. Las hojas y tablas se conservan para recargarlas después de
+        forma incremental (trabajo refresh_file).
+
+        La versión anterior solo se libera cuando la nueva está guardada y la
+        transacción confirmada, y nunca si otro registro (o la nueva versión,
+        con el mismo contenido) aún la usa.
+        """
+        previous_name = excel_file.file.name if excel_file.file else None
+        previous_hash = excel_file.content_hash
+
+        with transaction.atomic():
+            excel_file.file = file_obj
+            excel_file.processed = False
+            excel_file.error = None
+            excel_file.save()
+
+            stale_name = previous_name if previous_name != excel_file.file.name else None
+            stale_hash = previous_hash if previous_hash != excel_file.content_hash else None
+            transaction.on_commit(lambda: excel_file.release_version(stale_name, stale_hash))
+        logger.info(f"Archivo {excel_file.id} sustituido por una nueva versión ({excel_file.content_hash})")
+        return excel_file
+
+    @staticmethod
+    def find_duplicate(excel_file):
+        """Devuelve otro archivo ya registrado con el mismo contenido, o None"""
+        if not excel_file.content_hash:
+            return None
+        return ExcelFile.objects.filter(
+            content_hash=excel_file.content_hash, sheets__isnull=False, deleted=False
+        ).exclude(pk=excel_file.pk).distinct().order_by('-processed', 'id').first()
+
+    @staticmethod
+    @transaction.atomic
+    def link_duplicate(excel_file):
+        """
+        Si ya se subió un archivo con el mismo contenido, copia sus hojas,
+        definiciones de columnas y tablas de datos en lugar de volver a
+        parsear, detectar y cargar el libro
+
+        Returns:
+            ExcelFile: Archivo original del que se copió, o None si no hay
+        """
+        from data_models.models import DataTable
+        from data_models.services.model_factory import DataModelFactory
+
+        source = ExcelFileManager.find_duplicate(excel_file)
+        if source is None:
+            return None
+
+        for source_sheet in source.sheets.order_by('id'):
+            sheet, created = ExcelSheet.objects.update_or_create(
+                excel_file=excel_file,
+                name=source_sheet.name,
+                defaults={'row_count': source_sheet.row_count, 'processed': source_sheet.processed}
+            )
+            ColumnDefinition.objects.filter(sheet=sheet).delete()
+            ColumnDefinition.objects.bulk_create([
+                ColumnDefinition(
+                    sheet=sheet,
+                    name=col.name,
+                    original_name=col.original_name,
+                    column_index=col.column_index,
+                    data_type=col.data_type,
+                    nullable=col.nullable
+                )
+                for col in source_sheet.columns.order_by('column_index')
+            ])
+
+            source_table = DataTable.objects.filter(sheet=source_sheet, status='ready').first()
+            if source_table is not None:
+                DataModelFactory.clone_data_table(source_table, sheet)
+
+        excel_file.processed = source.processed
+        excel_file.error = None
+        excel_file.save(update_fields=['processed', 'error'])
+        logger.info(f"Archivo {excel_file.id} duplicado de {source.id}: hojas y tablas copiadas sin reprocesar")
+        return source
+
+    @staticmethod
+    def read_excel_sheets(excel_file_id, progress_callback=None):
         """
 
         """
         try:
             excel_file = ExcelFile.objects.get(id=excel_file_id)
 
-            # Usamos pandas para leer el Excel
-            xls = pd.ExcelFile(excel_file.file.path)
-            sheet_names = xls.sheet_names
+            # Solo metadatos: nombres y número de filas leídos del XML del libro
+            try:
+                sheet_infos = WorkbookMetadataReader.read(excel_file.file.path, progress_callback)
+            except zipfile.BadZipFile:
+                # Formatos no zip (.xls): se parsea una vez y queda en caché
+                if progress_callback and not SheetCache.is_cached(SheetCache.get_content_hash(excel_file)):
+                    SheetCache.populate(excel_file, progress_callback)
+                sheet_infos = SheetCache.get_manifest(excel_file)['sheets']
 
             sheets = []
-            for sheet_name in sheet_names:
-                # Contar filas para cada hoja
-                df = pd.read_excel(excel_file.file.path, sheet_name=sheet_name)
-                row_count = len(df)
+            for sheet_info in sheet_infos:
+                sheet_name = sheet_info['name']
+                row_count = sheet_info['row_count']
 
                 # Crear o actualizar el registro de la hoja
                 sheet, created = ExcelSheet.objects.update_or_create(
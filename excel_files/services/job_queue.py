@@ -0,0 +1,397 @@
+import logging
+import time
+import traceback
+from datetime import timedelta
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+from excel_files.models import ExcelSheet, ProcessingJob
+
+logger = logging.getLogger(__name__)
+
+
+class JobCancelled(Exception):
+    """Se lanza desde el callback de progreso cuando se solicitó cancelar el trabajo"""
+
+
+class JobQueue:
+    """
+    Cola de trabajos respaldada por la base de datos.
+
+    Las vistas solo encolan trabajos; el comando run_worker los reclama y los
+    ejecuta fuera de la petición HTTP, informando el progreso por etapas.
+    """
+
+    # Intervalo mínimo entre escrituras de progreso en la base de datos
+    PROGRESS_INTERVAL = 0.5
+
+    @staticmethod
+    def enqueue(job_type, excel_file, sheet=None, max_attempts=None, options=None):
+        """
+        Encola un trabajo. Si ya hay uno activo equivalente se devuelve ese.
+
+        Args:
+            job_type: Tipo de trabajo (ver ProcessingJob.JOB_TYPES)
+            excel_file: Archivo Excel sobre el que trabajar
+            sheet: Hoja concreta, para los trabajos por hoja
+            max_attempts: Número máximo de intentos
+            options: Parámetros adicionales del trabajo
+
+        Returns:
+            ProcessingJob: Trabajo encolado
+        """
+        existing = ProcessingJob.objects.filter(
+            job_type=job_type,
+            excel_file=excel_file,
+            sheet=sheet,
+            status__in=ProcessingJob.ACTIVE_STATUSES
+        ).first()
+        if existing:
+            return existing
+
+        job = ProcessingJob.objects.create(
+            job_type=job_type,
+            excel_file=excel_file,
+            sheet=sheet,
+            options=options or {},
+            max_attempts=max_attempts or getattr(settings, 'JOB_MAX_ATTEMPTS', 3),
+            run_after=timezone.now()
+        )
+        logger.info(f"Trabajo {job.id} encolado: {job_type} para archivo {excel_file.id}")
+        return job
+
+    @staticmethod
+    def cancel(job_id):
+        """
+        Cancela un trabajo. Los pendientes se cancelan de inmediato; los que
+        están en ejecución se detienen en el siguiente informe de progreso.
+        """
+        now = timezone.now()
+        if ProcessingJob.objects.filter(id=job_id, status='pending').update(status='cancelled', finished_at=now):
+            return True
+        return bool(ProcessingJob.objects.filter(id=job_id, status='running').update(cancel_requested=True))
+
+    @staticmethod
+    def claim_next(worker_name):
+        """
+        Reclama el siguiente trabajo pendiente. La actualización condicionada al
+        estado garantiza que dos workers no tomen el mismo trabajo.
+
+        Returns:
+            ProcessingJob o None si no hay trabajos listos
+        """
+        now = timezone.now()
+        candidates = ProcessingJob.objects.filter(
+            status='pending', run_after__lte=now
+        ).order_by('created_at').values_list('id', flat=True)[:10]
+
+        for job_id in candidates:
+            claimed = ProcessingJob.objects.filter(id=job_id, status='pending').update(
+                status='running',
+                worker=worker_name,
+                started_at=now,
+                heartbeat_at=now
+            )
+            if claimed:
+                job = ProcessingJob.objects.select_related('excel_file', 'sheet').get(id=job_id)
+                job.attempts += 1
+                job.save(update_fields=['attempts'])
+                return job
+        return None
+
+    @staticmethod
+    def requeue_stale(timeout=None):
+        """
+        Devuelve a la cola los trabajos en ejecución cuyo worker dejó de dar
+        señales de vida (por ejemplo, tras un reinicio).
+
+        Cada reclamación ya cuenta como intento, así que un trabajo que tumba a
+        su worker una y otra vez se marca como fallido al agotar max_attempts.
+        Los que tenían una cancelación pendiente pasan directamente a cancelados.
+        """
+        timeout = timeout or getattr(settings, 'JOB_STALE_TIMEOUT', 600)
+        now = timezone.now()
+        stale = ProcessingJob.objects.filter(status='running', heartbeat_at__lt=now - timedelta(seconds=timeout))
+
+        cancelled = stale.filter(cancel_requested=True).update(status='cancelled', finished_at=now)
+        if cancelled:
+            logger.warning(f"{cancelled} trabajos sin actividad cancelados")
+
+        error = f"El worker dejó de responder durante más de {timeout} segundos en todos los intentos"
+        exhausted = list(stale.filter(attempts__gte=F('max_attempts')).select_related('excel_file'))
+        for job in exhausted:
+            if ProcessingJob.objects.filter(id=job.id, status='running').update(
+                status='failed', error=error, finished_at=now
+            ):
+                logger.error(f"Trabajo {job.id} fallido: {error}")
+                if job.excel_file is not None:
+                    job.excel_file.error = error
+                    job.excel_file.save(update_fields=['error'])
+
+        count = stale.update(status='pending', run_after=now)
+        if count:
+            logger.warning(f"{count} trabajos sin actividad devueltos a la cola")
+        return count
+
+    @staticmethod
+    def make_progress_callback(job):
+        """
+        Crea el callback de progreso para un trabajo
+
+        El callback recibe (etapa, filas procesadas, filas totales), guarda el
+        avance como mucho cada PROGRESS_INTERVAL segundos y lanza JobCancelled
+        si se solicitó la cancelación.
+        """
+        state = {'last_write': 0.0, 'stage': None}
+
+        def callback(stage, rows_processed, rows_total):
+            now = time.monotonic()
+            if stage == state['stage'] and now - state['last_write'] < JobQueue.PROGRESS_INTERVAL:
+                return
+            state['last_write'] = now
+            state['stage'] = stage
+
+            ProcessingJob.objects.filter(id=job.id).update(
+                stage=stage,
+                rows_processed=rows_processed,
+                rows_total=rows_total,
+                heartbeat_at=timezone.now()
+            )
+            if ProcessingJob.objects.filter(id=job.id, cancel_requested=True).exists():
+                raise JobCancelled(f"Trabajo {job.id} cancelado")
+
+        return callback
+
+    @staticmethod
+    def _warm_cache(excel_file, progress):
+        """
+        Parsea el libro en la caché de hojas informando el progreso por bloque,
+        para que el latido del trabajo siga vivo durante el parseo inicial.
+        Corrige el row_count de las hojas con el de la caché, que es exacto:
+        el de los metadatos puede venir de una dimensión no comprobada.
+        """
+        from excel_files.services.sheet_cache import SheetCache
+
+        if not SheetCache.is_cached(SheetCache.get_content_hash(excel_file)):
+            SheetCache.populate(excel_file, progress_callback=lambda rows: progress('cache', rows, 0))
+
+        row_counts = {entry['name']: entry['row_count'] for entry in SheetCache.get_manifest(excel_file)['sheets']}
+        for sheet in ExcelSheet.objects.filter(excel_file=excel_file):
+            if sheet.name in row_counts and sheet.row_count != row_counts[sheet.name]:
+                sheet.row_count = row_counts[sheet.name]
+                sheet.save(update_fields=['row_count'])
+
+    @staticmethod
+    def _read_sheets(excel_file, progress):
+        """Registra las hojas del libro informando el progreso mientras se cuentan sus filas"""
+        from excel_files.services.file_manager import ExcelFileManager
+
+        return ExcelFileManager.read_excel_sheets(
+            excel_file.id, progress_callback=lambda rows: progress('sheets', rows, 0)
+        )
+
+    @staticmethod
+    def run(job):
+        """Ejecuta un trabajo reclamado y registra su resultado"""
+        handler = JobQueue.HANDLERS.get(job.job_type)
+        progress = JobQueue.make_progress_callback(job)
+
+        try:
+            if handler is None:
+                raise ValueError(f"Tipo de trabajo desconocido: {job.job_type}")
+
+            logger.info(f"Ejecutando trabajo {job.id} ({job.job_type}), intento {job.attempts}")
+            handler(job, progress)
+
+            ProcessingJob.objects.filter(id=job.id).update(
+                status='completed', error=None, rows_processed=F('rows_total'), finished_at=timezone.now()
+            )
+        except JobCancelled:
+            logger.info(f"Trabajo {job.id} cancelado")
+            ProcessingJob.objects.filter(id=job.id).update(status='cancelled', finished_at=timezone.now())
+        except Exception as e:
+            logger.error(f"Error en el trabajo {job.id}: {str(e)}")
+            logger.error(traceback.format_exc())
+
+            if ProcessingJob.objects.filter(id=job.id, cancel_requested=True).exists():
+                # No se reintenta un trabajo cuya cancelación ya se pidió
+                ProcessingJob.objects.filter(id=job.id).update(
+                    status='cancelled', error=str(e), finished_at=timezone.now()
+                )
+            elif job.attempts < job.max_attempts:
+                # Reintento con espera creciente
+                delay = getattr(settings, 'JOB_RETRY_DELAY', 30) * (2 ** (job.attempts - 1))
+                ProcessingJob.objects.filter(id=job.id).update(
+                    status='pending', error=str(e), run_after=timezone.now() + timedelta(seconds=delay)
+                )
+            else:
+                ProcessingJob.objects.filter(id=job.id).update(
+                    status='failed', error=str(e), finished_at=timezone.now()
+                )
+                if job.excel_file is not None:
+                    job.excel_file.error = str(e)
+                    job.excel_file.save(update_fields=['error'])
+
+    @staticmethod
+    def _run_process_file(job, progress):
+        """Registra las hojas de un archivo recién subido y detecta sus columnas"""
+        from excel_files.services.file_manager import ExcelFileManager
+
+        progress('sheets', 0, 0)
+        # Un archivo ya subido con el mismo contenido se copia sin reprocesarlo
+        if ExcelFileManager.link_duplicate(job.excel_file):
+            return
+
+        sheets = JobQueue._read_sheets(job.excel_file, progress)
+        JobQueue._warm_cache(job.excel_file, progress)
+        JobQueue._detect_sheets(sheets, progress, mark_processed=False)
+
+    @staticmethod
+    def _run_detect_sheets(job, progress):
+        """Detecta las columnas de las hojas aún no procesadas de un archivo"""
+        excel_file = job.excel_file
+        sheets = list(ExcelSheet.objects.filter(excel_file=excel_file, processed=False))
+        if sheets:
+            JobQueue._warm_cache(excel_file, progress)
+        JobQueue._detect_sheets(sheets, progress, mark_processed=True)
+
+        # Verificar si todas las hojas están procesadas
+        if not ExcelSheet.objects.filter(excel_file=excel_file, processed=False).exists():
+            excel_file.processed = True
+            excel_file.save()
+
+    @staticmethod
+    def _detect_sheets(sheets, progress, mark_processed):
+        from excel_files.services.schema_detector import SchemaDetector
+
+        rows_total = sum(sheet.row_count for sheet in sheets)
+        rows_done = 0
+        for sheet in sheets:
+            def sheet_progress(stage, processed, total, offset=rows_done):
+                progress(stage, offset + processed, rows_total)
+
+            SchemaDetector.detect_column_types(sheet.id, progress_callback=sheet_progress)
+            if mark_processed:
+                sheet.processed = True
+                sheet.save()
+            rows_done += sheet.row_count
+        progress('detect', rows_done, rows_total)
+
+    @staticmethod
+    def _run_create_table(job, progress):
+        """Crea la tabla de datos de una hoja"""
+        from data_models.services.model_factory import DataModelFactory
+
+        if job.sheet is None:
+            raise ValueError("El trabajo no tiene una hoja asociada")
+        JobQueue._warm_cache(job.sheet.excel_file, progress)
+        # Si la tabla ya existe solo se escriben las filas que cambiaron
+        DataModelFactory.refresh_data_table(
+            job.sheet.id,
+            progress_callback=progress,
+            storage_backend=job.options.get('storage_backend')
+        )
+
+    @staticmethod
+    def _run_create_tables(job, progress):
+        """Detecta las hojas pendientes y crea las tablas de todo el libro en paralelo"""
+        from data_models.services.model_factory import DataModelFactory
+        from excel_files.services.file_manager import ExcelFileManager
+
+        excel_file = job.excel_file
+        if not excel_file.sheets.exists():
+            progress('sheets', 0, 0)
+            if ExcelFileManager.link_duplicate(excel_file):
+                # Las tablas del archivo original ya se copiaron; solo faltan las que no tenía
+                sheet_ids = list(excel_file.sheets.filter(data_table__isnull=True).values_list('id', flat=True))
+                if sheet_ids:
+                    DataModelFactory.create_data_tables_from_file(
+                        excel_file.id,
+                        sheet_ids=sheet_ids,
+                        progress_callback=progress,
+                        storage_backend=job.options.get('storage_backend')
+                    )
+                return
+            JobQueue._read_sheets(excel_file, progress)
+
+        JobQueue._warm_cache(excel_file, progress)
+        pending = list(ExcelSheet.objects.filter(excel_file=excel_file, columns__isnull=True))
+        if pending:
+            JobQueue._detect_sheets(pending, progress, mark_processed=False)
+
+        DataModelFactory.create_data_tables_from_file(
+            excel_file.id,
+            progress_callback=progress,
+            storage_backend=job.options.get('storage_backend')
+        )
+
+    @staticmethod
+    def _run_ingest_files(job, progress):
+        """Ingiere en cadena los archivos de una carga masiva y guarda el resumen del lote"""
+        from excel_files.services.bulk_ingest import BulkIngestService
+
+        summary = BulkIngestService.ingest_files(
+            job.options.get('file_ids', []),
+            create_tables=job.options.get('create_tables', False),
+            storage_backend=job.options.get('storage_backend'),
+            progress_callback=progress
+        )
+        job.options['summary'] = summary
+        ProcessingJob.objects.filter(id=job.id).update(options=job.options)
+
+    @staticmethod
+    def _run_refresh_file(job, progress):
+        """Vuelve a leer una nueva versión del archivo y recarga sus tablas escribiendo solo los cambios"""
+        from data_models.services.model_factory import DataModelFactory
+        from data_models.services.purge_service import PurgeService
+
+        progress('sheets', 0, 0)
+        sheets = JobQueue._read_sheets(job.excel_file, progress)
+
+        # Las hojas que desaparecieron en la nueva versión se eliminan junto con sus tablas
+        removed = ExcelSheet.objects.filter(excel_file=job.excel_file).exclude(id__in=[sheet.id for sheet in sheets])
+        for sheet in removed.select_related('data_table'):
+            logger.warning(f"La hoja {sheet.name} ya no existe en el archivo {job.excel_file.id}; se elimina con su tabla")
+            if hasattr(sheet, 'data_table'):
+                PurgeService.purge_table(sheet.data_table)
+            sheet.delete()
+
+        JobQueue._warm_cache(job.excel_file, progress)
+        JobQueue._detect_sheets(sheets, progress, mark_processed=False)
+
+        for sheet in ExcelSheet.objects.filter(excel_file=job.excel_file, data_table__isnull=False):
+            DataModelFactory.refresh_data_table(sheet.id, progress_callback=progress)
+
+    @staticmethod
+    def _run_index_table(job, progress):
+        """Crea los índices de valores que pidió la API de consulta para la tabla de una hoja"""
+        from data_models.services.model_factory import DataModelFactory
+
+        if job.sheet is None:
+            raise ValueError("El trabajo no tiene una hoja asociada")
+        progress('index', 0, 0)
+        DataModelFactory.create_value_indexes(job.sheet.id, job.options.get('columns', []))
+
+    @staticmethod
+    def _run_purge_file(job, progress):
+        """Elimina un archivo marcado como borrado con sus hojas, tablas y exportaciones"""
+        from data_models.services.purge_service import PurgeService
+
+        progress('purge', 0, 0)
+        if job.excel_file is None:
+            # Un intento anterior ya eliminó el archivo (excel_file es SET_NULL)
+            logger.info(f"El archivo {job.options.get('file_id')} del trabajo {job.id} ya estaba eliminado")
+            return
+        PurgeService.purge_file(job.excel_file)
+
+
+JobQueue.HANDLERS = {
+    'process_file': JobQueue._run_process_file,
+    'detect_sheets': JobQueue._run_detect_sheets,
+    'create_table': JobQueue._run_create_table,
+    'create_tables': JobQueue._run_create_tables,
+    'ingest_files': JobQueue._run_ingest_files,
+    'refresh_file': JobQueue._run_refresh_file,
+    'purge_file': JobQueue._run_purge_file,
+    'index_table': JobQueue._run_index_table,
+}
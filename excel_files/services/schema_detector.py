@@ -1,33 +1,89 @@
+import datetime
+import numbers
+import random
+import numpy as np
 import pandas as pd
+from django.conf import settings
 from django.utils.text import slugify
 from excel_files.models import ExcelSheet, ColumnDefinition
+from excel_files.services.sheet_cache import SheetCache
 import re
 
+# Orden de promoción de tipos: una columna toma el mayor tipo de sus valores
+TYPE_LATTICE = ('boolean', 'integer', 'float', 'date', 'datetime', 'string')
+
+BOOLEAN_BITS = {'0', '1'}
+BOOLEAN_WORDS = {'true', 'false', 'yes', 'no', 'si', 'sí', 'verdadero', 'falso'}
+INTEGER_PATTERN = r'[+-]?\d+'
+
+# 2023-04-25, 04/25/2023, 25-Apr-2023, etc.
+DATE_PATTERN = r'\d{1,4}[-/]\d{1,2}[-/]\d{1,4}|\d{1,2}[-/]\s*[a-zA-Z]{3,9}[-/]\s*\d{2,4}'
+
 
 class SchemaDetector:
     """
     
     """
 
+    # Tamaño de la muestra: primeras y últimas filas y bloques aleatorios intermedios
+    HEAD_ROWS = 1000
+    TAIL_ROWS = 1000
+    RANDOM_BLOCKS = 8
+    BLOCK_ROWS = 250
+
     @staticmethod
-    def detect_column_types(sheet_id):
+    def detect_column_types(sheet_id, progress_callback=None, full_scan=None):
         """
+        Detecta el tipo de cada columna de una hoja y guarda sus definiciones
 
+        El tipo se decide sobre una muestra acotada de la hoja, de modo que el
+        tiempo no crece con el número de filas. Con full_scan se recorre además
+        el resto de la hoja para confirmar los tipos de la muestra.
+
+        Args:
+            sheet_id: ID de la hoja de Excel
+            progress_callback: Función opcional (etapa, filas procesadas, filas totales)
+            full_scan: Verificar los tipos con todas las filas. Por defecto
+                SCHEMA_DETECTION_FULL_SCAN
+
+        Returns:
+            list: Definiciones de columnas creadas o actualizadas
         """
+        if full_scan is None:
+            full_scan = getattr(settings, 'SCHEMA_DETECTION_FULL_SCAN', False)
+
+        sheet = ExcelSheet.objects.select_related('excel_file').get(id=sheet_id)
+        excel_file = sheet.excel_file
+        row_count = SheetCache.get_sheet_entry(excel_file, sheet.name)['row_count']
 
-        sheet = ExcelSheet.objects.get(id=sheet_id)
-        df = pd.read_excel(sheet.excel_file.file.path, sheet_name=sheet.name)
+        column_names = None
+        kinds = {}
+        if full_scan:
+            blocks = SheetCache.iter_sheet_chunks(excel_file, sheet.name)
+        else:
+            blocks = SchemaDetector._iter_sample(excel_file, sheet.name, row_count, seed=sheet.id)
+
+        rows_done = 0
+        for block in blocks:
+            if column_names is None:
+                column_names = list(block.columns)
+                kinds = {col_name: set() for col_name in column_names}
+
+            for col_name in column_names:
+                kinds[col_name] |= SchemaDetector._value_kinds(block[col_name])
+
+            rows_done += len(block)
+            if progress_callback:
+                progress_callback('detect', rows_done, row_count)
+
+        # Los nulos se cuentan con las estadísticas de la caché, sin leer los datos
+        null_counts = SheetCache.get_null_counts(excel_file, sheet.name)
 
         columns = []
-        for i, col_name in enumerate(df.columns):
+        for i, col_name in enumerate(column_names or []):
             # Normalizar nombre de columna
             normalized_name = SchemaDetector._normalize_column_name(col_name)
-
-            # Detectar tipo de datos
-            data_type = SchemaDetector._detect_data_type(df[col_name])
-
-            # Verificar si hay valores nulos
-            nullable = df[col_name].isnull().any()
+            null_count = null_counts.get(str(col_name))
 
             # Crear o actualizar definición de columna
             col_def, created = ColumnDefinition.objects.update_or_create(
@@ -36,14 +92,63 @@ class SchemaDetector:
                 defaults={
                     'name': normalized_name,
                     'original_name': str(col_name),
-                    'data_type': data_type,
-                    'nullable': nullable
+                    'data_type': SchemaDetector._resolve_data_type(kinds[col_name]) or 'string',
+                    'nullable': null_count is None or null_count > 0
                 }
             )
             columns.append(col_def)
 
+        # Las columnas que ya no están en la hoja (nueva versión del archivo) se eliminan
+        ColumnDefinition.objects.filter(sheet=sheet, column_index__gte=len(columns)).delete()
+
         return columns
 
+    @staticmethod
+    def _iter_sample(excel_file, sheet_name, row_count, seed=None):
+        """
+        Recorre una muestra estratificada de la hoja: las primeras filas, las
+        últimas y bloques contiguos elegidos al azar entre ambas
+        """
+        head = SchemaDetector.HEAD_ROWS
+        tail = SchemaDetector.TAIL_ROWS
+        block_rows = SchemaDetector.BLOCK_ROWS
+        sample_rows = head + tail + SchemaDetector.RANDOM_BLOCKS * block_rows
+
+        if row_count <= sample_rows:
+            yield from SheetCache.iter_sheet_chunks(excel_file, sheet_name)
+            return
+
+        windows = [(0, head)]
+        middle_blocks = (row_count - head - tail) // block_rows
+        rng = random.Random(seed)
+        for block in sorted(rng.sample(range(middle_blocks), min(SchemaDetector.RANDOM_BLOCKS, middle_blocks))):
+            windows.append((head + block * block_rows, block_rows))
+        windows.append((row_count - tail, tail))
+
+        for offset, limit in windows:
+            yield from SheetCache.read_sheet_rows(excel_file, sheet_name, offset, limit)
+
+    @staticmethod
+    def _resolve_data_type(kinds):
+        """
+        Tipo de una columna a partir de las clases de valores observadas. Se toma
+        el mayor según TYPE_LATTICE; mezclar números con fechas, o palabras
+        booleanas con números, da texto.
+        """
+        if not kinds:
+            return None
+
+        kinds = set(kinds)
+        if 'boolean_text' in kinds:
+            kinds.discard('boolean_text')
+            if kinds & {'integer', 'float'}:
+                return 'string'
+            kinds.add('boolean')
+
+        if kinds & {'boolean', 'integer', 'float'} and kinds & {'date', 'datetime'}:
+            return 'string'
+        return max(kinds, key=TYPE_LATTICE.index)
+
     @staticmethod
     def _normalize_column_name(col_name):
         """
@@ -71,66 +176,107 @@ class SchemaDetector:
     @staticmethod
     def _detect_data_type(series):
         """Detecta el tipo de datos de una serie de pandas."""
+        return SchemaDetector._resolve_data_type(SchemaDetector._value_kinds(series)) or 'string'
+
+    @staticmethod
+    def _value_kinds(series):
+        """
+        Clasifica de forma vectorizada los valores no nulos de una serie
+
+        Returns:
+            set: Clases presentes: los tipos de TYPE_LATTICE y 'boolean_text'
+            para palabras como "sí" o "false", que no admiten un tipo numérico
+        """
         # Eliminar valores nulos para la detección
         series = series.dropna()
-
-        # Si no hay datos, devolver string como predeterminado
         if len(series) == 0:
-            return 'string'
+            return set()
 
-        # Primero verificar si son enteros o flotantes
+        if pd.api.types.is_bool_dtype(series):
+            return {'boolean'}
         if pd.api.types.is_integer_dtype(series):
-            return 'integer'
-
+            return {'integer'}
         if pd.api.types.is_float_dtype(series):
-            return 'float'
-
-        # Verificar booleanos
-        if set(series.unique()) <= {True, False, 1, 0, '1', '0', 'yes', 'no', 'true', 'false', 'si', 'no'}:
-            return 'boolean'
-
-        # Intentar convertir a enteros si no es ya un tipo numérico
-        try:
-            # Si todos los valores pueden convertirse a enteros sin pérdida
-            integers = series.astype(int)
-            if (integers == series).all():
-                return 'integer'
-        except:
-            pass
-
-        # Intentar convertir a flotantes
-        try:
-            series.astype(float)
-            return 'float'
-        except:
-            pass
-
-        # Verificar si tienen formato de fecha
-        # Primero, comprobar si los valores tienen patrones típicos de fechas
-        date_patterns = [
-            r'\d{1,4}[-/]\d{1,2}[-/]\d{1,4}',  # 2023-04-25, 04/25/2023, etc.
-            r'\d{1,2}[-/]\s*[a-zA-Z]{3,9}[-/]\s*\d{2,4}',  # 25-Apr-2023, etc.
-        ]
-
-        sample_size = min(20, len(series))
-        sample = series.sample(sample_size) if len(series) > sample_size else series
-
-        # Verificar si al menos el 80% de la muestra tiene formato de fecha
-        date_like_count = sum(1 for val in sample if any(re.search(pattern, str(val)) for pattern in date_patterns))
-        if date_like_count >= sample_size * 0.8:
-            try:
-                # Ahora intentar convertir a datetime
-                pd.to_datetime(series, errors='raise')
+            return {SchemaDetector._number_kind(series)}
+        if pd.api.types.is_datetime64_any_dtype(series):
+            return {SchemaDetector._temporal_kind(series)}
+
+        kinds = set()
+        value_types = series.map(type)
+
+        is_bool = value_types.isin([bool, np.bool_])
+        if is_bool.any():
+            kinds.add('boolean')
+
+        is_number = value_types.map(lambda t: issubclass(t, numbers.Number)) & ~is_bool
+        if is_number.any():
+            kinds.add(SchemaDetector._number_kind(series[is_number].astype(float)))
+
+        is_temporal = value_types.map(lambda t: issubclass(t, (datetime.date, np.datetime64)))
+        if is_temporal.any():
+            kinds.add(SchemaDetector._temporal_kind(pd.to_datetime(series[is_temporal], errors='coerce', utc=True)))
+
+        is_text = value_types.eq(str)
+        if is_text.any():
+            kinds |= SchemaDetector._text_kinds(series[is_text])
+
+        if not (is_bool | is_number | is_temporal | is_text).all():
+            # Horas sueltas u otros objetos
+            kinds.add('string')
+        return kinds
+
+    @staticmethod
+    def _number_kind(numbers):
+        """Enteros si todos los valores son enteros representables; si no, flotantes"""
+        numbers = numbers.astype(float)
+        integral = np.isfinite(numbers) & (numbers == np.floor(numbers)) & (numbers.abs() < 2 ** 53)
+        return 'integer' if integral.all() else 'float'
+
+    @staticmethod
+    def _temporal_kind(timestamps):
+        """Fechas si ningún valor tiene hora; si no, fecha y hora"""
+        timestamps = timestamps.dropna()
+        if len(timestamps) and (timestamps == timestamps.dt.normalize()).all():
+            return 'date'
+        return 'datetime'
+
+    @staticmethod
+    def _text_kinds(text):
+        """Clasifica valores de texto: booleanos, números, fechas o texto libre"""
+        kinds = set()
+        text = text.str.strip()
+        lower = text.str.lower()
+
+        remaining = pd.Series(True, index=text.index)
+
+        # "0" y "1" son booleanos que también admiten un tipo numérico
+        is_bit = lower.isin(BOOLEAN_BITS)
+        is_word = lower.isin(BOOLEAN_WORDS)
+        if is_bit.any():
+            kinds.add('boolean')
+        if is_word.any():
+            kinds.add('boolean_text')
+        remaining &= ~(is_bit | is_word)
+
+        is_integer = remaining & text.str.fullmatch(INTEGER_PATTERN)
+        if is_integer.any():
+            kinds.add('integer')
+        remaining &= ~is_integer
+
+        if remaining.any():
+            is_float = remaining & pd.to_numeric(text.where(remaining), errors='coerce').notna()
+            if is_float.any():
+                kinds.add('float')
+            remaining &= ~is_float
+
+        if remaining.any():
+            candidates = text[remaining]
+            is_date_like = candidates.str.contains(DATE_PATTERN)
+            parsed = pd.to_datetime(candidates[is_date_like], errors='coerce', format='mixed')
+            if is_date_like.all() and parsed.notna().all():
                 # Si algunas tienen hora, es datetime, sino es date
-                if any(str(val).find(':') > 0 for val in series if not pd.isna(val)):
-                    return 'datetime'
-                return 'date'
-            except:
-                pass
-
-        # Si es un tipo datetime conocido
-        if pd.api.types.is_datetime64_dtype(series):
-            return 'datetime'
-
-        # Por defecto, tratar como texto
-        return 'string'
+                kinds.add('datetime' if candidates.str.contains(':', regex=False).any() else 'date')
+            else:
+                kinds.add('string')
+
+        return kinds
@@ -0,0 +1,350 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from django.conf import settings
+from excel_files.services.sheet_reader import SheetReader
+
+logger = logging.getLogger(__name__)
+
+
+class SheetCache:
+    """
+    Caché en disco de las hojas ya parseadas de un archivo Excel.
+
+    Cada libro se parsea una sola vez en streaming; sus hojas se guardan como
+    partes Parquet bajo MEDIA_ROOT, en un directorio identificado por el hash
+    del contenido del archivo. Las etapas posteriores (detección de esquema,
+    creación de tablas, actualización de hojas) leen las columnas ya tipadas
+    desde aquí.
+    """
+
+    MANIFEST_NAME = 'manifest.json'
+
+    @staticmethod
+    def get_cache_dir():
+        """Directorio raíz de la caché"""
+        return getattr(settings, 'SHEET_CACHE_DIR', os.path.join(settings.MEDIA_ROOT, 'cache', 'sheets'))
+
+    @staticmethod
+    def compute_file_hash(file_path, chunk_size=1024 * 1024):
+        """Calcula el SHA-256 del contenido de un archivo leyéndolo por bloques"""
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(chunk_size), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    @staticmethod
+    def get_content_hash(excel_file):
+        """
+        Devuelve el hash del contenido del archivo, calculándolo y guardándolo
+        en el modelo la primera vez.
+        """
+        if not excel_file.content_hash:
+            excel_file.content_hash = SheetCache.compute_file_hash(excel_file.file.path)
+            excel_file.save(update_fields=['content_hash'])
+        return excel_file.content_hash
+
+    @staticmethod
+    def _workbook_dir(content_hash):
+        return os.path.join(SheetCache.get_cache_dir(), content_hash)
+
+    @staticmethod
+    def _sheet_dir_name(sheet_name):
+        # Los nombres de hoja pueden contener caracteres no válidos en rutas
+        return hashlib.sha1(sheet_name.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def get_manifest(excel_file):
+        """
+        Devuelve el manifiesto del libro en caché: nombres de hoja en orden, sus
+        columnas, número de filas y partes Parquet. Parsea el libro si aún no
+        está en caché.
+
+        Returns:
+            dict: {'sheets': [{'name', 'columns', 'row_count', 'dir', 'parts'}, ...]}
+        """
+        workbook_dir = SheetCache._workbook_dir(SheetCache.get_content_hash(excel_file))
+        manifest_path = os.path.join(workbook_dir, SheetCache.MANIFEST_NAME)
+
+        if not os.path.isfile(manifest_path):
+            SheetCache.populate(excel_file)
+
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+
+        # Marcar el acceso para la política LRU
+        os.utime(manifest_path)
+        return manifest
+
+    @staticmethod
+    def get_sheet_entry(excel_file, sheet_name):
+        """Devuelve la entrada del manifiesto para una hoja"""
+        manifest = SheetCache.get_manifest(excel_file)
+        entry = next((s for s in manifest['sheets'] if s['name'] == sheet_name), None)
+        if entry is None:
+            raise ValueError(f"La hoja {sheet_name} no existe en el archivo {excel_file.name}")
+        return entry
+
+    @staticmethod
+    def iter_sheet_chunks(excel_file, sheet_name, chunk_size=None):
+        """
+        Recorre una hoja desde la caché en bloques de filas tipadas
+
+        Args:
+            excel_file: Instancia de ExcelFile
+            sheet_name: Nombre de la hoja
+            chunk_size: Número máximo de filas por bloque
+
+        Yields:
+            DataFrame: Bloque de filas. Una hoja sin datos produce un bloque vacío.
+        """
+        chunk_size = SheetReader.get_chunk_size(chunk_size)
+        for parquet_file in SheetCache._open_parts(excel_file, sheet_name):
+            if parquet_file.metadata.num_rows == 0:
+                yield parquet_file.schema_arrow.empty_table().to_pandas()
+                continue
+            for batch in parquet_file.iter_batches(batch_size=chunk_size):
+                yield batch.to_pandas()
+
+    @staticmethod
+    def read_sheet_rows(excel_file, sheet_name, offset, limit):
+        """
+        Lee una ventana de filas de una hoja abriendo solo las partes que la cubren
+
+        Returns:
+            list: Bloques (DataFrame) con las filas [offset, offset + limit). Cada
+            parte se devuelve por separado porque sus tipos pueden diferir.
+        """
+        blocks = []
+        position = 0
+        end = offset + limit
+        for parquet_file in SheetCache._open_parts(excel_file, sheet_name):
+            part_start, part_end = position, position + parquet_file.metadata.num_rows
+            position = part_end
+            if part_end <= offset:
+                continue
+            if part_start >= end:
+                break
+
+            table = parquet_file.read()
+            table = table.slice(max(offset - part_start, 0), end - max(offset, part_start))
+            blocks.append(table.to_pandas())
+        return blocks
+
+    @staticmethod
+    def get_null_counts(excel_file, sheet_name):
+        """
+        Cuenta los nulos de cada columna a partir de las estadísticas de los
+        grupos de filas, sin leer los datos
+
+        Returns:
+            dict: {nombre de columna: nulos}, o None para las columnas sin estadísticas
+        """
+        counts = {}
+        for parquet_file in SheetCache._open_parts(excel_file, sheet_name):
+            metadata = parquet_file.metadata
+            for group in range(metadata.num_row_groups):
+                row_group = metadata.row_group(group)
+                for i in range(row_group.num_columns):
+                    column = row_group.column(i)
+                    name = column.path_in_schema
+                    if column.statistics is None or not column.statistics.has_null_count:
+                        counts[name] = None
+                    elif counts.get(name, 0) is not None:
+                        counts[name] = counts.get(name, 0) + column.statistics.null_count
+        return counts
+
+    @staticmethod
+    def get_sheet_parts(excel_file, sheet_name):
+        """
+        Rutas de las partes Parquet de una hoja en orden, volviendo a parsear el
+        libro si faltan. Cada parte es un bloque de filas independiente.
+        """
+        entry = SheetCache.get_sheet_entry(excel_file, sheet_name)
+        sheet_dir = os.path.join(SheetCache._workbook_dir(excel_file.content_hash), entry['dir'])
+        paths = [os.path.join(sheet_dir, part) for part in entry['parts']]
+
+        if not all(os.path.isfile(path) for path in paths):
+            # La entrada fue desalojada a medias; volver a parsear el libro
+            SheetCache.populate(excel_file)
+        return paths
+
+    @staticmethod
+    def _open_parts(excel_file, sheet_name):
+        return [pq.ParquetFile(path) for path in SheetCache.get_sheet_parts(excel_file, sheet_name)]
+
+    @staticmethod
+    def populate(excel_file, progress_callback=None):
+        """
+        Recorre el libro una sola vez en streaming y guarda todas sus hojas en
+        caché, una parte Parquet por bloque leído.
+
+        Args:
+            progress_callback: Función opcional que recibe las filas leídas tras cada bloque
+        """
+        return SheetCache.populate_path(excel_file.file.path, SheetCache.get_content_hash(excel_file),
+                                        progress_callback)
+
+    @staticmethod
+    def is_cached(content_hash):
+        """Indica si el libro con este hash tiene una entrada completa en la caché"""
+        return os.path.isfile(os.path.join(SheetCache._workbook_dir(content_hash), SheetCache.MANIFEST_NAME))
+
+    @staticmethod
+    def populate_path(file_path, content_hash=None, progress_callback=None):
+        """
+        Igual que populate pero a partir de la ruta del archivo, sin usar la base
+        de datos, para poder parsear libros en otros procesos
+
+        Returns:
+            dict: Manifiesto del libro
+        """
+        content_hash = content_hash or SheetCache.compute_file_hash(file_path)
+        workbook_dir = SheetCache._workbook_dir(content_hash)
+
+        logger.info(f"Parseando libro {file_path} para la caché de hojas ({content_hash})")
+
+        manifest = {'sheets': []}
+        rows_read = 0
+        with SheetReader.open_workbook(file_path) as workbook:
+            sheet_names = workbook.sheetnames if workbook is not None else SheetReader.get_sheet_names(file_path)
+
+            for sheet_name in sheet_names:
+                sheet_dir_name = SheetCache._sheet_dir_name(sheet_name)
+                sheet_dir = os.path.join(workbook_dir, sheet_dir_name)
+                os.makedirs(sheet_dir, exist_ok=True)
+
+                entry = {'name': sheet_name, 'columns': [], 'row_count': 0, 'dir': sheet_dir_name, 'parts': []}
+                chunks = SheetReader.iter_chunks(file_path, sheet_name, workbook=workbook)
+                for part_idx, chunk in enumerate(chunks):
+                    part = f"part-{part_idx:05d}.parquet"
+                    SheetCache._write_atomic(
+                        os.path.join(sheet_dir, part),
+                        lambda path, chunk=chunk: pq.write_table(SheetCache._to_arrow(chunk), path)
+                    )
+                    entry['columns'] = [str(col) for col in chunk.columns]
+                    entry['row_count'] += len(chunk)
+                    entry['parts'].append(part)
+                    rows_read += len(chunk)
+                    if progress_callback:
+                        progress_callback(rows_read)
+                manifest['sheets'].append(entry)
+
+        # El manifiesto se escribe al final: su presencia indica una entrada completa
+        SheetCache._write_atomic(
+            os.path.join(workbook_dir, SheetCache.MANIFEST_NAME),
+            lambda path: SheetCache._write_json(path, manifest)
+        )
+
+        SheetCache.evict(keep=content_hash)
+        return manifest
+
+    @staticmethod
+    def _write_json(path, data):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+
+    @staticmethod
+    def _write_atomic(path, writer):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        writer(tmp_path)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _to_arrow(df):
+        """
+        Convierte un DataFrame a una tabla Arrow. Las columnas con tipos mezclados
+        que Arrow no puede representar se guardan como texto.
+        """
+        arrays = []
+        names = []
+        for col_name in df.columns:
+            series = df[col_name]
+            try:
+                array = pa.array(series, from_pandas=True)
+            except (pa.ArrowInvalid, pa.ArrowTypeError, TypeError):
+                array = pa.array(series.map(lambda v: None if pd.isna(v) else str(v)), type=pa.string())
+            arrays.append(array)
+            names.append(str(col_name))
+        return pa.Table.from_arrays(arrays, names=names)
+
+    @staticmethod
+    def _dir_stats(path):
+        """Tamaño total de los archivos de un directorio y fecha de la última escritura"""
+        total = 0
+        last_write = os.path.getmtime(path)
+        for root, _, files in os.walk(path):
+            for file_name in files:
+                try:
+                    stat = os.stat(os.path.join(root, file_name))
+                except OSError:
+                    continue
+                total += stat.st_size
+                last_write = max(last_write, stat.st_mtime)
+        return total, last_write
+
+    @staticmethod
+    def evict(max_bytes=None, keep=None):
+        """
+        Elimina los libros menos usados recientemente hasta que la caché
+        quede por debajo del tamaño máximo configurado.
+
+        Los libros sin manifiesto se están parseando (quizá en otro proceso) y
+        no se tocan ni cuentan para el tamaño; solo si llevan más de
+        SHEET_CACHE_PARTIAL_GRACE segundos sin escrituras se consideran
+        abandonados y son los primeros en desalojarse.
+
+        Args:
+            max_bytes: Tamaño máximo; por defecto settings.SHEET_CACHE_MAX_BYTES
+            keep: Hash de un libro que no debe desalojarse (el recién escrito)
+        """
+        if max_bytes is None:
+            max_bytes = getattr(settings, 'SHEET_CACHE_MAX_BYTES', 2 * 1024 ** 3)
+
+        cache_dir = SheetCache.get_cache_dir()
+        if not os.path.isdir(cache_dir):
+            return
+
+        grace = getattr(settings, 'SHEET_CACHE_PARTIAL_GRACE', 3600)
+        now = time.time()
+        entries = []
+        for content_hash in os.listdir(cache_dir):
+            workbook_dir = os.path.join(cache_dir, content_hash)
+            if not os.path.isdir(workbook_dir):
+                continue
+            manifest_path = os.path.join(workbook_dir, SheetCache.MANIFEST_NAME)
+            try:
+                size, last_write = SheetCache._dir_stats(workbook_dir)
+                if os.path.isfile(manifest_path):
+                    last_access = os.path.getmtime(manifest_path)
+                elif now - last_write > grace:
+                    last_access = 0
+                else:
+                    continue
+            except OSError:
+                # Desalojado o reescrito por otro proceso mientras se recorría
+                continue
+            entries.append((last_access, content_hash, size))
+
+        total = sum(size for _, _, size in entries)
+        for _, content_hash, size in sorted(entries):
+            if total <= max_bytes:
+                break
+            if content_hash == keep:
+                continue
+            shutil.rmtree(os.path.join(cache_dir, content_hash), ignore_errors=True)
+            total -= size
+            logger.info(f"Libro {content_hash} desalojado de la caché de hojas ({size} bytes)")
+
+    @staticmethod
+    def invalidate(content_hash):
+        """Elimina de la caché todas las hojas de un libro"""
+        if content_hash:
+            shutil.rmtree(SheetCache._workbook_dir(content_hash), ignore_errors=True)
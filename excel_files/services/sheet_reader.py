@@ -0,0 +1,163 @@
+import logging
+from collections import defaultdict
+from contextlib import contextmanager
+import openpyxl
+import pandas as pd
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class SheetReader:
+    """
+    Lector de hojas de Excel en streaming.
+
+    Usa openpyxl en modo read_only para recorrer las filas sin cargar la hoja
+    completa, y entrega bloques (DataFrames) de tamaño configurable. La memoria
+    usada depende del tamaño del bloque, no del tamaño de la hoja.
+    """
+
+    STREAMING_EXTENSIONS = ('.xlsx', '.xlsm')
+
+    @staticmethod
+    def get_chunk_size(chunk_size=None):
+        """Tamaño de bloque a usar; por defecto settings.SHEET_READER_CHUNK_SIZE"""
+        return chunk_size or getattr(settings, 'SHEET_READER_CHUNK_SIZE', 10000)
+
+    @staticmethod
+    @contextmanager
+    def open_workbook(file_path):
+        """
+        Abre un libro en modo solo lectura y lo cierra al terminar. Los archivos
+        que openpyxl no soporta (.xls) se devuelven como None y se leen con pandas.
+        """
+        if not str(file_path).lower().endswith(SheetReader.STREAMING_EXTENSIONS):
+            yield None
+            return
+
+        workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+        try:
+            yield workbook
+        finally:
+            workbook.close()
+
+    @staticmethod
+    def get_sheet_names(file_path):
+        """Devuelve los nombres de las hojas del libro"""
+        with SheetReader.open_workbook(file_path) as workbook:
+            if workbook is None:
+                return pd.ExcelFile(file_path).sheet_names
+            return list(workbook.sheetnames)
+
+    @staticmethod
+    def iter_chunks(file_path, sheet_name, chunk_size=None, workbook=None):
+        """
+        Recorre una hoja en bloques de filas tipadas
+
+        Args:
+            file_path: Ruta del archivo Excel
+            sheet_name: Nombre de la hoja
+            chunk_size: Número de filas por bloque
+            workbook: Libro ya abierto con open_workbook, para no reabrirlo por hoja
+
+        Yields:
+            DataFrame: Bloque de filas con las columnas de la cabecera. Una hoja sin
+            filas de datos produce un único bloque vacío con sus columnas.
+        """
+        chunk_size = SheetReader.get_chunk_size(chunk_size)
+
+        if workbook is None:
+            with SheetReader.open_workbook(file_path) as opened:
+                if opened is None:
+                    yield from SheetReader._iter_chunks_pandas(file_path, sheet_name, chunk_size)
+                else:
+                    yield from SheetReader._iter_chunks_openpyxl(opened, sheet_name, chunk_size)
+            return
+
+        yield from SheetReader._iter_chunks_openpyxl(workbook, sheet_name, chunk_size)
+
+    @staticmethod
+    def _iter_chunks_openpyxl(workbook, sheet_name, chunk_size):
+        rows = workbook[sheet_name].iter_rows(values_only=True)
+
+        header = next(rows, None)
+        columns = SheetReader._build_columns(header or ())
+        width = len(columns)
+
+        buffer = []
+        emitted = False
+        pending_empty = 0
+        for row in rows:
+            # Igual que pandas, las filas vacías al final de la hoja se descartan;
+            # las intermedias se conservan como filas nulas
+            if all(value is None for value in row):
+                pending_empty += 1
+                continue
+
+            while pending_empty:
+                buffer.append((None,) * width)
+                pending_empty -= 1
+                if len(buffer) >= chunk_size:
+                    yield SheetReader._to_frame(buffer, columns)
+                    emitted = True
+                    buffer = []
+
+            row = tuple(row[:width])
+            if len(row) < width:
+                row = row + (None,) * (width - len(row))
+            buffer.append(row)
+
+            if len(buffer) >= chunk_size:
+                yield SheetReader._to_frame(buffer, columns)
+                emitted = True
+                buffer = []
+
+        if buffer or not emitted:
+            yield SheetReader._to_frame(buffer, columns)
+
+    @staticmethod
+    def _iter_chunks_pandas(file_path, sheet_name, chunk_size):
+        logger.warning(f"Formato sin soporte de streaming, se lee la hoja {sheet_name} completa: {file_path}")
+        df = pd.read_excel(file_path, sheet_name=sheet_name)
+        df.columns = [str(col) for col in df.columns]
+        if len(df) == 0:
+            yield df
+            return
+        for start_idx in range(0, len(df), chunk_size):
+            yield df.iloc[start_idx:start_idx + chunk_size].reset_index(drop=True)
+
+    @staticmethod
+    def _build_columns(header):
+        """
+        Construye los nombres de columna a partir de la fila de cabecera, con el
+        mismo criterio que pandas para celdas vacías y nombres repetidos.
+        """
+        # Descartar celdas vacías al final de la cabecera
+        header = list(header)
+        while header and header[-1] is None:
+            header.pop()
+
+        columns = [f"Unnamed: {i}" if value is None else str(value) for i, value in enumerate(header)]
+
+        # Como pandas, primero se renombran las columnas con nombre y después las
+        # vacías; un nombre repetido toma el primer sufijo .N que no esté ya en la cabecera
+        named = [i for i, value in enumerate(header) if value is not None]
+        unnamed = [i for i, value in enumerate(header) if value is None]
+        counts = defaultdict(int)
+        for i in named + unnamed:
+            name = columns[i]
+            count = counts[name]
+            if count:
+                base = name
+                while count:
+                    counts[base] = count + 1
+                    name = f"{base}.{count}"
+                    count = count + 1 if name in columns else counts[name]
+                columns[i] = name
+            counts[name] = count + 1
+        return columns
+
+    @staticmethod
+    def _to_frame(rows, columns):
+        """Construye un DataFrame con tipos inferidos por columna"""
+        return pd.DataFrame.from_records(rows, columns=columns, coerce_float=True)
@@ -0,0 +1,229 @@
+import logging
+import posixpath
+import re
+import zipfile
+from xml.etree.ElementTree import iterparse
+
+logger = logging.getLogger(__name__)
+
+
+class WorkbookMetadataReader:
+    """
+    Lectura rápida de metadatos de un libro .xlsx sin parsear sus datos.
+
+    Lee directamente del zip los nombres de las hojas y la referencia
+    <dimension> de cada una. Si la dimensión falta o no es fiable, cuenta las filas recorriendo el XML de la hoja en streaming.
+    En las hojas grandes la dimensión no se comprueba fila a fila: el
+    row_count definitivo lo da la caché de hojas (JobQueue._warm_cache).
+    """
+
+    CELL_REF_RE = re.compile(r'^([A-Z]+)(\d+)$')
+
+    # Filas de una hoja de Excel: una dimensión que llega hasta aquí está estirada
+    EXCEL_MAX_ROWS = 1048576
+    # Bytes mínimos del XML de una fila, para descartar dimensiones imposibles
+    MIN_ROW_BYTES = 20
+    # Final de la hoja que se examina para comprobar la última fila
+    TAIL_BYTES = 64 * 1024
+    # Para llegar al final hay que descomprimir la hoja entera: por encima de
+    # este tamaño (descomprimido) no se comprueba y el row_count lo corrige la
+    # caché de hojas al leerla en streaming
+    TAIL_CHECK_MAX_BYTES = 8 * 1024 * 1024
+
+    ROW_START_RE = re.compile(rb'<(?:\w+:)?row\b([^>]*)>')
+    ROW_NUMBER_RE = re.compile(rb'\sr="(\d+)"')
+    CELL_VALUE_RE = re.compile(rb'<(?:\w+:)?(?:v|is)\b')
+
+    # Filas entre llamadas al callback de progreso al contarlas en streaming
+    PROGRESS_ROWS = 10000
+
+    @staticmethod
+    def read(file_path, progress_callback=None):
+        """
+        Devuelve los metadatos de cada hoja del libro
+
+        Args:
+            file_path: Ruta del archivo .xlsx
+            progress_callback: Función opcional que recibe las filas recorridas
+                mientras se cuentan las filas de una hoja en streaming
+
+        Returns:
+            list: [{'name', 'dimension', 'row_count'}, ...] en el orden del libro
+
+        Raises:
+            zipfile.BadZipFile: Si el archivo no es un .xlsx (por ejemplo un .xls)
+        """
+        with zipfile.ZipFile(file_path) as archive:
+            sheets = []
+            for name, part in WorkbookMetadataReader._read_sheet_parts(archive):
+                dimension, header_width = WorkbookMetadataReader._read_dimension_and_width(archive, part)
+                row_count = WorkbookMetadataReader._row_count_from_dimension(dimension)
+                if row_count is not None and not WorkbookMetadataReader._dimension_is_plausible(
+                        archive, part, dimension, header_width):
+                    row_count = None
+                if row_count is None:
+                    logger.debug(f"Dimensión no fiable en la hoja {name} ({dimension}); contando filas")
+                    row_count = WorkbookMetadataReader._count_rows(archive, part, progress_callback)
+
+                sheets.append({'name': name, 'dimension': dimension, 'row_count': row_count})
+        return sheets
+
+    @staticmethod
+    def _local(tag):
+        return tag.rsplit('}', 1)[-1]
+
+    @staticmethod
+    def _attr(element, local_name):
+        for key, value in element.attrib.items():
+            if WorkbookMetadataReader._local(key) == local_name:
+                return value
+        return None
+
+    @staticmethod
+    def _read_sheet_parts(archive):
+        """Devuelve [(nombre de hoja, ruta de la parte XML)] en el orden del libro"""
+        targets = {}
+        with archive.open('xl/_rels/workbook.xml.rels') as f:
+            for _, element in iterparse(f):
+                if WorkbookMetadataReader._local(element.tag) == 'Relationship':
+                    target = element.get('Target')
+                    if target.startswith('/'):
+                        target = target.lstrip('/')
+                    else:
+                        target = posixpath.normpath(posixpath.join('xl', target))
+                    targets[element.get('Id')] = target
+
+        sheet_parts = []
+        with archive.open('xl/workbook.xml') as f:
+            for _, element in iterparse(f):
+                if WorkbookMetadataReader._local(element.tag) == 'sheet':
+                    rel_id = WorkbookMetadataReader._attr(element, 'id')
+                    sheet_parts.append((element.get('name'), targets[rel_id]))
+        return sheet_parts
+
+    @staticmethod
+    def _column_index(cell_ref, default):
+        match = WorkbookMetadataReader.CELL_REF_RE.match(cell_ref or '')
+        if not match:
+            return default
+        index = 0
+        for char in match.group(1):
+            index = index * 26 + (ord(char) - ord('A') + 1)
+        return index - 1
+
+    @staticmethod
+    def _read_dimension_and_width(archive, part):
+        """
+        Lee la referencia <dimension> y el ancho de la primera fila de la hoja
+        (hasta su última celda con valor), deteniendo el parseo en cuanto se
+        completa la primera fila. Los valores de la cabecera no hacen falta: el
+        esquema y los nombres de columna salen de la caché de hojas.
+        """
+        dimension = None
+        width = 0
+        with archive.open(part) as f:
+            for event, element in iterparse(f, events=('start', 'end')):
+                local = WorkbookMetadataReader._local(element.tag)
+                if event == 'start':
+                    if local == 'dimension':
+                        dimension = element.get('ref')
+                    continue
+                if local != 'row':
+                    continue
+
+                # La cabecera es la fila 1; si la hoja empieza más abajo, no hay cabecera
+                if element.get('r', '1') == '1':
+                    for position, cell in enumerate(c for c in element if WorkbookMetadataReader._local(c.tag) == 'c'):
+                        if any(WorkbookMetadataReader._local(child.tag) in ('v', 'is') for child in cell):
+                            index = WorkbookMetadataReader._column_index(cell.get('r'), position)
+                            width = max(width, index + 1)
+                break
+        return dimension, width
+
+    @staticmethod
+    def _row_count_from_dimension(dimension):
+        """
+        Número de filas de datos según la dimensión, o None si no es fiable.
+        Algunos generadores escriben siempre "A1" o no escriben la dimensión.
+        """
+        if not dimension or ':' not in dimension:
+            return None
+        last_ref = dimension.split(':')[1]
+        match = WorkbookMetadataReader.CELL_REF_RE.match(last_ref)
+        if not match:
+            return None
+        return max(int(match.group(2)) - 1, 0)
+
+    @staticmethod
+    def _dimension_is_plausible(archive, part, dimension, header_width):
+        """
+        Comprueba una dimensión antes de fiarse de ella. Muchos generadores la
+        estiran (A1:XFD1048576) o incluyen filas vacías con formato, así que
+        además de descartar las imposibles (hasta la última fila de Excel, más
+        ancha que la cabecera o más filas de las que caben en el XML de la
+        hoja) se verifica que su última fila sea la última con valores, solo
+        en las hojas de hasta TAIL_CHECK_MAX_BYTES.
+        """
+        last_ref = dimension.split(':')[1]
+        match = WorkbookMetadataReader.CELL_REF_RE.match(last_ref)
+        last_column = WorkbookMetadataReader._column_index(last_ref, 0)
+        last_row = int(match.group(2))
+
+        if last_row >= WorkbookMetadataReader.EXCEL_MAX_ROWS:
+            return False
+        if header_width and last_column >= header_width:
+            return False
+        file_size = archive.getinfo(part).file_size
+        if last_row * WorkbookMetadataReader.MIN_ROW_BYTES > file_size:
+            return False
+        if file_size > WorkbookMetadataReader.TAIL_CHECK_MAX_BYTES:
+            return True
+        return WorkbookMetadataReader._last_row_in_tail(archive, part) == last_row
+
+    @staticmethod
+    def _last_row_in_tail(archive, part):
+        """
+        Número de la última fila de la hoja si tiene algún valor, leyendo solo
+        el final del XML descomprimido (sin parsearlo)
+
+        Returns:
+            int: Atributo r de la última fila, o None si no tiene valores o no
+            se puede determinar
+        """
+        tail = b''
+        with archive.open(part) as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                tail = (tail + block)[-WorkbookMetadataReader.TAIL_BYTES:]
+
+        last = None
+        for last in WorkbookMetadataReader.ROW_START_RE.finditer(tail):
+            pass
+        if last is None or last.group(1).rstrip().endswith(b'/'):
+            # Sin filas en el final examinado, o una fila vacía (<row .../>)
+            return None
+        number = WorkbookMetadataReader.ROW_NUMBER_RE.search(last.group(1))
+        row_end = tail.find(b'row>', last.end())
+        if number is None or row_end < 0 or not WorkbookMetadataReader.CELL_VALUE_RE.search(tail, last.end(), row_end):
+            return None
+        return int(number.group(1))
+
+    @staticmethod
+    def _count_rows(archive, part, progress_callback=None):
+        """
+        Cuenta las filas de datos recorriendo la hoja en streaming: la última fila
+        con algún valor menos la cabecera, igual que pandas.
+        """
+        last_row = 0
+        current_row = 0
+        with archive.open(part) as f:
+            for _, element in iterparse(f):
+                local = WorkbookMetadataReader._local(element.tag)
+                if local == 'row':
+                    current_row = int(element.get('r', current_row + 1))
+                    if progress_callback and current_row % WorkbookMetadataReader.PROGRESS_ROWS == 0:
+                        progress_callback(current_row)
+                    if any(WorkbookMetadataReader._local(child.tag) in ('v', 'is')
+                           for cell in element for child in cell):
+                        last_row = current_row
+                    element.clear()
+        return max(last_row - 1, 0)
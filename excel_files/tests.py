@@ -1,3 +1,574 @@
-from django.test import TestCase
+import io
+import os
+import re
+import shutil
+import tempfile
+import time
+import zipfile
+from datetime import timedelta
+from unittest import mock
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db.models import QuerySet
+from django.test import Client, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+import pandas as pd
+from openpyxl import Workbook
+from openpyxl.styles import Font
+from data_models.models import DataTable
+from excel_files.services.bulk_ingest import BulkIngestService
+from data_models.services.model_factory import DataModelFactory
+from excel_files.models import ExcelFile, ExcelSheet, ProcessingJob
+from excel_files.services.file_manager import ExcelFileManager
+from excel_files.services.job_queue import JobQueue
+from excel_files.services.sheet_cache import SheetCache
+from excel_files.services.sheet_reader import SheetReader
+from excel_files.services.workbook_metadata import WorkbookMetadataReader
+
+
+def build_upload(rows, header=('id', 'pais', 'importe')):
+    """Archivo subido con un libro de una hoja 'Datos' con la cabecera y las filas indicadas"""
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.title = 'Datos'
+    sheet.append(list(header))
+    for row in rows:
+        sheet.append(list(row))
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return SimpleUploadedFile('datos.xlsx', buffer.getvalue())
+
+
+class RefreshFileJobTests(TestCase):
+    """Trabajo refresh_file: recarga de las tablas con una nueva versión del archivo"""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root, SHEET_CACHE_DIR=f"{media_root}/cache/sheets")
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def run_job(self, job_type, excel_file):
+        JobQueue.enqueue(job_type, excel_file)
+        job = JobQueue.claim_next('tests')
+        JobQueue.run(job)
+        job.refresh_from_db()
+        return job
+
+    def test_refresh_file_updates_tables_with_new_version(self):
+        rows = [(i, 'ES' if i % 2 else 'FR', i * 1.5) for i in range(1, 31)]
+        excel_file = ExcelFile.objects.create(name='datos.xlsx', file=build_upload(rows))
+        self.assertEqual(self.run_job('process_file', excel_file).status, 'completed')
+        sheet = ExcelSheet.objects.get(excel_file=excel_file)
+        data_table = DataModelFactory.create_data_table_from_sheet(sheet.id, storage_backend='eav')
+
+        # Una fila cambiada, dos eliminadas y una nueva al final
+        rows[2] = (3, 'PT', 4.5)
+        rows = rows[:28] + [(99, 'ES', 0.5)]
+        ExcelFileManager.replace_file(excel_file, build_upload(rows))
+        self.assertEqual(self.run_job('refresh_file', excel_file).status, 'completed')
+
+        data_table = DataTable.objects.get(id=data_table.id)
+        columns = list(sheet.columns.order_by('column_index'))
+        stored = data_table.get_storage().read_rows(data_table, columns, 0, 100)
+        self.assertEqual([tuple(row[1:]) for row in stored], rows)
+        self.assertEqual((data_table.status, data_table.row_count), ('ready', 29))
+        sheet.refresh_from_db()
+        self.assertEqual(sheet.row_count, 29)
+        self.assertFalse(ProcessingJob.objects.filter(status__in=ProcessingJob.ACTIVE_STATUSES).exists())
+
+
+class JobQueueTests(TestCase):
+    """Reclamación, reintentos, trabajos sin actividad y cancelación de la cola de trabajos"""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root, SHEET_CACHE_DIR=f"{media_root}/cache/sheets")
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.excel_file = ExcelFile.objects.create(name='datos.xlsx', file=build_upload([(1, 'ES', 1.0)]))
+
+    def make_stale(self, job):
+        ProcessingJob.objects.filter(id=job.id).update(heartbeat_at=timezone.now() - timedelta(seconds=700))
+
+    def test_concurrent_claims_take_different_jobs(self):
+        first = JobQueue.enqueue('process_file', self.excel_file)
+        second = JobQueue.enqueue('detect_sheets', self.excel_file)
+
+        # Otro worker reclama el primer trabajo entre la lectura de candidatos y la actualización de 'a'
+        original_update = QuerySet.update
+        claims = {}
+
+        def racing_update(queryset, **kwargs):
+            if kwargs.get('worker') == 'a' and 'b' not in claims:
+                claims['b'] = JobQueue.claim_next('b')
+            return original_update(queryset, **kwargs)
+
+        with mock.patch.object(QuerySet, 'update', racing_update):
+            claims['a'] = JobQueue.claim_next('a')
+
+        self.assertEqual((claims['b'].id, claims['a'].id), (first.id, second.id))
+        self.assertEqual(
+            list(ProcessingJob.objects.order_by('id').values_list('status', 'worker', 'attempts')),
+            [('running', 'b', 1), ('running', 'a', 1)]
+        )
+        self.assertIsNone(JobQueue.claim_next('c'))
+
+    def test_requeue_stale_returns_silent_jobs(self):
+        stale = JobQueue.enqueue('process_file', self.excel_file)
+        alive = JobQueue.enqueue('detect_sheets', self.excel_file)
+        cancelled = JobQueue.enqueue('create_tables', self.excel_file)
+        for _ in range(3):
+            JobQueue.claim_next('tests')
+        self.make_stale(stale)
+        self.make_stale(cancelled)
+        JobQueue.cancel(cancelled.id)
+
+        self.assertEqual(JobQueue.requeue_stale(timeout=600), 1)
+        stale.refresh_from_db()
+        self.assertEqual((stale.status, stale.attempts), ('pending', 1))
+        self.assertEqual(ProcessingJob.objects.get(id=alive.id).status, 'running')
+        self.assertEqual(ProcessingJob.objects.get(id=cancelled.id).status, 'cancelled')
+
+        # La reclamación siguiente cuenta como un nuevo intento
+        self.assertEqual(JobQueue.claim_next('tests').attempts, 2)
+
+    def test_stale_job_fails_after_max_attempts(self):
+        job = JobQueue.enqueue('process_file', self.excel_file, max_attempts=2)
+        for attempt in (1, 2):
+            self.assertEqual(JobQueue.claim_next('tests').attempts, attempt)
+            self.make_stale(job)
+            JobQueue.requeue_stale(timeout=600)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        self.assertIn('dejó de responder', job.error)
+        self.excel_file.refresh_from_db()
+        self.assertEqual(self.excel_file.error, job.error)
+        self.assertIsNone(JobQueue.claim_next('tests'))
+
+    def test_failing_job_retries_until_max_attempts(self):
+        job = JobQueue.enqueue('process_file', self.excel_file, max_attempts=2)
+        failing = mock.Mock(side_effect=ValueError('libro dañado'))
+
+        with mock.patch.dict(JobQueue.HANDLERS, {'process_file': failing}):
+            JobQueue.run(JobQueue.claim_next('tests'))
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.error), ('pending', 'libro dañado'))
+            self.assertGreater(job.run_after, timezone.now())
+            self.assertIsNone(JobQueue.claim_next('tests'))
+
+            ProcessingJob.objects.filter(id=job.id).update(run_after=timezone.now())
+            JobQueue.run(JobQueue.claim_next('tests'))
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, failing.call_count), ('failed', 2, 2))
+        self.excel_file.refresh_from_db()
+        self.assertEqual(self.excel_file.error, 'libro dañado')
+
+    def test_cancel_stops_load_and_keeps_checkpoint(self):
+        rows = [(i, 'ES' if i % 2 else 'FR', i * 1.5) for i in range(1, 2501)]
+        excel_file = ExcelFile.objects.create(name='grande.xlsx', file=build_upload(rows))
+        JobQueue.enqueue('process_file', excel_file)
+        JobQueue.run(JobQueue.claim_next('tests'))
+        sheet = ExcelSheet.objects.get(excel_file=excel_file)
+
+        JobQueue.enqueue('create_table', excel_file, sheet=sheet)
+        job = JobQueue.claim_next('tests')
+        save_checkpoint = DataModelFactory._save_checkpoint
+
+        def save_and_cancel(data_table, checkpoint):
+            save_checkpoint(data_table, checkpoint)
+            JobQueue.cancel(job.id)
+
+        # La cancelación se pide durante el primer lote y se atiende en el siguiente informe de progreso
+        with mock.patch.object(DataModelFactory, '_save_checkpoint', side_effect=save_and_cancel) as patched:
+            JobQueue.run(job)
+        self.assertEqual(patched.call_count, 1)
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.stage, job.rows_processed), ('cancelled', 'load', 1000))
+        data_table = DataTable.objects.get(sheet=sheet)
+        self.assertEqual((data_table.status, data_table.loaded_rows), ('loading', 1000))
+
+        # Un nuevo trabajo reanuda la carga desde el checkpoint
+        JobQueue.enqueue('create_table', excel_file, sheet=sheet)
+        JobQueue.run(JobQueue.claim_next('tests'))
+        data_table.refresh_from_db()
+        self.assertEqual((data_table.status, data_table.row_count), ('ready', 2500))
+
+
+class SheetCacheTests(TestCase):
+    """Caché de hojas: parseo a partes Parquet, desalojo LRU e invalidación"""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root, SHEET_CACHE_DIR=f"{media_root}/cache/sheets",
+                                              SHEET_CACHE_PARTIAL_GRACE=60)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def cache_workbook(self, rows, accessed_at=None):
+        """Parsea un libro a la caché; opcionalmente fecha su último acceso"""
+        excel_file = ExcelFile.objects.create(name='datos.xlsx', file=build_upload(rows))
+        SheetCache.get_manifest(excel_file)
+        if accessed_at is not None:
+            manifest_path = os.path.join(SheetCache._workbook_dir(excel_file.content_hash), SheetCache.MANIFEST_NAME)
+            os.utime(manifest_path, (accessed_at, accessed_at))
+        return excel_file
+
+    def workbook_size(self, content_hash):
+        return SheetCache._dir_stats(SheetCache._workbook_dir(content_hash))[0]
+
+    def test_populate_writes_parts_and_manifest(self):
+        rows = [(i, 'ES', i * 0.5) for i in range(1, 26)]
+        excel_file = self.cache_workbook(rows)
+
+        self.assertTrue(SheetCache.is_cached(excel_file.content_hash))
+        entry = SheetCache.get_sheet_entry(excel_file, 'Datos')
+        self.assertEqual((entry['columns'], entry['row_count']), (['id', 'pais', 'importe'], 25))
+        block, = SheetCache.read_sheet_rows(excel_file, 'Datos', 10, 5)
+        self.assertEqual(block['id'].tolist(), [11, 12, 13, 14, 15])
+        self.assertEqual(SheetCache.get_null_counts(excel_file, 'Datos'), {'id': 0, 'pais': 0, 'importe': 0})
+        with self.assertRaises(ValueError):
+            SheetCache.get_sheet_entry(excel_file, 'Otra')
+
+    def test_evict_removes_least_recently_used_first(self):
+        now = time.time()
+        oldest = self.cache_workbook([(1, 'ES', 1.0)], accessed_at=now - 300)
+        older = self.cache_workbook([(2, 'FR', 2.0)], accessed_at=now - 200)
+        recent = self.cache_workbook([(3, 'PT', 3.0)], accessed_at=now - 100)
+
+        # Solo caben dos libros: desaparece el de acceso más antiguo
+        max_bytes = self.workbook_size(older.content_hash) + self.workbook_size(recent.content_hash)
+        SheetCache.evict(max_bytes=max_bytes)
+        self.assertFalse(SheetCache.is_cached(oldest.content_hash))
+        self.assertTrue(SheetCache.is_cached(older.content_hash))
+        self.assertTrue(SheetCache.is_cached(recent.content_hash))
+
+        # El libro protegido con keep sobrevive aunque sea el menos usado
+        SheetCache.evict(max_bytes=0, keep=older.content_hash)
+        self.assertTrue(SheetCache.is_cached(older.content_hash))
+        self.assertFalse(SheetCache.is_cached(recent.content_hash))
+
+        # Leer un libro desalojado lo vuelve a parsear
+        self.assertEqual(SheetCache.get_sheet_entry(recent, 'Datos')['row_count'], 1)
+
+    def test_evict_skips_partial_entries_until_grace_expires(self):
+        partial_dir = os.path.join(SheetCache.get_cache_dir(), 'parcial')
+        os.makedirs(partial_dir)
+        part_path = os.path.join(partial_dir, 'part-00000.parquet')
+        with open(part_path, 'wb') as f:
+            f.write(b'x' * 1024)
+
+        SheetCache.evict(max_bytes=0)
+        self.assertTrue(os.path.isdir(partial_dir))
+
+        stale = time.time() - 120
+        os.utime(part_path, (stale, stale))
+        os.utime(partial_dir, (stale, stale))
+        SheetCache.evict(max_bytes=0)
+        self.assertFalse(os.path.isdir(partial_dir))
+
+    def test_invalidate_removes_workbook(self):
+        excel_file = self.cache_workbook([(1, 'ES', 1.0)])
+        other = self.cache_workbook([(2, 'FR', 2.0)])
+
+        SheetCache.invalidate(excel_file.content_hash)
+        self.assertFalse(os.path.isdir(SheetCache._workbook_dir(excel_file.content_hash)))
+        self.assertTrue(SheetCache.is_cached(other.content_hash))
+
+
+class BulkUploadTests(TestCase):
+    """Carga masiva: API JSON con sesión y CSRF, registro de archivos e ingesta en cadena"""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root, SHEET_CACHE_DIR=f"{media_root}/cache/sheets",
+                                              DATA_TABLE_PARQUET_DIR=f"{media_root}/tables", INGEST_WORKERS=1)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.client = Client(enforce_csrf_checks=True)
+        self.url = reverse('excel_files:bulk_upload_api')
+
+    def csrf_token(self):
+        self.client.get(reverse('excel_files:bulk_upload'))
+        return self.client.cookies['csrftoken'].value
+
+    @staticmethod
+    def build_zip(members):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w') as archive:
+            for name, content in members.items():
+                archive.writestr(name, content)
+        return SimpleUploadedFile('lote.zip', buffer.getvalue())
+
+    def test_api_requires_csrf_token(self):
+        response = self.client.post(self.url, {'files': [build_upload([(1, 'ES', 1.0)])]})
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(ExcelFile.objects.exists())
+
+    def test_api_registers_files_and_enqueues_ingest(self):
+        archive = self.build_zip({
+            'ventas.xlsx': build_upload([(2, 'FR', 2.0)]).read(),
+            'notas.txt': b'texto',
+            '__MACOSX/._ventas.xlsx': b'',
+        })
+        files = [build_upload([(1, 'ES', 1.0)]), archive, SimpleUploadedFile('leeme.txt', b'texto')]
+        response = self.client.post(self.url, {'files': files, 'create_tables': 'on', 'storage_backend': 'sql'},
+                                    HTTP_X_CSRFTOKEN=self.csrf_token())
+
+        self.assertEqual(response.status_code, 202)
+        body = response.json()
+        self.assertEqual([f['name'] for f in body['files']], ['datos', 'ventas'])
+        self.assertEqual(body['rejected'], ['lote.zip/notas.txt', 'leeme.txt'])
+        job = ProcessingJob.objects.get(id=body['job_id'])
+        self.assertEqual((job.job_type, job.status), ('ingest_files', 'pending'))
+        self.assertEqual(job.options, {'file_ids': [f['id'] for f in body['files']], 'create_tables': True,
+                                       'storage_backend': 'sql'})
+        self.assertEqual(body['status_url'], reverse('excel_files:bulk_progress', kwargs={'job_id': job.id}))
+
+    def test_api_rejects_requests_without_workbooks(self):
+        token = self.csrf_token()
+        response = self.client.post(self.url, {'files': [SimpleUploadedFile('leeme.txt', b'texto')]},
+                                    HTTP_X_CSRFTOKEN=token)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['rejected'], ['leeme.txt'])
+
+        response = self.client.post(self.url, {'files': [build_upload([(1, 'ES', 1.0)])], 'storage_backend': 'otro'},
+                                    HTTP_X_CSRFTOKEN=token)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(ProcessingJob.objects.exists())
+
+    def test_ingest_files_loads_each_file_and_isolates_failures(self):
+        rows = [(i, 'ES' if i % 2 else 'FR', i * 1.5) for i in range(1, 21)]
+        content = build_upload(rows).read()
+        excel_files, rejected = BulkIngestService.register_files([
+            SimpleUploadedFile('datos.xlsx', content),
+            SimpleUploadedFile('roto.xlsx', b'no es un libro'),
+            SimpleUploadedFile('datos.xlsx', content),
+        ])
+        self.assertEqual(rejected, [])
+
+        progress = []
+        summary = BulkIngestService.ingest_files([f.id for f in excel_files], create_tables=True,
+                                                 storage_backend='sql', workers=1,
+                                                 progress_callback=lambda *args: progress.append(args))
+
+        self.assertEqual((summary['files'], summary['succeeded'], summary['failed']), (3, 2, 1))
+        self.assertEqual((summary['sheets'], summary['rows']), (2, 40))
+        self.assertEqual(progress[0], ('ingest', 0, 3))
+        self.assertEqual(progress[-1], ('ingest', 3, 3))
+
+        original, broken, duplicate = [ExcelFile.objects.get(id=f.id) for f in excel_files]
+        self.assertIsNone(original.error)
+        self.assertIsNotNone(broken.error)
+        self.assertFalse(broken.sheets.exists())
+        # El duplicado copia hojas y tablas del original en lugar de volver a cargarlo
+        for excel_file in (original, duplicate):
+            sheet = excel_file.sheets.get()
+            data_table = sheet.data_table
+            self.assertEqual((data_table.status, data_table.row_count, data_table.storage_backend),
+                             ('ready', 20, 'sql'))
+            columns = list(sheet.columns.order_by('column_index'))
+            stored = data_table.get_storage().read_rows(data_table, columns, 0, 100)
+            self.assertEqual([tuple(row[1:]) for row in stored], rows)
+
+
+class FileReplacementTests(TestCase):
+    """Sustitución de archivos con contenido compartido entre registros duplicados"""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root, SHEET_CACHE_DIR=f"{media_root}/cache/sheets")
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        # openpyxl guarda la hora en el libro: los duplicados reutilizan los mismos bytes
+        self.first = build_upload([(1, 'ES', 1.0), (2, 'FR', 2.0)]).read()
+        self.second = build_upload([(1, 'ES', 1.5), (3, 'PT', 3.0)]).read()
+
+    @staticmethod
+    def upload(content):
+        return SimpleUploadedFile('datos.xlsx', content)
+
+    def register(self, content):
+        """Registra un archivo con sus hojas leídas y su libro en la caché"""
+        excel_file = ExcelFile.objects.create(name='datos.xlsx', file=self.upload(content))
+        ExcelFileManager.read_excel_sheets(excel_file.id)
+        SheetCache.get_manifest(excel_file)
+        return ExcelFile.objects.get(id=excel_file.id)
+
+    def replace(self, excel_file, content):
+        with self.captureOnCommitCallbacks(execute=True):
+            ExcelFileManager.replace_file(excel_file, self.upload(content))
+        return excel_file
+
+    def test_replace_releases_previous_version(self):
+        excel_file = self.register(self.first)
+        previous_path, previous_hash = excel_file.file.path, excel_file.content_hash
+
+        self.replace(excel_file, self.second)
+        self.assertNotEqual(excel_file.content_hash, previous_hash)
+        self.assertTrue(os.path.isfile(excel_file.file.path))
+        self.assertFalse(os.path.isfile(previous_path))
+        self.assertFalse(SheetCache.is_cached(previous_hash))
+
+    def test_replace_with_same_content_keeps_file(self):
+        excel_file = self.register(self.first)
+        self.replace(excel_file, self.first)
+        self.assertTrue(os.path.isfile(excel_file.file.path))
+        self.assertTrue(SheetCache.is_cached(excel_file.content_hash))
+
+    def test_failed_save_keeps_previous_version(self):
+        excel_file = self.register(self.first)
+        previous_path = excel_file.file.path
+
+        with mock.patch.object(ExcelFile, 'save', side_effect=OSError('disco lleno')):
+            with self.assertRaises(OSError), self.captureOnCommitCallbacks(execute=True) as callbacks:
+                ExcelFileManager.replace_file(excel_file, self.upload(self.second))
+        self.assertEqual(callbacks, [])
+        self.assertTrue(os.path.isfile(previous_path))
+        self.assertTrue(SheetCache.is_cached(ExcelFile.objects.get(id=excel_file.id).content_hash))
+
+    def test_shared_content_is_refcounted(self):
+        original = self.register(self.first)
+        duplicate = ExcelFile.objects.create(name='copia.xlsx', file=self.upload(self.first))
+        shared_path, shared_hash = original.file.path, original.content_hash
+
+        # El duplicado comparte el archivo físico y copia las hojas del original
+        self.assertEqual(duplicate.file.path, shared_path)
+        self.assertEqual(ExcelFileManager.find_duplicate(duplicate), original)
+        self.assertEqual(ExcelFileManager.link_duplicate(duplicate), original)
+        self.assertEqual(list(duplicate.sheets.values_list('name', 'row_count')), [('Datos', 2)])
+
+        # Sustituir uno de los dos no borra el contenido que el otro sigue usando
+        self.replace(original, self.second)
+        self.assertTrue(os.path.isfile(shared_path))
+        self.assertTrue(SheetCache.is_cached(shared_hash))
+        self.assertIsNone(ExcelFileManager.find_duplicate(original))
+        self.assertIsNone(ExcelFileManager.find_duplicate(duplicate))
+
+        # Con la última referencia eliminada se libera
+        duplicate.delete()
+        self.assertFalse(os.path.isfile(shared_path))
+        self.assertFalse(SheetCache.is_cached(shared_hash))
+        self.assertTrue(os.path.isfile(original.file.path))
+
+
+class SheetReaderTests(SimpleTestCase):
+    """Nombres de columna de la cabecera frente a los de pd.read_excel"""
+
+    HEADERS = [
+        ('id', None, 'importe'),
+        (None, 'pais', None, 'pais', None),
+        ('a', 'a', 'a.1', 'a'),
+        ('x', 'x', 'x.1', 'x.1'),
+        ('Unnamed: 1', None, 'id'),
+        (2024, 'id', 2024, 'total', None, None),
+    ]
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.workdir, ignore_errors=True)
+
+    def save_workbook(self, header):
+        """Libro con la cabecera y dos filas de datos bajo las columnas con cabecera"""
+        width = len(header)
+        while width and header[width - 1] is None:
+            width -= 1
+        workbook = Workbook()
+        workbook.active.append(list(header))
+        for i in range(2):
+            workbook.active.append([i * 10 + j for j in range(width)])
+        path = os.path.join(self.workdir, 'cabecera.xlsx')
+        workbook.save(path)
+        return path
+
+    def test_columns_match_read_excel(self):
+        for header in self.HEADERS:
+            with self.subTest(header=header):
+                path = self.save_workbook(header)
+                expected = [str(col) for col in pd.read_excel(path).columns]
+
+                columns = SheetReader._build_columns(header)
+                self.assertEqual(columns, expected)
+                self.assertEqual(len(set(columns)), len(columns))
+                chunk = next(SheetReader.iter_chunks(path, 'Sheet', chunk_size=10))
+                self.assertEqual(list(chunk.columns), expected)
+                self.assertEqual(chunk.values.tolist(), pd.read_excel(path).values.tolist())
+
+
+class WorkbookMetadataTests(SimpleTestCase):
+    """Número de filas leído de los metadatos frente a una lectura completa de la hoja"""
+
+    SHEET_PART = 'xl/worksheets/sheet1.xml'
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.workdir, ignore_errors=True)
+
+    def save(self, name, content):
+        path = os.path.join(self.workdir, name)
+        with open(path, 'wb') as f:
+            f.write(content)
+        return path
+
+    def with_dimension(self, content, ref):
+        """Copia del libro con la <dimension> de la primera hoja cambiada (o quitada si ref es None)"""
+        source = zipfile.ZipFile(io.BytesIO(content))
+        buffer = io.BytesIO()
+        with source, zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as target:
+            for item in source.infolist():
+                data = source.read(item)
+                if item.filename == self.SHEET_PART:
+                    replacement = b'' if ref is None else f'<dimension ref="{ref}"/>'.encode()
+                    data, count = re.subn(rb'<dimension ref="[^"]*"\s*/>', replacement, data)
+                    self.assertEqual(count, 1)
+                target.writestr(item, data)
+        return buffer.getvalue()
+
+    def assert_row_count_matches_full_read(self, path):
+        metadata = WorkbookMetadataReader.read(path)
+        self.assertEqual([sheet['name'] for sheet in metadata], pd.ExcelFile(path).sheet_names)
+        for sheet in metadata:
+            with self.subTest(path=os.path.basename(path), sheet=sheet['name']):
+                self.assertEqual(sheet['row_count'], len(pd.read_excel(path, sheet_name=sheet['name'])))
+
+    def test_row_counts_match_full_read(self):
+        rows = [(i, 'ES', i * 1.5) for i in range(1, 41)]
+        content = build_upload(rows).read()
+
+        cases = {
+            'exacta.xlsx': content,
+            'corta.xlsx': self.with_dimension(content, 'A1:C5'),
+            'larga.xlsx': self.with_dimension(content, 'A1:C90'),
+            'estirada.xlsx': self.with_dimension(content, 'A1:XFD1048576'),
+            'ancha.xlsx': self.with_dimension(content, 'A1:H41'),
+            'solo_a1.xlsx': self.with_dimension(content, 'A1'),
+            'sin_dimension.xlsx': self.with_dimension(content, None),
+        }
+        for name, data in cases.items():
+            self.assert_row_count_matches_full_read(self.save(name, data))
+
+    def test_formatted_empty_rows_are_not_counted(self):
+        workbook = Workbook()
+        sheet = workbook.active
+        sheet.title = 'Datos'
+        sheet.append(['id', 'pais'])
+        for i in range(1, 11):
+            sheet.append([i, 'FR'])
+        # Celdas con formato y sin valor que estiran la dimensión hasta la fila 30
+        sheet['B30'].font = Font(bold=True)
+        workbook.create_sheet('Vacía')
+        buffer = io.BytesIO()
+        workbook.save(buffer)
+
+        path = self.save('formato.xlsx', buffer.getvalue())
+        self.assertEqual(WorkbookMetadataReader.read(path)[0]['dimension'], 'A1:B30')
+        self.assert_row_count_matches_full_read(path)
 
-# Create your tests here.
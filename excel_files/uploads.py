@@ -0,0 +1,64 @@
+import hashlib
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadhandler import MemoryFileUploadHandler, TemporaryFileUploadHandler
+from django.utils.deconstruct import deconstructible
+
+
+class HashingUploadMixin:
+    """
+    Calcula el SHA-256 del archivo mientras se recibe, de modo que el hash del
+    contenido está disponible sin volver a leerlo (atributo content_hash)
+    """
+
+    def new_file(self, *args, **kwargs):
+        # Antes de super(): el manejador en memoria lanza StopFutureHandlers
+        self.digest = hashlib.sha256()
+        super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        self.digest.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        uploaded_file = super().file_complete(file_size)
+        if uploaded_file is not None:
+            uploaded_file.content_hash = self.digest.hexdigest()
+        return uploaded_file
+
+
+class HashingMemoryFileUploadHandler(HashingUploadMixin, MemoryFileUploadHandler):
+    pass
+
+
+class HashingTemporaryFileUploadHandler(HashingUploadMixin, TemporaryFileUploadHandler):
+    pass
+
+
+def compute_content_hash(file_obj):
+    """
+    Hash SHA-256 del contenido de un archivo. Usa el calculado durante la
+    subida si existe; si no, lo calcula leyendo el archivo por bloques.
+    """
+    content_hash = getattr(file_obj, 'content_hash', None)
+    if content_hash:
+        return content_hash
+
+    digest = hashlib.sha256()
+    for chunk in file_obj.chunks():
+        digest.update(chunk)
+    file_obj.seek(0)
+    return digest.hexdigest()
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Almacenamiento de archivos nombrados por el hash de su contenido: si el
+    archivo ya existe tiene los mismos bytes, así que no se vuelve a escribir
+    y los registros duplicados comparten el mismo archivo físico.
+    """
+
+    def save(self, name, content, max_length=None):
+        if name and self.exists(name):
+            return name
+        return super().save(name, content, max_length)
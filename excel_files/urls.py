@@ -1,10 +1,18 @@
 from django.urls import path
-from .views import ExcelFileUploadView, ExcelFileDetailView, ExcelFileListView
+from .views import ExcelFileUploadView, ExcelFileDetailView, ExcelFileListView, file_progress, cancel_job, replace_file, \
+    bulk_upload, bulk_upload_api, bulk_status, bulk_progress
 
 app_name = "excel_files"
 
 urlpatterns = [
     path('upload/', ExcelFileUploadView.as_view(), name='upload'),
+    path('upload/bulk/', bulk_upload, name='bulk_upload'),
+    path('api/upload/', bulk_upload_api, name='bulk_upload_api'),
+    path('upload/bulk/<int:job_id>/', bulk_status, name='bulk_status'),
+    path('upload/bulk/<int:job_id>/progress/', bulk_progress, name='bulk_progress'),
     path('<int:pk>/', ExcelFileDetailView.as_view(), name='detail'),
     path('list/', ExcelFileListView.as_view(), name='list'),
+    path('<int:pk>/progress/', file_progress, name='progress'),
+    path('<int:pk>/replace/', replace_file, name='replace_file'),
+    path('jobs/<int:job_id>/cancel/', cancel_job, name='cancel_job'),
 ]
\ No newline at end of file
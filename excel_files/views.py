@@ -1,16 +1,19 @@
 import logging
-import traceback
 
 from django.views.generic import CreateView, DetailView, ListView
-from django.shortcuts import get_object_or_404
+from django.shortcuts import get_object_or_404, render
 from django.contrib import messages
 from django.shortcuts import redirect
 from django.urls import reverse
 from django.db.models import Count
-from excel_files.models import ExcelFile, ExcelSheet
-from data_models.services.model_factory import DataModelFactory
+from django.http import Http404, JsonResponse
+from django.views.decorators.http import require_POST
+from excel_files.models import ExcelFile, ExcelSheet, ProcessingJob
+from data_models.models import DataTable
+from data_models.services.purge_service import PurgeService
+from .services.bulk_ingest import BulkIngestService
 from .services.file_manager import ExcelFileManager
-from .services.schema_detector import SchemaDetector
+from .services.job_queue import JobQueue
 
 logger = logging.getLogger(__name__)
 
@@ -22,17 +25,9 @@ class ExcelFileUploadView(CreateView):
     def form_valid(self, form):
         response = super().form_valid(form)
 
-        try:
-            # Procesar las hojas del archivo
-            sheets = ExcelFileManager.read_excel_sheets(self.object.id)
-
-            # Detectar tipos de columnas para cada hoja
-            for sheet in sheets:
-                SchemaDetector.detect_column_types(sheet.id)
-
-            messages.success(self.request, f'Archivo "{self.object.name}" procesado con éxito')
-        except Exception as e:
-            messages.error(self.request, f'Error al procesar el archivo: {str(e)}')
+        # El procesamiento se hace en segundo plano; aquí solo se encola
+        JobQueue.enqueue('process_file', self.object)
+        messages.success(self.request, f'Archivo "{self.object.name}" recibido. Se está procesando en segundo plano')
 
         return response
 
@@ -40,6 +35,123 @@ class ExcelFileUploadView(CreateView):
         return reverse('excel_files:detail', kwargs={'pk': self.object.pk})
 
 
+def _enqueue_bulk_upload(request):
+    """
+    Registra los archivos de una carga masiva y encola su ingesta
+
+    Returns:
+        tuple: (trabajo encolado o None, archivos registrados, nombres rechazados)
+    """
+    storage_backend = request.POST.get('storage_backend') or None
+    if storage_backend and storage_backend not in dict(DataTable.STORAGE_BACKENDS):
+        raise ValueError(f'Backend de almacenamiento no válido: {storage_backend}')
+
+    excel_files, rejected = BulkIngestService.register_files(
+        request.FILES.getlist('files'), description=request.POST.get('description') or None
+    )
+    if not excel_files:
+        return None, excel_files, rejected
+
+    # El trabajo se asocia al primer archivo; la lista completa va en sus opciones
+    job = JobQueue.enqueue('ingest_files', excel_files[0], options={
+        'file_ids': [excel_file.id for excel_file in excel_files],
+        'create_tables': request.POST.get('create_tables') in ('1', 'true', 'on'),
+        'storage_backend': storage_backend,
+    })
+    return job, excel_files, rejected
+
+
+def bulk_upload(request):
+    """Formulario de carga masiva: varios libros o archivos zip de una vez"""
+    if request.method == 'POST':
+        try:
+            job, excel_files, rejected = _enqueue_bulk_upload(request)
+        except ValueError as e:
+            messages.error(request, str(e))
+            return redirect('excel_files:bulk_upload')
+
+        for name in rejected:
+            messages.warning(request, f'"{name}" no es un archivo Excel y se ignoró')
+        if job is None:
+            messages.error(request, 'No se recibió ningún archivo Excel')
+            return redirect('excel_files:bulk_upload')
+
+        messages.success(request, f'{len(excel_files)} archivos recibidos. Se están procesando en segundo plano')
+        return redirect('excel_files:bulk_status', job_id=job.id)
+
+    return render(request, 'excel_files/bulk_upload.html', {'storage_backends': DataTable.STORAGE_BACKENDS})
+
+
+@require_POST
+def bulk_upload_api(request):
+    """
+    Carga masiva en JSON: devuelve el trabajo encolado y la URL para consultar su estado
+
+    Como todos los endpoints JSON que modifican datos, usa la sesión y la
+    protección CSRF de Django: el cliente envía la cookie csrftoken y su valor
+    en la cabecera X-CSRFToken.
+    """
+    try:
+        job, excel_files, rejected = _enqueue_bulk_upload(request)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    if job is None:
+        return JsonResponse({'error': 'No se recibió ningún archivo Excel', 'rejected': rejected}, status=400)
+
+    return JsonResponse({
+        'job_id': job.id,
+        'files': [{'id': excel_file.id, 'name': excel_file.name} for excel_file in excel_files],
+        'rejected': rejected,
+        'status_url': reverse('excel_files:bulk_progress', kwargs={'job_id': job.id}),
+    }, status=202)
+
+
+def _get_bulk_job(job_id):
+    job = get_object_or_404(ProcessingJob, id=job_id, job_type='ingest_files')
+    files = ExcelFile.objects.filter(id__in=job.options.get('file_ids', [])).annotate(
+        sheet_count=Count('sheets')
+    ).order_by('id')
+    return job, files
+
+
+def bulk_status(request, job_id):
+    """Estado de una carga masiva: archivo por archivo y resumen del lote"""
+    job, files = _get_bulk_job(job_id)
+    return render(request, 'excel_files/bulk_status.html', {
+        'job': job,
+        'files': files,
+        'summary': job.options.get('summary'),
+    })
+
+
+def bulk_progress(request, job_id):
+    """Devuelve en JSON el estado de una carga masiva y el de cada uno de sus archivos"""
+    job, files = _get_bulk_job(job_id)
+
+    return JsonResponse({
+        'job_id': job.id,
+        'status': job.status,
+        'status_display': job.get_status_display(),
+        'active': job.is_active,
+        'files_processed': job.rows_processed,
+        'files_total': job.rows_total,
+        'percent': job.get_percent(),
+        'error': job.error,
+        'summary': job.options.get('summary'),
+        'files': [
+            {
+                'id': excel_file.id,
+                'name': excel_file.name,
+                'sheets': excel_file.sheet_count,
+                'processed': excel_file.processed,
+                'error': excel_file.error,
+            }
+            for excel_file in files
+        ],
+    })
+
+
 class ExcelFileDetailView(DetailView):
     """
     Vista para mostrar los detalles de un archivo Excel, sus hojas y permitir
@@ -48,6 +160,7 @@ class ExcelFileDetailView(DetailView):
     model = ExcelFile
     template_name = 'excel_files/detail.html'
     context_object_name = 'excel_file'
+    queryset = ExcelFile.objects.filter(deleted=False)
 
     def get_context_data(self, **kwargs):
         """
@@ -70,6 +183,8 @@ class ExcelFileDetailView(DetailView):
             pass  # Si no existe la relación, ignorar este error
 
         context['sheets'] = sheets
+        context['jobs'] = ProcessingJob.objects.filter(excel_file=excel_file).select_related('sheet')
+        context['storage_backends'] = DataTable.STORAGE_BACKENDS
         return context
 
     def post(self, request, *args, **kwargs):
@@ -86,28 +201,20 @@ class ExcelFileDetailView(DetailView):
             messages.error(request, 'No se especificó una hoja para procesar')
             return redirect('excel_files:detail', pk=excel_file.id)
 
-        try:
-            sheet = get_object_or_404(ExcelSheet, id=sheet_id, excel_file=excel_file)
-
-            logger.info(f"Iniciando creación de tabla para hoja {sheet.id}: {sheet.name}")
+        sheet = get_object_or_404(ExcelSheet, id=sheet_id, excel_file=excel_file)
 
-            data_table = DataModelFactory.create_data_table_from_sheet(sheet.id)
+        # Backend de almacenamiento elegido para esta tabla (vacío = el configurado por defecto)
+        options = {}
+        storage_backend = request.POST.get('storage_backend')
+        if storage_backend:
+            if storage_backend not in dict(DataTable.STORAGE_BACKENDS):
+                messages.error(request, f'Backend de almacenamiento no válido: {storage_backend}')
+                return redirect('excel_files:detail', pk=excel_file.id)
+            options['storage_backend'] = storage_backend
 
-            if data_table:
-                logger.info(f"Tabla creada exitosamente: {data_table.table_name} con {data_table.row_count} filas")
-
-                messages.success(
-                    request,
-                    f'Hoja "{sheet.name}" procesada exitosamente. '
-                    f'Se generaron {data_table.row_count} filas de datos.'
-                )
-            else:
-                logger.error(f"No se pudo crear la tabla de datos para la hoja {sheet.id}")
-                messages.error(request, 'Error al procesar la hoja: no se pudo crear la tabla de datos')
-        except Exception as e:
-            logger.error(f"Error al procesar la hoja {sheet_id}: {str(e)}")
-            logger.error(traceback.format_exc())
-            messages.error(request, f'Error al procesar la hoja: {str(e)}')
+        logger.info(f"Encolando creación de tabla para hoja {sheet.id}: {sheet.name}")
+        JobQueue.enqueue('create_table', excel_file, sheet=sheet, options=options)
+        messages.success(request, f'Hoja "{sheet.name}" en cola de procesamiento')
 
         return redirect('excel_files:detail', pk=excel_file.id)
 
@@ -129,7 +236,7 @@ class ExcelFileListView(ListView):
         - Número de hojas por archivo
         - Estado de procesamiento
         """
-        queryset = super().get_queryset()
+        queryset = super().get_queryset().filter(deleted=False)
         # Añadir el conteo de hojas como anotación
         return queryset.annotate(sheet_count=Count('sheets'))
 
@@ -145,9 +252,10 @@ class ExcelFileListView(ListView):
         context['filter_processed'] = self.request.GET.get('processed', '')
 
         # Añadir estadísticas generales
-        context['total_files'] = ExcelFile.objects.count()
-        context['processed_files'] = ExcelFile.objects.filter(processed=True).count()
-        context['pending_files'] = ExcelFile.objects.filter(processed=False).count()
+        files = ExcelFile.objects.filter(deleted=False)
+        context['total_files'] = files.count()
+        context['processed_files'] = files.filter(processed=True).count()
+        context['pending_files'] = files.filter(processed=False).count()
 
         return context
 
@@ -163,34 +271,22 @@ class ExcelFileListView(ListView):
             return redirect('excel_files:list')
 
         try:
-            excel_file = ExcelFile.objects.get(id=file_id)
+            excel_file = ExcelFile.objects.get(id=file_id, deleted=False)
 
             if action == 'delete':
-                # Eliminar el archivo
-                file_name = excel_file.name
-                excel_file.delete()
-                messages.success(request, f'Archivo "{file_name}" eliminado correctamente')
+                # El archivo se oculta ya y sus datos se eliminan en segundo plano
+                PurgeService.schedule_file_purge(excel_file)
+                messages.success(request, f'Archivo "{excel_file.name}" eliminado correctamente')
 
             elif action == 'process_sheets':
-                # Procesar las hojas del archivo que no estén procesadas
-                sheets = ExcelSheet.objects.filter(excel_file=excel_file, processed=False)
-                for sheet in sheets:
-                    try:
-                        # Este método debería estar en tus servicios
-                        from excel_files.services.schema_detector import SchemaDetector
-                        SchemaDetector.detect_column_types(sheet.id)
-                        sheet.processed = True
-                        sheet.save()
-                    except Exception as e:
-                        messages.error(request, f'Error al procesar la hoja {sheet.name}: {str(e)}')
-
-                # Verificar si todas las hojas están procesadas
-                if not ExcelSheet.objects.filter(excel_file=excel_file, processed=False).exists():
-                    excel_file.processed = True
-                    excel_file.save()
-                    messages.success(request, f'Todas las hojas del archivo "{excel_file.name}" fueron procesadas')
-                else:
-                    messages.warning(request, f'Algunas hojas no pudieron ser procesadas')
+                # Detectar las columnas de las hojas no procesadas en segundo plano
+                JobQueue.enqueue('detect_sheets', excel_file)
+                messages.success(request, f'Hojas del archivo "{excel_file.name}" en cola de procesamiento')
+
+            elif action == 'create_tables':
+                # Crear las tablas de todas las hojas en paralelo en segundo plano
+                JobQueue.enqueue('create_tables', excel_file)
+                messages.success(request, f'Tablas del archivo "{excel_file.name}" en cola de creación')
 
             elif action == 'refresh_sheets':
                 # Volver a detectar las hojas del archivo
@@ -206,4 +302,92 @@ class ExcelFileListView(ListView):
             messages.error(request, f'Error al procesar la solicitud: {str(e)}')
 
         # Redirigir de vuelta a la lista
-        return redirect('excel_files:list')
\ No newline at end of file
+        return redirect('excel_files:list')
+
+
+def file_progress(request, pk):
+    """
+    Devuelve en JSON el estado de los trabajos de un archivo, para que la
+    página de detalle consulte el progreso periódicamente.
+
+    Cuando el archivo ya se eliminó se devuelve el estado final de su trabajo
+    de borrado.
+    """
+    excel_file = ExcelFile.objects.filter(pk=pk).first()
+    if excel_file is None:
+        job = ProcessingJob.objects.filter(job_type='purge_file', options__file_id=pk).order_by('-id').first()
+        if job is None:
+            raise Http404('Archivo no encontrado')
+        return JsonResponse({
+            'file_id': pk,
+            'deleted': True,
+            'processed': False,
+            'error': job.error,
+            'active': job.is_active,
+            'jobs': [_job_to_dict(job)],
+        })
+
+    jobs = ProcessingJob.objects.filter(excel_file=excel_file).select_related('sheet')
+
+    return JsonResponse({
+        'file_id': excel_file.id,
+        'deleted': excel_file.deleted,
+        'processed': excel_file.processed,
+        'error': excel_file.error,
+        'active': any(job.is_active for job in jobs),
+        'jobs': [_job_to_dict(job) for job in jobs],
+    })
+
+
+def _job_to_dict(job):
+    return {
+        'id': job.id,
+        'type': job.job_type,
+        'type_display': job.get_job_type_display(),
+        'sheet': job.sheet.name if job.sheet else None,
+        'status': job.status,
+        'status_display': job.get_status_display(),
+        'stage': job.stage,
+        'rows_processed': job.rows_processed,
+        'rows_total': job.rows_total,
+        'percent': job.get_percent(),
+        'attempts': job.attempts,
+        'max_attempts': job.max_attempts,
+        'error': job.error,
+    }
+
+
+@require_POST
+def replace_file(request, pk):
+    """Sube una nueva versión de un archivo y encola la recarga incremental de sus tablas"""
+    excel_file = get_object_or_404(ExcelFile, pk=pk, deleted=False)
+    # Una recarga volvería a crear las tablas que el borrado está eliminando
+    if ProcessingJob.objects.filter(excel_file=excel_file, job_type='purge_file',
+                                    status__in=ProcessingJob.ACTIVE_STATUSES).exists():
+        messages.error(request, f'"{excel_file.name}" se está eliminando')
+        return redirect('excel_files:list')
+
+    file_obj = request.FILES.get('file')
+    if not file_obj:
+        messages.error(request, 'No se recibió ningún archivo')
+        return redirect('excel_files:detail', pk=excel_file.id)
+
+    ExcelFileManager.replace_file(excel_file, file_obj)
+    JobQueue.enqueue('refresh_file', excel_file)
+    messages.success(request, f'Nueva versión de "{excel_file.name}" recibida. Se están actualizando sus tablas')
+    return redirect('excel_files:detail', pk=excel_file.id)
+
+
+@require_POST
+def cancel_job(request, job_id):
+    """Solicita la cancelación de un trabajo en cola o en ejecución"""
+    job = get_object_or_404(ProcessingJob, id=job_id)
+
+    if JobQueue.cancel(job.id):
+        messages.success(request, 'Se solicitó la cancelación del trabajo')
+    else:
+        messages.warning(request, 'El trabajo ya había terminado')
+
+    if job.excel_file_id is None:
+        return redirect('excel_files:list')
+    return redirect('excel_files:detail', pk=job.excel_file_id)
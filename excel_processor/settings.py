@@ -82,6 +82,17 @@ DATABASES = {
     }
 }
 
+# PRAGMAs de cada conexión SQLite, aplicados al abrirla (data_models.signals).
+# WAL permite leer mientras el worker escribe y, con synchronous=NORMAL, solo
+# sincroniza el disco en los checkpoints; cache_size negativo va en KiB.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -64000,
+    'mmap_size': 256 * 1024 ** 2,
+    'temp_store': 'MEMORY',
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -124,6 +135,62 @@ STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Las subidas calculan el hash de su contenido mientras se reciben
+FILE_UPLOAD_HANDLERS = [
+    'excel_files.uploads.HashingMemoryFileUploadHandler',
+    'excel_files.uploads.HashingTemporaryFileUploadHandler',
+]
+
+# Caché de hojas parseadas (Parquet) y tamaño máximo antes de desalojar por LRU
+SHEET_CACHE_DIR = os.path.join(MEDIA_ROOT, 'cache', 'sheets')
+SHEET_CACHE_MAX_BYTES = 2 * 1024 ** 3
+# Segundos sin escrituras tras los que un libro sin manifiesto (a medio parsear) se
+# considera abandonado y se puede desalojar; antes no se toca
+SHEET_CACHE_PARTIAL_GRACE = 3600
+
+# Filas por bloque al leer hojas en streaming con openpyxl (read_only)
+SHEET_READER_CHUNK_SIZE = 10000
+
+# Detección de esquema: por defecto sobre una muestra de la hoja; con True el
+# trabajo en segundo plano recorre todas las filas para confirmar los tipos
+SCHEMA_DETECTION_FULL_SCAN = False
+
+# Cola de trabajos en segundo plano (python manage.py run_worker)
+JOB_MAX_ATTEMPTS = 3
+JOB_RETRY_DELAY = 30  # segundos, se duplica en cada reintento
+JOB_STALE_TIMEOUT = 600  # segundos sin progreso antes de devolver un trabajo a la cola
+
+# Almacenamiento de las tablas de datos: 'eav' (DataRow/DataCell), 'parquet' o 'sql' (tabla tipada)
+DATA_TABLE_STORAGE_BACKEND = 'eav'
+DATA_TABLE_PARQUET_DIR = os.path.join(MEDIA_ROOT, 'tables')
+DATA_TABLE_PARQUET_ROW_GROUP_SIZE = 50000
+DATA_TABLE_PARQUET_PART_ROWS = 1000000
+# Columnas de texto con diccionario en el EAV: las que en el primer lote tienen como
+# mucho esta proporción de valores distintos (0 desactiva los diccionarios)
+DATA_TABLE_DICTIONARY_MAX_RATIO = 0.5
+
+# Procesos para convertir hojas en paralelo al crear las tablas de un libro
+# (None: tantos como núcleos). Las escrituras en la base de datos las hace un solo proceso.
+INGEST_WORKERS = None
+
+# Exportaciones: filas por lote leído del almacenamiento y por grupo de filas Parquet
+EXPORT_BATCH_SIZE = 10000
+EXPORT_PARQUET_ROW_GROUP_SIZE = 50000
+
+# API de consulta: filas por defecto y máximas de un resultado
+QUERY_DEFAULT_ROWS = 1000
+QUERY_MAX_ROWS = 10000
+# Tablas con al menos estas filas reciben índices de valores en las columnas
+# que filtra u ordena la API de consulta
+QUERY_INDEX_MIN_ROWS = 10000
+
+# Perfiles de columnas: filas por zona del mapa de zonas (mínimo y máximo por bloque)
+PROFILE_ZONE_ROWS = 10000
+
+# Búsqueda de texto (SQLite FTS5): filas por defecto y máximas de un resultado
+SEARCH_DEFAULT_ROWS = 100
+SEARCH_MAX_ROWS = 1000
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 